@@ -0,0 +1,12 @@
+#!/bin/sh
+# Entrada do container de produção: migrações (opcional), estáticos e gunicorn
+set -e
+
+export DJANGO_SETTINGS_MODULE="${DJANGO_SETTINGS_MODULE:-pixstream.settings_production}"
+
+if [ "${PIX_MIGRATE_ON_START:-1}" = "1" ]; then
+    python manage.py migrate --noinput
+fi
+python manage.py collectstatic --noinput --verbosity 0
+
+exec gunicorn --config gunicorn.conf.py
@@ -0,0 +1,42 @@
+"""
+Configuração do gunicorn (produção).
+
+``PIX_SERVER_MODE`` escolhe a pilha:
+
+- ``wsgi`` (padrão): workers ``gthread``. Cada long polling parado ocupa uma
+  thread, então ``GUNICORN_THREADS`` limita os coletores parados por worker.
+- ``asgi``: workers do uvicorn com ``pixstream.asgi``. Long pollings parados
+  esperam no event loop e o banco é acessado pelo pool de
+  ``PIX_STREAM_ASYNC_DB_WORKERS`` threads.
+
+O ``timeout`` precisa cobrir o long polling e a janela das respostas
+contínuas (``PIX_STREAM_WINDOW``).
+"""
+import multiprocessing
+import os
+
+mode = os.environ.get("PIX_SERVER_MODE", "wsgi")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+
+if mode == "asgi":
+    wsgi_app = "pixstream.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+elif mode == "wsgi":
+    wsgi_app = "pixstream.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+else:
+    raise RuntimeError(f"PIX_SERVER_MODE inválido: {mode} (use wsgi ou asgi)")
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "90"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "40"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "75"))
+
+# Recicla workers aos poucos (vazamentos de memória), sem reiniciar todos juntos
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "20000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
@@ -12,5 +12,11 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pixstream.settings')
+os.environ.setdefault('PIX_STREAM_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# Rotas /api/pix/ passam pelo perfil enxuto de middlewares
+from streaming.handlers import asgi_application  # noqa: E402
+
+application = asgi_application(application)
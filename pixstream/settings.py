@@ -41,7 +41,14 @@ INSTALLED_APPS = [
     'streaming', 
 ]
 
+# Workers só de API podem desligar o admin (0), que deixa de ser carregado na
+# inicialização e de ter rotas
+PIX_ADMIN_ENABLED = os.environ.get("PIX_ADMIN_ENABLED", "1") == "1"
+if not PIX_ADMIN_ENABLED:
+    INSTALLED_APPS.remove('django.contrib.admin')
+
 MIDDLEWARE = [
+    'streaming.middleware.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +89,9 @@ DATABASES = {
         'PASSWORD': os.environ.get("DB_PASSWORD", "postgres"),
         'HOST': os.environ.get("DB_HOST", "db"),
         'PORT': os.environ.get("DB_PORT", "5432"),
+        # Conexões persistentes: 0 abre uma conexão nova a cada requisição
+        'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", "0")),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -126,3 +136,122 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Pix streaming
+
+# Validade (em segundos) de um interactionId sem uso
+PIX_STREAM_CURSOR_TTL = int(os.environ.get("PIX_STREAM_CURSOR_TTL", "300"))
+
+# Tempo máximo (em segundos) que um pull vazio aguarda por novas mensagens
+PIX_STREAM_LONG_POLL_TIMEOUT = float(os.environ.get("PIX_STREAM_LONG_POLL_TIMEOUT", "8"))
+
+# Coletores (sessões de stream) ativos simultâneos por ISPB
+PIX_STREAM_MAX_SESSIONS = int(os.environ.get("PIX_STREAM_MAX_SESSIONS", "6"))
+
+# Sessões sem pull há mais que este tempo (em segundos) são encerradas pelo
+# reaper, que roda no processo a cada PIX_STREAM_REAPER_INTERVAL segundos
+# (0 desliga; o comando reap_sessions faz o mesmo sob demanda)
+PIX_STREAM_SESSION_IDLE_TIMEOUT = int(os.environ.get("PIX_STREAM_SESSION_IDLE_TIMEOUT", "300"))
+PIX_STREAM_REAPER_INTERVAL = float(os.environ.get("PIX_STREAM_REAPER_INTERVAL", "60"))
+
+# Prazo (em segundos) para o coletor confirmar um lote seguindo o Pull-Next
+# (ou com DELETE); depois disso as mensagens voltam para a fila. Deve ser
+# maior que PIX_STREAM_WINDOW
+PIX_STREAM_VISIBILITY_TIMEOUT = int(os.environ.get("PIX_STREAM_VISIBILITY_TIMEOUT", "60"))
+
+# Tamanho do lote de multipart/json: padrão e máximo aceito do cliente
+# (``?batch=N`` ou ``Accept: multipart/json; batch=N``). ``batch=adaptive``
+# ajusta o lote de cada stream entre 1 e o máximo conforme o backlog
+PIX_STREAM_BATCH_SIZE = int(os.environ.get("PIX_STREAM_BATCH_SIZE", "10"))
+PIX_STREAM_MAX_BATCH_SIZE = int(os.environ.get("PIX_STREAM_MAX_BATCH_SIZE", "500"))
+
+# Respostas contínuas (application/x-ndjson, multipart/mixed): tempo máximo
+# (em segundos) que a conexão fica aberta e mensagens entregues por janela
+PIX_STREAM_WINDOW = float(os.environ.get("PIX_STREAM_WINDOW", "30"))
+PIX_STREAM_WINDOW_MAX_MESSAGES = int(os.environ.get("PIX_STREAM_WINDOW_MAX_MESSAGES", "10000"))
+
+# Classe que publica/aguarda avisos de novas mensagens por ISPB. Vazio escolhe
+# pelo banco: PostgresNotifier (LISTEN/NOTIFY) ou LocalNotifier (em memória)
+PIX_STREAM_NOTIFIER = os.environ.get("PIX_STREAM_NOTIFIER", "")
+
+# Backend de fila (streaming/queues.py): vazio varre a fila no banco;
+# streaming.queues.RedisQueue usa listas de ids prontos por ISPB no Redis
+# (PIX_STREAM_QUEUE_REDIS_URL; fakeredis:// usa um servidor em memória)
+PIX_STREAM_QUEUE = os.environ.get("PIX_STREAM_QUEUE", "")
+PIX_STREAM_QUEUE_REDIS_URL = os.environ.get("PIX_STREAM_QUEUE_REDIS_URL", "redis://localhost:6379/0")
+PIX_STREAM_QUEUE_REDIS_PREFIX = os.environ.get("PIX_STREAM_QUEUE_REDIS_PREFIX", "pix:ready:")
+
+# Escalonador (streaming/scheduler.py). Prioridade: valores a partir de
+# PIX_STREAM_PRIORITY_MIN_VALOR (vazio desliga) e pagamentos feitos há mais de
+# PIX_STREAM_PRIORITY_MIN_AGE segundos no momento do pull (0 desliga)
+PIX_STREAM_PRIORITY_MIN_VALOR = os.environ.get("PIX_STREAM_PRIORITY_MIN_VALOR", "")
+PIX_STREAM_PRIORITY_MIN_AGE = int(os.environ.get("PIX_STREAM_PRIORITY_MIN_AGE", "0"))
+
+# Divisão justa do lote entre os coletores do ISPB, pelo peso de cada sessão
+# (?weight= no start, de 1 a PIX_STREAM_MAX_WEIGHT)
+PIX_STREAM_FAIR_SHARE = os.environ.get("PIX_STREAM_FAIR_SHARE", "0") == "1"
+PIX_STREAM_MAX_WEIGHT = int(os.environ.get("PIX_STREAM_MAX_WEIGHT", "10"))
+
+# Limite de mensagens por segundo por ISPB em cada processo (0 desliga) e
+# rajada máxima (0 usa a própria taxa)
+PIX_STREAM_ISPB_RATE = float(os.environ.get("PIX_STREAM_ISPB_RATE", "0"))
+PIX_STREAM_ISPB_BURST = int(os.environ.get("PIX_STREAM_ISPB_BURST", "0"))
+
+# Cache em memória das mensagens recém-inseridas (streaming/hotcache.py):
+# limite total por processo em bytes (0 desliga) e limite por ISPB (0 usa o total)
+PIX_STREAM_HOT_CACHE_BYTES = int(os.environ.get("PIX_STREAM_HOT_CACHE_BYTES", "0"))
+PIX_STREAM_HOT_CACHE_ISPB_BYTES = int(os.environ.get("PIX_STREAM_HOT_CACHE_ISPB_BYTES", "0"))
+
+# multipart/json: por padrão, os bytes de sempre (json.dumps, com espaços e
+# escapes \uXXXX); 1 junta os payloads gravados em um array compacto em UTF-8
+PIX_STREAM_COMPACT_BATCH_JSON = os.environ.get("PIX_STREAM_COMPACT_BATCH_JSON", "0") == "1"
+
+# Compressão das respostas de stream (streaming/compression.py): codificações
+# em ordem de preferência (vazio desliga; zstd e br só com o pacote instalado)
+# e tamanho mínimo do corpo para comprimir
+PIX_STREAM_COMPRESSION = os.environ.get("PIX_STREAM_COMPRESSION", "zstd,br,gzip")
+PIX_STREAM_COMPRESSION_MIN_BYTES = int(os.environ.get("PIX_STREAM_COMPRESSION_MIN_BYTES", "1024"))
+
+# Endpoints de stream assíncronos (ASGI). Ligado por padrão em pixstream/asgi.py
+PIX_STREAM_ASYNC_VIEWS = os.environ.get("PIX_STREAM_ASYNC_VIEWS", "0") == "1"
+
+# Threads (e conexões) do pool de banco usado pelas views assíncronas
+PIX_STREAM_ASYNC_DB_WORKERS = int(os.environ.get("PIX_STREAM_ASYNC_DB_WORKERS", "16"))
+
+# Perfil enxuto (streaming/handlers.py): requisições com este prefixo passam só
+# por PIX_API_MIDDLEWARE e pela URLconf streaming.api_urls. Vazio desliga
+PIX_API_PREFIX = os.environ.get("PIX_API_PREFIX", "/api/pix/")
+PIX_API_MIDDLEWARE = [
+    'streaming.middleware.QueryCountMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+]
+
+# Comandos SQL por requisição (streaming/middleware.py): cabeçalhos
+# X-DB-Queries/X-DB-Time-Ms e orçamento por endpoint ("rota:MÉTODO"). Acima do
+# orçamento há um aviso no log; com PIX_DB_QUERY_BUDGET_ENFORCE (testes), erro
+PIX_DB_DEBUG_HEADERS = os.environ.get("PIX_DB_DEBUG_HEADERS", "1" if DEBUG else "0") == "1"
+# Medido (SQLite, com mensagens e com long polling vazio): start 6 e 6,
+# continue 5 e 6, delete 4. Orçamento: medido + 1. A primeira sessão de um
+# ISPB cria o contador de admissão e passa do orçamento uma vez
+PIX_DB_QUERY_BUDGETS = {
+    "pix_stream_start:GET": 7,
+    "pix_stream_continue_delete:GET": 6,
+    "pix_stream_continue_delete:DELETE": 5,
+}
+PIX_DB_QUERY_BUDGET_ENFORCE = os.environ.get("PIX_DB_QUERY_BUDGET_ENFORCE", "0") == "1"
+
+# Ingestão em massa (POST /api/pix/messages): tamanho máximo do corpo e
+# mensagens validadas por lote de INSERT
+PIX_INGEST_MAX_BYTES = int(os.environ.get("PIX_INGEST_MAX_BYTES", str(64 * 1024 * 1024)))
+PIX_INGEST_CHUNK_SIZE = int(os.environ.get("PIX_INGEST_CHUNK_SIZE", "1000"))
+
+# Arquivamento: mensagens confirmadas há mais de PIX_ARCHIVE_AFTER_HOURS horas
+# são movidas para a tabela de arquivo em lotes de PIX_ARCHIVE_BATCH_SIZE
+PIX_ARCHIVE_AFTER_HOURS = float(os.environ.get("PIX_ARCHIVE_AFTER_HOURS", "24"))
+PIX_ARCHIVE_BATCH_SIZE = int(os.environ.get("PIX_ARCHIVE_BATCH_SIZE", "5000"))
+
+# Geração de mensagens de teste: tamanho do lote do bulk_create e quantidade
+# máxima gerada dentro da requisição (acima disso vira job em background)
+PIX_GENERATE_CHUNK_SIZE = int(os.environ.get("PIX_GENERATE_CHUNK_SIZE", "5000"))
+PIX_GENERATE_SYNC_LIMIT = int(os.environ.get("PIX_GENERATE_SYNC_LIMIT", "10000"))
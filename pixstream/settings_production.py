@@ -0,0 +1,53 @@
+"""
+Settings de produção (gunicorn/uvicorn, ver gunicorn.conf.py e entrypoint.sh).
+
+Parte de ``pixstream.settings`` e desliga o que só serve ao desenvolvimento:
+``DEBUG`` (que guarda cada comando SQL em memória) e os cabeçalhos de
+contagem de comandos. As conexões com o banco são persistentes
+(``CONN_MAX_AGE``) e verificadas antes de reusadas (``CONN_HEALTH_CHECKS``).
+
+Cada worker mantém até uma conexão por thread (WSGI) ou por thread do pool de
+banco (ASGI, ``PIX_STREAM_ASYNC_DB_WORKERS``), mais a conexão ``LISTEN`` do
+notificador. O total deve ficar abaixo do ``max_connections`` do PostgreSQL.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", "")
+if not SECRET_KEY:
+    raise ImproperlyConfigured("DJANGO_SECRET_KEY é obrigatória em produção")
+
+ALLOWED_HOSTS = [host for host in os.environ.get("DJANGO_ALLOWED_HOSTS", "localhost,127.0.0.1").split(",") if host]
+
+DATABASES = {
+    **DATABASES,
+    "default": {**DATABASES["default"], "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "600"))},
+}
+
+STATIC_ROOT = os.environ.get("DJANGO_STATIC_ROOT", "/app/staticfiles")
+
+# Atrás de um proxy que termina o TLS
+if os.environ.get("DJANGO_BEHIND_TLS_PROXY", "0") == "1":
+    SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
+    SESSION_COOKIE_SECURE = True
+    CSRF_COOKIE_SECURE = True
+
+PIX_DB_DEBUG_HEADERS = os.environ.get("PIX_DB_DEBUG_HEADERS", "0") == "1"
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(process)d %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain"},
+    },
+    "root": {"handlers": ["console"], "level": os.environ.get("DJANGO_LOG_LEVEL", "INFO")},
+}
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pixstream.settings')
 
 application = get_wsgi_application()
+
+# Rotas /api/pix/ passam pelo perfil enxuto de middlewares
+from streaming.handlers import wsgi_application  # noqa: E402
+
+application = wsgi_application(application)
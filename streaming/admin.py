@@ -1,6 +1,9 @@
 from django.contrib import admin
-from .models import PixMessage, StreamSession
+from .models import GenerationJob, IspbStreamCounter, PixMessage, PixMessageArchive, StreamSession
 
 admin.site.register(PixMessage)
+admin.site.register(PixMessageArchive)
 admin.site.register(StreamSession)
+admin.site.register(GenerationJob)
 
+admin.site.register(IspbStreamCounter)
@@ -0,0 +1,63 @@
+"""
+Admissão de sessões de stream por ISPB.
+
+O limite de coletores simultâneos (``PIX_STREAM_MAX_SESSIONS``, padrão 6) é
+garantido por uma linha contadora por ISPB (``IspbStreamCounter``): a vaga é
+reservada com um único ``UPDATE ... SET active_sessions = active_sessions + 1
+WHERE ispb = %s AND active_sessions < limite``. No PostgreSQL o UPDATE trava a
+linha e reavalia a condição depois da espera, então dois starts simultâneos
+nunca passam do limite; no SQLite a escrita já é serializada pelo banco.
+
+A reserva e a criação da sessão acontecem na mesma transação
+(``cursors.open_cursor``) e a vaga é devolvida quando a sessão é encerrada.
+O contador nasce sob demanda a partir do COUNT das sessões ativas e pode ser
+recalculado com ``recount_sessions``.
+"""
+from django.conf import settings
+from django.db.models import F
+
+from .models import IspbStreamCounter, StreamSession
+
+
+def _active_count(ispb):
+    return StreamSession.objects.filter(ispb=ispb, active=True).count()
+
+
+def _ensure_counter(ispb):
+    """Cria a linha contadora do ISPB (se ainda não existir) com o total atual"""
+    IspbStreamCounter.objects.bulk_create(
+        [IspbStreamCounter(ispb=ispb, active_sessions=_active_count(ispb))],
+        ignore_conflicts=True,
+    )
+
+
+def reserve_slot(ispb):
+    """Reserva uma vaga de sessão para o ISPB. Retorna se havia vaga"""
+    reserved = IspbStreamCounter.objects.filter(
+        ispb=ispb,
+        active_sessions__lt=settings.PIX_STREAM_MAX_SESSIONS,
+    ).update(active_sessions=F("active_sessions") + 1)
+    if reserved:
+        return True
+    if IspbStreamCounter.objects.filter(ispb=ispb).exists():
+        return False
+    # Primeiro start do ISPB: criar o contador e tentar de novo
+    _ensure_counter(ispb)
+    return reserve_slot(ispb)
+
+
+def release_slot(ispb):
+    """Devolve a vaga de uma sessão encerrada"""
+    IspbStreamCounter.objects.filter(ispb=ispb, active_sessions__gt=0).update(
+        active_sessions=F("active_sessions") - 1
+    )
+
+
+def recount_sessions(ispb=None):
+    """Recalcula os contadores a partir das sessões ativas (todos ou de um ISPB)"""
+    counters = IspbStreamCounter.objects.all()
+    if ispb is not None:
+        _ensure_counter(ispb)
+        counters = counters.filter(ispb=ispb)
+    for counter in counters:
+        IspbStreamCounter.objects.filter(pk=counter.pk).update(active_sessions=_active_count(counter.ispb))
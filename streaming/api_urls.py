@@ -0,0 +1,13 @@
+"""
+URLconf do perfil enxuto (streaming/handlers.py): só as rotas de PIX_API_PREFIX
+
+Evita carregar as rotas do admin e dos utilitários nos workers que servem a
+API de stream.
+"""
+from django.conf import settings
+
+from .urls import urlpatterns as _all_urlpatterns
+
+_prefix = settings.PIX_API_PREFIX.lstrip("/")
+
+urlpatterns = [pattern for pattern in _all_urlpatterns if str(pattern.pattern).startswith(_prefix)]
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class StreamingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'streaming'
+
+    def ready(self):
+        # Instala o contador de comandos SQL em cada conexão criada e registra
+        # a publicação de mensagens criadas pelo ORM no backend de fila
+        from . import middleware, queues  # noqa: F401
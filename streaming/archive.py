@@ -0,0 +1,137 @@
+"""
+Arquivamento de mensagens entregues.
+
+Mensagens confirmadas (``claimed_by_stream`` preenchido e fora de voo) não
+voltam mais para a fila, mas continuavam na tabela quente para sempre. Em
+lotes, as confirmadas há mais de ``PIX_ARCHIVE_AFTER_HOURS`` horas (pelo
+``acked_at`` gravado na confirmação) são movidas para ``PixMessageArchive``:
+
+- PostgreSQL: um único comando por lote, ``WITH moved AS (DELETE ...
+  RETURNING ...) INSERT INTO arquivo SELECT ... FROM moved``, pulando linhas
+  travadas (SKIP LOCKED).
+- Demais bancos: ``INSERT ... SELECT`` e ``DELETE`` dos mesmos ids na mesma
+  transação.
+
+Sessões encerradas que não têm mais mensagens na tabela quente também podem
+ser removidas (``prune_sessions``).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils.timezone import now
+
+from .models import PixMessage, PixMessageArchive, StreamSession
+
+# Colunas copiadas (tabela quente -> arquivo); o estado de entrega não é copiado
+_SKIPPED_FIELDS = {"claimed", "claimed_by_stream", "visible_at", "acked_at", "priority", "payload"}
+
+
+def _column_pairs():
+    pairs = [
+        (field.column, PixMessageArchive._meta.get_field(field.name).column)
+        for field in PixMessage._meta.concrete_fields
+        if field.name not in _SKIPPED_FIELDS
+    ]
+    pairs.append((
+        PixMessage._meta.get_field("claimed_by_stream").column,
+        PixMessageArchive._meta.get_field("stream_session_id").column,
+    ))
+    return pairs
+
+
+def _tables_and_columns():
+    qn = connection.ops.quote_name
+    pairs = _column_pairs()
+    return (
+        qn(PixMessage._meta.db_table),
+        qn(PixMessageArchive._meta.db_table),
+        ", ".join(qn(source) for source, _ in pairs),
+        ", ".join(qn(target) for _, target in pairs) + ", " + qn("archived_at"),
+    )
+
+
+def _eligible_sql(hot):
+    """
+    Ids de um lote de mensagens confirmadas antes do limite
+
+    Percorre o índice parcial ``pixmsg_acked_archive_idx`` em ordem de
+    ``acked_at`` e para no LIMIT, sem varrer a fila nem as mensagens em voo.
+    """
+    return (
+        f"SELECT id FROM {hot}"
+        f" WHERE claimed_by_stream_id IS NOT NULL AND visible_at IS NULL AND acked_at < %s"
+        f" ORDER BY acked_at LIMIT %s"
+    )
+
+
+def _move_sql():
+    """Comando único do PostgreSQL: DELETE ... RETURNING alimentando o INSERT"""
+    hot, archive, source, target = _tables_and_columns()
+    return f"""
+        WITH moved AS (
+            DELETE FROM {hot}
+             WHERE id IN ({_eligible_sql(hot)} FOR UPDATE SKIP LOCKED)
+         RETURNING {source})
+        INSERT INTO {archive} ({target})
+        SELECT {source}, %s FROM moved
+    """
+
+
+def archive_batch(cutoff, batch_size):
+    """Move um lote de mensagens confirmadas antes de `cutoff`. Retorna quantas"""
+    archived_at = connection.ops.adapt_datetimefield_value(now())
+    cutoff = connection.ops.adapt_datetimefield_value(cutoff)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(_move_sql(), [cutoff, batch_size, archived_at])
+            return cursor.rowcount
+
+        hot, archive, source, target = _tables_and_columns()
+        cursor.execute(_eligible_sql(hot), [cutoff, batch_size])
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"INSERT INTO {archive} ({target}) SELECT {source}, %s FROM {hot} WHERE id IN ({placeholders})",
+            [archived_at, *ids],
+        )
+        cursor.execute(f"DELETE FROM {hot} WHERE id IN ({placeholders})", ids)
+        return len(ids)
+
+
+def archive_messages(older_than_hours=None, batch_size=None):
+    """
+    Move todas as mensagens confirmadas há mais que o limite, em lotes
+
+    Returns:
+        Quantidade de mensagens arquivadas
+    """
+    if older_than_hours is None:
+        older_than_hours = settings.PIX_ARCHIVE_AFTER_HOURS
+    if batch_size is None:
+        batch_size = settings.PIX_ARCHIVE_BATCH_SIZE
+    cutoff = now() - timedelta(hours=older_than_hours)
+
+    total = 0
+    while True:
+        moved = archive_batch(cutoff, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+def prune_sessions(older_than_hours=None):
+    """Remove sessões encerradas há mais que o limite e sem mensagens na tabela quente"""
+    if older_than_hours is None:
+        older_than_hours = settings.PIX_ARCHIVE_AFTER_HOURS
+    cutoff = now() - timedelta(hours=older_than_hours)
+    deleted, _ = (
+        StreamSession.objects.filter(active=False, created_at__lt=cutoff)
+        .exclude(last_pull_at__gte=cutoff)
+        .exclude(Exists(PixMessage.objects.filter(claimed_by_stream=OuterRef("pk"))))
+        .delete()
+    )
+    return deleted
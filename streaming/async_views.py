@@ -0,0 +1,176 @@
+"""
+Versões assíncronas (ASGI) dos endpoints de stream.
+
+Um long polling parado aguarda o aviso de novas mensagens no event loop
+(``asyncio``), sem ocupar thread. O trabalho de banco roda em um pool fixo de
+threads (``PIX_STREAM_ASYNC_DB_WORKERS``), cada uma com sua conexão
+persistente, então o número de coletores parados deixa de depender do número
+de threads e de conexões.
+
+As regras (limite de sessões, cursor do Pull-Next, formato das respostas) são
+as mesmas das views síncronas em ``views.py``: os passos de cada pull ficam em
+``pulls.py`` e aqui só a espera entre eles.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.renderers import JSONRenderer
+
+from . import pulls
+from .batching import InvalidBatchSize
+from .compression import compress_response
+from .cursors import StaleCursor, close_cursor, open_cursor, resolve_cursor, rotate_cursor
+from .negotiation import CachedContentNegotiation
+from .notify import get_notifier
+from .pulls import LongPoll, StreamWindow, negotiated_batch, stream_response
+from .reaper import ensure_reaper_started
+from .renderers import STREAM_RENDERER_CLASSES, StreamingRenderer
+from .scheduler import InvalidWeight, parse_weight
+
+logger = logging.getLogger(__name__)
+
+_db_executor = ThreadPoolExecutor(
+    max_workers=settings.PIX_STREAM_ASYNC_DB_WORKERS,
+    thread_name_prefix="pix-db",
+)
+
+
+def _in_db_thread(func, *args):
+    # As threads do pool vivem fora do ciclo de request: respeitar CONN_MAX_AGE
+    close_old_connections()
+    return func(*args)
+
+
+async def run_db(func, *args):
+    """Executa uma função síncrona de banco no pool de threads do ORM"""
+    loop = asyncio.get_running_loop()
+    # O contexto acompanha a chamada (contagem de comandos SQL da requisição)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_db_executor, functools.partial(context.run, _in_db_thread, func, *args))
+
+
+def _json_response(data, status):
+    return HttpResponse(JSONRenderer().render(data), content_type="application/json", status=status)
+
+
+def _negotiate(request):
+    """
+    Mesma negociação de conteúdo do DRF usada por PixStreamBaseView
+
+    Retorna o renderer escolhido e o lote pedido (levanta NotAcceptable ou
+    InvalidBatchSize).
+    """
+    renderer, media_type = CachedContentNegotiation().select_renderer(
+        request, [renderer_class() for renderer_class in STREAM_RENDERER_CLASSES]
+    )
+    return renderer, negotiated_batch(renderer, request.GET, media_type)
+
+
+async def aiter_stream(renderer, ispb, session, batch=None):
+    """Mesma janela de ``streams.iter_stream``, esperando no event loop"""
+    window = StreamWindow(renderer, ispb, session, batch)
+    try:
+        with get_notifier().subscribe_async(ispb) as subscription:
+            while True:
+                chunk, timeout = await run_db(window.pull)
+                if chunk:
+                    yield chunk
+                if timeout is None:
+                    break
+                if timeout:
+                    await subscription.wait(timeout)
+        await run_db(window.finish)
+    except StaleCursor:
+        logger.info(f"Janela de stream encerrada para ISPB {ispb}: cursor consumido por outra requisição")
+
+    closing = window.close()
+    if closing:
+        yield closing
+
+
+async def _stream_and_respond(renderer, ispb, session, batch, acknowledge=False):
+    """Resposta contínua (NDJSON/multipart) servida por um gerador assíncrono"""
+    try:
+        await run_db(rotate_cursor, session, acknowledge)
+    except StaleCursor:
+        return _json_response({"detail": pulls.STALE_CURSOR}, status=409)
+
+    return stream_response(renderer, ispb, session, aiter_stream(renderer, ispb, session, batch))
+
+
+async def _get_messages_and_respond(ispb, session, renderer, batch=None, acknowledge=False):
+    """Lógica comum (assíncrona) para buscar mensagens e responder"""
+    if isinstance(renderer, StreamingRenderer):
+        return await _stream_and_respond(renderer, ispb, session, batch, acknowledge)
+
+    poll = LongPoll(renderer, ispb, session, batch, acknowledge)
+    try:
+        with get_notifier().subscribe_async(ispb) as subscription:
+            timeout = await run_db(poll.pull)
+            while timeout is not None:
+                if not await subscription.wait(timeout) and poll.expired():
+                    break
+                timeout = await run_db(poll.pull)
+        await run_db(poll.finish)
+    except StaleCursor:
+        return _json_response({"detail": pulls.STALE_CURSOR}, status=409)
+
+    return poll.response()
+
+
+@csrf_exempt
+async def pix_stream_start(request, ispb):
+    """Endpoint assíncrono para iniciar um stream de mensagens Pix"""
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    try:
+        renderer, batch = _negotiate(request)
+    except NotAcceptable as exc:
+        return _json_response({"detail": str(exc.detail)}, status=406)
+    except InvalidBatchSize:
+        return _json_response({"detail": pulls.INVALID_BATCH}, status=400)
+    try:
+        weight = parse_weight(request.GET.get("weight"))
+    except InvalidWeight:
+        return _json_response({"detail": pulls.INVALID_WEIGHT}, status=400)
+
+    ensure_reaper_started()
+    session = await run_db(open_cursor, ispb, weight)
+    if session is None:
+        return _json_response({"detail": pulls.TOO_MANY_STREAMS}, status=429)
+
+    return compress_response(request, await _get_messages_and_respond(ispb, session, renderer, batch))
+
+
+@csrf_exempt
+async def pix_stream_continue_delete(request, ispb, interaction_id):
+    """Endpoint assíncrono para continuar (GET) ou finalizar (DELETE) um stream"""
+    if request.method == "DELETE":
+        if await run_db(close_cursor, ispb, interaction_id):
+            logger.info(f"Stream finalizado para ISPB {ispb}, interaction_id {interaction_id}")
+        else:
+            logger.info(f"Tentativa de finalizar stream inexistente para ISPB {ispb}, interaction_id {interaction_id}")
+        return _json_response({}, status=200)
+
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET", "DELETE"])
+    try:
+        renderer, batch = _negotiate(request)
+    except NotAcceptable as exc:
+        return _json_response({"detail": str(exc.detail)}, status=406)
+    except InvalidBatchSize:
+        return _json_response({"detail": pulls.INVALID_BATCH}, status=400)
+
+    session = await run_db(resolve_cursor, ispb, interaction_id)
+    if session is None:
+        return _json_response({"detail": pulls.STREAM_NOT_FOUND}, status=404)
+
+    return compress_response(request, await _get_messages_and_respond(ispb, session, renderer, batch, acknowledge=True))
@@ -0,0 +1,64 @@
+"""
+Tamanho do lote das respostas ``multipart/json``.
+
+O cliente negocia o lote por requisição, pelo parâmetro ``?batch=N`` ou pelo
+parâmetro do Accept (``multipart/json; batch=N``), limitado a
+``PIX_STREAM_MAX_BATCH_SIZE``. Sem pedido explícito vale
+``PIX_STREAM_BATCH_SIZE``.
+
+Com ``batch=adaptive`` o lote de cada stream fica gravado na StreamSession:
+dobra enquanto os pulls voltam cheios (backlog fundo) e cai pela metade quando
+voltam com menos da metade (backlog raso), entre 1 e o máximo.
+"""
+from django.conf import settings
+
+from .renderers import MultipartJsonRenderer
+
+ADAPTIVE = "adaptive"
+
+
+class InvalidBatchSize(ValueError):
+    """Valor de batch que não é inteiro positivo nem ``adaptive``"""
+
+
+def parse_batch(value):
+    """Converte o valor pedido em um inteiro positivo ou ADAPTIVE (None se ausente)"""
+    if value is None or value == "":
+        return None
+    value = value.strip().lower()
+    if value == ADAPTIVE:
+        return ADAPTIVE
+    try:
+        size = int(value)
+    except ValueError:
+        raise InvalidBatchSize(value)
+    if size <= 0:
+        raise InvalidBatchSize(value)
+    return size
+
+
+def requested_batch(query_params, accepted_media_type):
+    """Lote pedido pelo cliente: ``?batch=`` tem precedência sobre o Accept"""
+    value = query_params.get("batch")
+    if value is None:
+        value = MultipartJsonRenderer.batch_parameter(accepted_media_type)
+    return parse_batch(value)
+
+
+def batch_limit(requested, session):
+    """Limite de mensagens do próximo pull para o lote pedido"""
+    maximum = settings.PIX_STREAM_MAX_BATCH_SIZE
+    if requested is None:
+        return min(settings.PIX_STREAM_BATCH_SIZE, maximum)
+    if requested == ADAPTIVE:
+        return min(session.batch_size or settings.PIX_STREAM_BATCH_SIZE, maximum)
+    return min(requested, maximum)
+
+
+def next_adaptive_size(limit, delivered):
+    """Lote adaptativo do próximo pull a partir do resultado deste"""
+    if delivered >= limit:
+        return min(limit * 2, settings.PIX_STREAM_MAX_BATCH_SIZE)
+    if delivered * 2 < limit:
+        return max(limit // 2, 1)
+    return limit
@@ -0,0 +1,215 @@
+"""
+Motor de claim de mensagens Pix.
+
+Reivindica um lote de mensagens para uma sessão de stream em um único
+comando SQL: as linhas candidatas são travadas com
+``SELECT ... FOR UPDATE SKIP LOCKED`` e marcadas com ``UPDATE ... RETURNING``.
+Coletores concorrentes do mesmo ISPB nunca bloqueiam uns aos outros e nunca
+recebem a mesma mensagem duas vezes.
+
+O ``RETURNING`` traz só o id e o JSON gravado na inserção (``payload``), já
+como tuplas (``StoredMessage``), sem instanciar modelos nem serializar. Com o
+cache de mensagens recentes ligado (``streaming/hotcache.py``), traz só o id e
+os payloads vêm do cache.
+
+A entrega é "pelo menos uma vez": o lote reivindicado fica em voo
+(``visible_at``) até ser confirmado pelo Pull-Next seguinte ou pelo DELETE.
+Lotes não confirmados no prazo (``PIX_STREAM_VISIBILITY_TIMEOUT``) ou de
+sessões encerradas pelo reaper voltam para a fila.
+
+Qual mensagem reivindicar é decidido pelo backend de fila
+(``streaming/queues.py``): a varredura da fila no banco (``claim_messages``)
+ou ids entregues por uma fila externa (``claim_message_ids``).
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from . import metrics
+from .encoders import STORED_FIELDS, stored_messages
+from .hotcache import get_hot_cache
+from .models import PixMessage, StreamSession
+from .notify import get_notifier
+
+
+def _returning_columns(ids_only):
+    names = ("id",) if ids_only else STORED_FIELDS
+    return ", ".join(connection.ops.quote_name(PixMessage._meta.get_field(name).column) for name in names)
+
+
+def _claim_sql(skip_locked, after_cursor, priority_only=False, ids_only=False, aged=False):
+    """Monta o comando de claim para o banco em uso"""
+    table = connection.ops.quote_name(PixMessage._meta.db_table)
+    columns = _returning_columns(ids_only)
+    lock_clause = "FOR UPDATE SKIP LOCKED" if skip_locked else ""
+    cursor_clause = "AND id > %s" if after_cursor else ""
+    if priority_only:
+        # Faixa prioritária: índice parcial pixmsg_priority_queue_idx. Com a
+        # regra de idade, as que também já envelheceram saem antes
+        lane_clause = "AND priority > 0"
+        order = "CASE WHEN data_pagamento < %s THEN 0 ELSE 1 END, id" if aged else "priority DESC, id"
+    elif aged:
+        # Faixa por idade: índice parcial pixmsg_aged_queue_idx, pagamentos mais antigos antes
+        lane_clause = "AND data_pagamento < %s"
+        order = "data_pagamento, id"
+    else:
+        lane_clause = ""
+        order = "id"
+    return f"""
+        UPDATE {table}
+           SET claimed_by_stream_id = %s, claimed = %s, visible_at = %s
+         WHERE id IN (
+               SELECT id FROM {table}
+                WHERE recebedor_ispb = %s AND claimed_by_stream_id IS NULL
+                {lane_clause}
+                {cursor_clause}
+                ORDER BY {order}
+                LIMIT %s
+                {lock_clause})
+     RETURNING {columns}
+    """
+
+
+def _claim_ids_sql(count, ids_only=False):
+    """Monta o comando de claim de ids já escolhidos (só os ainda livres)"""
+    table = connection.ops.quote_name(PixMessage._meta.db_table)
+    columns = _returning_columns(ids_only)
+    return f"""
+        UPDATE {table}
+           SET claimed_by_stream_id = %s, claimed = %s, visible_at = %s
+         WHERE id IN ({", ".join(["%s"] * count)})
+           AND recebedor_ispb = %s AND claimed_by_stream_id IS NULL
+     RETURNING {columns}
+    """
+
+
+def _claim_params(session):
+    session_id = PixMessage._meta.get_field("claimed_by_stream").get_db_prep_value(session.pk, connection)
+    visible_at = connection.ops.adapt_datetimefield_value(
+        now() + timedelta(seconds=settings.PIX_STREAM_VISIBILITY_TIMEOUT)
+    )
+    return [session_id, True, visible_at]
+
+
+def _execute_claim(ispb, sql, params, cache):
+    started = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    metrics.CLAIMS.observe(time.perf_counter() - started)
+    metrics.CLAIMED_MESSAGES.inc(len(rows))
+    rows.sort(key=lambda row: row[0])
+    if cache is not None:
+        rows = cache.rows(ispb, [row[0] for row in rows])
+    return stored_messages(rows)
+
+
+def claim_messages(ispb, session, limit, after_id=None, priority_only=False, aged_before=None):
+    """
+    Reivindica até `limit` mensagens não entregues do ISPB para a sessão
+
+    No PostgreSQL as linhas já travadas por outro coletor são puladas
+    (SKIP LOCKED). No SQLite a escrita é serializada pelo próprio banco, então
+    o mesmo comando sem a cláusula de lock já é atômico.
+
+    Args:
+        ispb: ISPB do recebedor
+        session: StreamSession que passa a ser dona das mensagens
+        limit: Quantidade máxima de mensagens do lote
+        after_id: Se informado, só considera mensagens com id maior (cursor)
+        priority_only: Só mensagens com prioridade pelo valor; as pagas antes
+            de `aged_before` primeiro
+        aged_before: Sem `priority_only`, só pagamentos feitos antes deste
+            instante, dos mais antigos aos mais novos
+
+    Returns:
+        Lista de StoredMessage ordenada por id (FIFO)
+    """
+    cache = get_hot_cache()
+    aged = aged_before is not None
+    sql = _claim_sql(
+        connection.features.has_select_for_update_skip_locked,
+        after_id is not None,
+        priority_only,
+        ids_only=cache is not None,
+        aged=aged,
+    )
+    cutoff = connection.ops.adapt_datetimefield_value(aged_before) if aged else None
+    params = _claim_params(session) + [ispb]
+    if aged and not priority_only:
+        params.append(cutoff)
+    if after_id is not None:
+        params.append(after_id)
+    if aged and priority_only:
+        params.append(cutoff)
+    params.append(limit)
+    return _execute_claim(ispb, sql, params, cache)
+
+
+def claim_message_ids(ispb, session, ids):
+    """
+    Reivindica para a sessão as mensagens `ids` do ISPB que ainda estão livres
+
+    Ids já reivindicados, de outro ISPB ou que não existem mais são ignorados:
+    a atualização pela chave primária é condicional, então dois coletores com
+    o mesmo id nunca recebem a mesma mensagem.
+    """
+    cache = get_hot_cache()
+    sql = _claim_ids_sql(len(ids), ids_only=cache is not None)
+    return _execute_claim(ispb, sql, _claim_params(session) + list(ids) + [ispb], cache)
+
+
+def acknowledge_messages(sessions):
+    """
+    Confirma as mensagens em voo das sessões (lista ou queryset)
+
+    Chamado quando o coletor segue o Pull-Next ou finaliza o stream: ter o
+    interactionId prova que a resposta com o lote anterior chegou.
+    """
+    return PixMessage.objects.filter(
+        claimed_by_stream__in=sessions,
+        visible_at__isnull=False,
+    ).update(visible_at=None, acked_at=now())
+
+
+# Ids por comando ao devolver mensagens (limite de parâmetros do SQLite)
+RELEASE_CHUNK_SIZE = 1000
+
+
+def _release(messages):
+    """Devolve mensagens em voo para a fila e acorda os coletores dos ISPBs"""
+    from .queues import get_queue
+
+    with transaction.atomic():
+        ids_by_ispb = defaultdict(list)
+        for ispb, pk in messages.select_for_update().values_list("recebedor_ispb", "id"):
+            ids_by_ispb[ispb].append(pk)
+        ids = [pk for pks in ids_by_ispb.values() for pk in pks]
+        released = 0
+        for start in range(0, len(ids), RELEASE_CHUNK_SIZE):
+            released += PixMessage.objects.filter(pk__in=ids[start:start + RELEASE_CHUNK_SIZE]).update(
+                claimed_by_stream=None, claimed=False, visible_at=None
+            )
+        if released:
+            # Cursores já passaram destes ids: a próxima busca recomeça do início
+            StreamSession.objects.filter(ispb__in=ids_by_ispb, active=True).update(last_message_id=None)
+            queue = get_queue()
+            notifier = get_notifier()
+            for ispb, pks in ids_by_ispb.items():
+                queue.requeue(ispb, pks)
+                notifier.notify(ispb)
+    return released
+
+
+def release_expired_messages():
+    """Devolve para a fila os lotes não confirmados dentro do prazo"""
+    return _release(PixMessage.objects.filter(visible_at__lt=now()))
+
+
+def release_session_messages(session_ids):
+    """Devolve para a fila as mensagens em voo de sessões encerradas"""
+    return _release(PixMessage.objects.filter(claimed_by_stream__in=session_ids, visible_at__isnull=False))
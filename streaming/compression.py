@@ -0,0 +1,199 @@
+"""
+Compressão das respostas de stream negociada por ``Accept-Encoding``.
+
+Os lotes ``multipart/json`` repetem as mesmas chaves, ISPBs e tipos de conta
+em cada mensagem e comprimem bem. ``compress_response`` escolhe a codificação
+pela ordem de preferência do servidor (``PIX_STREAM_COMPRESSION``, padrão
+``zstd,br,gzip``) entre as que o coletor aceita (valores ``q``):
+
+- ``gzip``: biblioteca padrão (``zlib``).
+- ``zstd``: pacote ``zstandard`` (opcional).
+- ``br``: pacote ``brotli`` (opcional).
+
+Codificações sem o pacote instalado são ignoradas. Corpos menores que
+``PIX_STREAM_COMPRESSION_MIN_BYTES`` (como o ``application/json`` de uma
+mensagem) saem sem compressão.
+
+Nas respostas contínuas (NDJSON e ``multipart/mixed``) cada trecho é
+comprimido e descarregado (flush) na hora: o coletor consegue descomprimir
+cada lote assim que ele chega, sem esperar o fim da janela.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import zstandard
+except ImportError:  # dependência opcional (zstd)
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # dependência opcional (br)
+    brotli = None
+
+# Níveis escolhidos para respostas geradas a cada pull (ver bench_compression)
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+BROTLI_QUALITY = 4
+
+# Combinações distintas de Accept-Encoding guardadas (como em negotiation.py)
+MAX_CACHED_CHOICES = 512
+
+
+class _GzipStream:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk):
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _ZstdStream:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, chunk):
+        return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, chunk):
+        return self._compressor.process(chunk) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _zstd(data):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+# Codificação -> (comprime um corpo inteiro, compressor de respostas contínuas)
+CODECS = {
+    "gzip": (_gzip, _GzipStream),
+    "zstd": (_zstd, _ZstdStream),
+    "br": (_brotli, _BrotliStream),
+}
+
+
+def available_encodings():
+    """Codificações de PIX_STREAM_COMPRESSION com a dependência instalada, em ordem de preferência"""
+    installed = {"gzip": True, "zstd": zstandard is not None, "br": brotli is not None}
+    names = (name.strip().lower() for name in settings.PIX_STREAM_COMPRESSION.split(","))
+    return tuple(name for name in names if installed.get(name))
+
+
+def _accepted(accept_encoding):
+    """{codificação: q} de um Accept-Encoding"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted["gzip" if name == "x-gzip" else name] = q
+    return accepted
+
+
+_choices = {}
+
+
+def select_encoding(accept_encoding, encodings=None):
+    """
+    Codificação da resposta para um Accept-Encoding (None: sem compressão)
+
+    Vale a de maior ``q``; no empate, a primeira na preferência do servidor.
+    ``*`` cobre as codificações não citadas.
+    """
+    if encodings is None:
+        encodings = available_encodings()
+    key = (accept_encoding, encodings)
+    if key in _choices:
+        return _choices[key]
+    accepted = _accepted(accept_encoding)
+    choice = None
+    best = 0.0
+    for name in encodings:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best:
+            choice, best = name, q
+    if len(_choices) < MAX_CACHED_CHOICES:
+        _choices[key] = choice
+    return choice
+
+
+def _compress_chunks(chunks, stream):
+    for chunk in chunks:
+        compressed = stream.compress(chunk)
+        if compressed:
+            yield compressed
+    yield stream.finish()
+
+
+async def _acompress_chunks(chunks, stream):
+    async for chunk in chunks:
+        compressed = stream.compress(chunk)
+        if compressed:
+            yield compressed
+    yield stream.finish()
+
+
+def compress_response(request, response):
+    """
+    Comprime uma resposta 200 de stream conforme o Accept-Encoding da requisição
+
+    Respostas de erro, vazias (204) ou já codificadas voltam como estão.
+    """
+    encodings = available_encodings()
+    if not encodings or response.status_code != 200 or response.has_header("Content-Encoding"):
+        return response
+    patch_vary_headers(response, ("Accept-Encoding",))
+    encoding = select_encoding(request.META.get("HTTP_ACCEPT_ENCODING", ""), encodings)
+    if encoding is None:
+        return response
+    compress, stream_class = CODECS[encoding]
+
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = _acompress_chunks(response.streaming_content, stream_class())
+        else:
+            response.streaming_content = _compress_chunks(response.streaming_content, stream_class())
+        del response["Content-Length"]
+    else:
+        if len(response.content) < settings.PIX_STREAM_COMPRESSION_MIN_BYTES:
+            return response
+        compressed = compress(response.content)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+    response["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,205 @@
+"""
+Cursores de stream vinculados ao Pull-Next.
+
+Cada ``interactionId`` entregue no cabeçalho ``Pull-Next`` aponta para uma
+StreamSession ativa, que guarda o id da última mensagem entregue e a
+validade do cursor. Com a fila no banco, a continuação reivindica
+estritamente depois desse id, em uma varredura por faixa no índice, em vez
+de reler a fila desde a mensagem mais antiga (ver ``streaming/queues.py``).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.crypto import get_random_string
+from django.utils.timezone import now
+
+from . import metrics
+from .admission import release_slot, reserve_slot
+from .batching import next_adaptive_size
+from .claims import acknowledge_messages
+from .models import StreamSession
+from .queues import get_queue
+from .scheduler import get_scheduler
+
+
+class StaleCursor(Exception):
+    """O interactionId foi consumido por outra requisição concorrente"""
+
+
+def new_interaction_id():
+    return get_random_string(12)
+
+
+def cursor_expiry():
+    return now() + timedelta(seconds=settings.PIX_STREAM_CURSOR_TTL)
+
+
+def open_cursor(ispb, weight=1):
+    """
+    Cria a sessão (e o cursor inicial) de um novo stream
+
+    A vaga no limite de sessões do ISPB é reservada na mesma transação.
+    Retorna None quando o limite foi atingido. ``weight`` é o peso da sessão
+    na divisão justa entre os coletores do ISPB.
+    """
+    with transaction.atomic():
+        if not reserve_slot(ispb):
+            metrics.ADMISSIONS["rejected"].inc()
+            return None
+        metrics.ADMISSIONS["admitted"].inc()
+        return StreamSession.objects.create(
+            ispb=ispb,
+            interaction_id=new_interaction_id(),
+            expires_at=cursor_expiry(),
+            last_pull_at=now(),
+            weight=weight,
+        )
+
+
+def resolve_cursor(ispb, interaction_id):
+    """
+    Retorna a sessão ativa dona do interactionId, ou None se inexistente/expirada
+
+    Não confirma nada: o lote entregue com esse interactionId é confirmado
+    pelo primeiro pull da continuação (``pull_batch(acknowledge=True)``),
+    ``rotate_cursor`` ou ``acknowledge_cursor``, na transação que consome ou
+    renova o token.
+    """
+    return StreamSession.objects.filter(
+        ispb=ispb,
+        interaction_id=interaction_id,
+        active=True,
+        expires_at__gt=now(),
+    ).first()
+
+
+def advance_cursor(session, messages, adaptive_limit=None, rotate=True, last_message_id=None):
+    """
+    Avança o cursor da sessão após um pull e renova sua validade
+
+    Quando há mensagens, o interactionId é rotacionado e o cursor devolvido
+    pelo backend de fila junto com o lote (``last_message_id``) é gravado. A
+    atualização é condicional ao token atual: se outra requisição já o
+    consumiu, StaleCursor é levantada para que a transação do claim seja
+    desfeita.
+
+    A mesma atualização grava o heartbeat da sessão (``last_pull_at``). Com
+    ``adaptive_limit`` (limite do pull no modo adaptativo), o lote do próximo
+    pull é recalculado e gravado junto. Com ``rotate=False`` (lotes de uma
+    resposta contínua) o token é mantido.
+    """
+    changes = {"expires_at": cursor_expiry(), "last_pull_at": now()}
+    if messages:
+        if rotate:
+            changes["interaction_id"] = new_interaction_id()
+        changes["last_message_id"] = last_message_id
+    if adaptive_limit is not None:
+        changes["batch_size"] = next_adaptive_size(adaptive_limit, len(messages))
+
+    updated = StreamSession.objects.filter(
+        pk=session.pk,
+        interaction_id=session.interaction_id,
+        active=True,
+    ).update(**changes)
+    if not updated:
+        raise StaleCursor(session.interaction_id)
+
+    for field, value in changes.items():
+        setattr(session, field, value)
+    return session.interaction_id
+
+
+def rotate_cursor(session, acknowledge=False):
+    """
+    Consome o interactionId atual e emite um novo (StaleCursor se já consumido)
+
+    Com ``acknowledge``, o lote entregue com o interactionId consumido é
+    confirmado na mesma transação (desfeita junto se o token já foi usado).
+    """
+    changes = {"interaction_id": new_interaction_id(), "expires_at": cursor_expiry(), "last_pull_at": now()}
+    with transaction.atomic():
+        if acknowledge:
+            acknowledge_messages([session])
+        updated = StreamSession.objects.filter(
+            pk=session.pk,
+            interaction_id=session.interaction_id,
+            active=True,
+        ).update(**changes)
+        if not updated:
+            raise StaleCursor(session.interaction_id)
+
+    for field, value in changes.items():
+        setattr(session, field, value)
+    return session.interaction_id
+
+
+def acknowledge_cursor(session, adaptive_limit=None):
+    """
+    Confirma o lote entregue com o interactionId atual e renova o cursor
+
+    As duas coisas na mesma transação: se o token já foi consumido por outra
+    requisição, StaleCursor desfaz a confirmação.
+    """
+    with transaction.atomic():
+        acknowledge_messages([session])
+        advance_cursor(session, [], adaptive_limit=adaptive_limit)
+
+
+def pull_batch(ispb, session, limit, adaptive=False, rotate=True, acknowledge=False):
+    """
+    Reivindica o próximo lote pelo backend de fila e avança o cursor na mesma transação
+
+    O escalonador pode reduzir o lote (divisão justa) ou adiar o pull sem ir
+    ao banco (``Throttled``, limite por ISPB). O lote adaptativo continua
+    calculado sobre o limite pedido.
+
+    Com ``acknowledge`` (primeiro pull de uma continuação), as mensagens em voo
+    da sessão, entregues com o interactionId atual, são confirmadas na mesma
+    transação. O cursor é avançado mesmo sem mensagens, de forma condicional
+    ao token: se outra requisição o consumiu antes do commit, StaleCursor
+    desfaz a confirmação e o lote entregue a ela continua em voo.
+    """
+    queue = get_queue()
+    scheduler = get_scheduler()
+    granted = scheduler.grant(ispb, session, limit)
+    messages = []
+    try:
+        queue.prepare(ispb)
+        with transaction.atomic():
+            if acknowledge:
+                acknowledge_messages([session])
+            messages, last_message_id = queue.claim(ispb, session, granted)
+            if messages or acknowledge:
+                adaptive_limit = limit if adaptive and messages else None
+                advance_cursor(
+                    session, messages, adaptive_limit=adaptive_limit, rotate=rotate, last_message_id=last_message_id
+                )
+    except Exception:
+        # O claim foi desfeito: as mensagens continuam livres no banco
+        if messages:
+            queue.unclaim(ispb, messages)
+        messages = []
+        raise
+    finally:
+        scheduler.settle(ispb, granted, len(messages))
+    return messages
+
+
+def close_cursor(ispb, interaction_id):
+    """
+    Encerra exatamente a sessão dona do interactionId. Retorna se algo foi encerrado
+
+    O último lote entregue com esse interactionId é confirmado junto.
+    """
+    owner = StreamSession.objects.filter(
+        ispb=ispb,
+        interaction_id=interaction_id,
+        active=True,
+    )
+    with transaction.atomic():
+        acknowledge_messages(owner.values("pk"))
+        closed = owner.update(active=False) > 0
+        if closed:
+            release_slot(ispb)
+    return closed
@@ -0,0 +1,237 @@
+"""
+Codificador do formato de fio das mensagens Pix.
+
+Uma mensagem não muda depois de criada, então o JSON dela é gerado uma vez,
+na inserção, e gravado em ``PixMessage.payload`` (gerador, ingestão em massa e
+ORM). O claim devolve só ``(id, payload)`` (``StoredMessage``) e as respostas
+juntam os bytes gravados, sem serialização por pull:
+
+- ``application/json`` (uma mensagem) e os quadros das respostas contínuas: o
+  próprio payload, igual à saída do ``JSONRenderer`` do DRF sobre o
+  ``PixMessageSerializer`` (compacta, UTF-8). Usa ``orjson`` quando instalado.
+- ``multipart/json`` (lote): o ``json.dumps`` dos payloads, byte a byte igual
+  às respostas anteriores. Com ``PIX_STREAM_COMPACT_BATCH_JSON``, ``[`` +
+  payloads separados por ``,`` + ``]``, sem decodificar.
+
+Os formatos binários (MessagePack e CBOR, ver ``streaming/renderers.py``)
+partem do payload gravado (``binary_message``): ``valor`` vira inteiro em
+centavos e ``dataHoraPagamento`` inteiro em microssegundos desde a época
+Unix (UTC).
+
+Linhas antigas sem payload são codificadas no claim a partir das colunas
+(``StreamMessage``) e podem ser preenchidas com ``backfill_payloads``. O
+payload usa o fuso de ``TIME_ZONE``; depois de mudar o fuso, rode
+``backfill_payloads --all``.
+"""
+import decimal
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import PixMessage
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+# Colunas do formato de fio (payload e linhas antigas), na ordem das tuplas StreamMessage
+WIRE_FIELDS = (
+    "id",
+    "end_to_end_id",
+    "valor",
+    "pagador_nome",
+    "pagador_cpf_cnpj",
+    "pagador_ispb",
+    "pagador_agencia",
+    "pagador_conta",
+    "pagador_tipo_conta",
+    "recebedor_nome",
+    "recebedor_cpf_cnpj",
+    "recebedor_ispb",
+    "recebedor_agencia",
+    "recebedor_conta",
+    "recebedor_tipo_conta",
+    "campo_livre",
+    "tx_id",
+    "data_pagamento",
+)
+
+StreamMessage = namedtuple("StreamMessage", WIRE_FIELDS)
+
+# Colunas devolvidas pelo claim, na ordem das tuplas StoredMessage
+STORED_FIELDS = ("id", "payload")
+
+StoredMessage = namedtuple("StoredMessage", STORED_FIELDS)
+
+_VALOR_FIELD = PixMessage._meta.get_field("valor")
+_VALOR_QUANTUM = decimal.Decimal(1).scaleb(-_VALOR_FIELD.decimal_places)
+_VALOR_CONTEXT = decimal.Context(prec=_VALOR_FIELD.max_digits)
+
+
+def message_from_instance(instance):
+    """StreamMessage a partir de uma instância de PixMessage (benchmarks e legado)"""
+    return StreamMessage._make(getattr(instance, name) for name in WIRE_FIELDS)
+
+
+def stored_messages(rows):
+    """
+    Converte tuplas ``(id, payload)`` do claim em StoredMessage
+
+    Linhas sem payload (anteriores à coluna) são codificadas a partir das
+    colunas, em uma consulta só para elas.
+    """
+    missing = [row[0] for row in rows if row[1] is None]
+    rendered = {}
+    if missing:
+        legacy = PixMessage.objects.filter(pk__in=missing).values_list(*WIRE_FIELDS)
+        rendered = {row[0]: render_payload(StreamMessage._make(row)) for row in legacy}
+    return [
+        StoredMessage(pk, rendered[pk] if payload is None else bytes(payload))
+        for pk, payload in rows
+    ]
+
+
+def _valor(value):
+    # Mesma saída do DecimalField do DRF (coerce_to_string)
+    if not isinstance(value, decimal.Decimal):
+        value = decimal.Decimal(str(value).strip())
+    return "{:f}".format(value.quantize(_VALOR_QUANTUM, context=_VALOR_CONTEXT))
+
+
+def _data_hora(value, current_timezone):
+    # Mesma saída do DateTimeField do DRF: fuso atual, ISO 8601, "Z" para UTC
+    if value.utcoffset() is not None:
+        value = value.astimezone(current_timezone)
+    text = value.isoformat()
+    if text.endswith("+00:00"):
+        text = text[:-6] + "Z"
+    return text
+
+
+def message_to_dict(message, current_timezone=None):
+    """Estrutura do formato de fio (mesma ordem de chaves do PixMessageSerializer)"""
+    if current_timezone is None:
+        current_timezone = timezone.get_current_timezone()
+    return {
+        "endToEndId": message.end_to_end_id,
+        "valor": _valor(message.valor),
+        "pagador": {
+            "nome": message.pagador_nome,
+            "cpfCnpj": message.pagador_cpf_cnpj,
+            "ispb": message.pagador_ispb,
+            "agencia": message.pagador_agencia,
+            "contaTransacional": message.pagador_conta,
+            "tipoConta": message.pagador_tipo_conta,
+        },
+        "recebedor": {
+            "nome": message.recebedor_nome,
+            "cpfCnpj": message.recebedor_cpf_cnpj,
+            "ispb": message.recebedor_ispb,
+            "agencia": message.recebedor_agencia,
+            "contaTransacional": message.recebedor_conta,
+            "tipoConta": message.recebedor_tipo_conta,
+        },
+        "campoLivre": message.campo_livre,
+        "txId": message.tx_id,
+        "dataHoraPagamento": _data_hora(message.data_pagamento, current_timezone),
+    }
+
+
+def render_payload(message):
+    """Payload de uma StreamMessage: bytes de ``application/json`` (igual ao JSONRenderer do DRF)"""
+    data = message_to_dict(message)
+    if orjson is not None:
+        encoded = orjson.dumps(data)
+    else:
+        encoded = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    # O DRF escapa os separadores de linha/parágrafo Unicode (seguro para JS)
+    return encoded.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
+
+
+def instance_payload(instance):
+    """Payload de uma instância de PixMessage (gerador e ORM)"""
+    return render_payload(message_from_instance(instance))
+
+
+@receiver(pre_save, sender=PixMessage)
+def _set_payload(sender, instance, raw=False, **kwargs):
+    """Mensagens salvas pelo ORM (admin, testes) têm o payload (re)gerado"""
+    if not raw:
+        instance.payload = instance_payload(instance)
+
+
+def encode_single(message):
+    """Bytes de uma StoredMessage para ``application/json``"""
+    return message.payload
+
+
+def encode_batch(messages):
+    """
+    Bytes de um lote de StoredMessage para ``multipart/json`` (array JSON)
+
+    Por padrão, os mesmos bytes de sempre (``json.dumps`` dos dados do
+    serializer, com espaços e escapes ``\\uXXXX``), a partir dos payloads. Com
+    ``PIX_STREAM_COMPACT_BATCH_JSON``, o array só junta os payloads gravados.
+    """
+    if settings.PIX_STREAM_COMPACT_BATCH_JSON:
+        return b"[" + b",".join([message.payload for message in messages]) + b"]"
+    loads = orjson.loads if orjson is not None else json.loads
+    return json.dumps([loads(message.payload) for message in messages]).encode("utf-8")
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def epoch_micros(text):
+    """Microssegundos desde a época Unix de um ``dataHoraPagamento`` ISO 8601"""
+    value = datetime.fromisoformat(text)
+    if value.tzinfo is None:
+        value = timezone.make_aware(value)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def binary_message(payload):
+    """
+    Estrutura de uma mensagem nos formatos binários, a partir do payload JSON
+
+    Mesmas chaves do formato de fio, com ``valor`` inteiro em centavos (o
+    texto sempre tem as casas decimais do campo) e ``dataHoraPagamento`` em
+    microssegundos desde a época Unix.
+    """
+    data = orjson.loads(payload) if orjson is not None else json.loads(payload)
+    data["valor"] = int(data["valor"].replace(".", ""))
+    data["dataHoraPagamento"] = epoch_micros(data["dataHoraPagamento"])
+    return data
+
+
+def backfill_payloads(batch_size=1000, rewrite=False):
+    """
+    Grava o payload das linhas que ainda não têm (ou de todas, com ``rewrite``)
+
+    Percorre a tabela em ordem de id, em lotes. Returns: linhas gravadas
+    """
+    messages = PixMessage.objects.order_by("pk")
+    if not rewrite:
+        messages = messages.filter(payload__isnull=True)
+    total = 0
+    last_id = 0
+    while True:
+        rows = [
+            StreamMessage._make(row)
+            for row in messages.filter(pk__gt=last_id).values_list(*WIRE_FIELDS)[:batch_size]
+        ]
+        if not rows:
+            return total
+        PixMessage.objects.bulk_update(
+            [PixMessage(pk=row.id, payload=render_payload(row)) for row in rows], ["payload"]
+        )
+        total += len(rows)
+        last_id = rows[-1].id
@@ -0,0 +1,191 @@
+"""
+Geração em massa de mensagens Pix aleatórias para testes de carga.
+
+``PixMessageFactory`` gera os campos aleatórios de um lote inteiro de uma
+vez: um único ``randbytes`` por campo é traduzido para o alfabeto desejado e
+fatiado, em vez de ~10 chamadas a ``random.choices`` por linha. Com ``seed`` o
+resultado é reproduzível.
+
+O ``end_to_end_id`` leva o ISPB recebedor e um sal sorteado a cada geração
+(``E`` + ISPB + sal + parte aleatória), então repetir a mesma ``seed``, no
+mesmo ISPB ou em outro, gera o mesmo conteúdo com identificadores novos.
+
+``generate_messages`` insere em lotes com ``bulk_create`` e avisa os coletores
+a cada lote; ``start_generation_job`` roda a mesma geração em background,
+gravando o progresso em ``GenerationJob``.
+"""
+import logging
+import random
+import string
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from . import metrics
+from .encoders import instance_payload
+from .hotcache import remember
+from .models import GenerationJob, PixMessage
+from .notify import get_notifier
+from .queues import get_queue
+from .scheduler import message_priority
+
+logger = logging.getLogger(__name__)
+
+ALPHANUMERIC = string.ascii_letters + string.digits
+TIPOS_CONTA = ("CACC", "SVGS")
+GENERATION_SALT_LENGTH = 6
+
+
+def _translation_table(alphabet):
+    """Tabela byte -> caractere do alfabeto (viés desprezível para dados de teste)"""
+    return bytes(ord(alphabet[value % len(alphabet)]) for value in range(256))
+
+
+_ALNUM_TABLE = _translation_table(ALPHANUMERIC)
+_DIGITS_TABLE = _translation_table(string.digits)
+
+
+class PixMessageFactory:
+    """Fábrica vetorizada de mensagens Pix aleatórias"""
+
+    def __init__(self, seed=None, salt=""):
+        self.rng = random.Random(seed)
+        self.salt = salt
+
+    def _strings(self, count, length, table=_ALNUM_TABLE):
+        raw = self.rng.randbytes(count * length).translate(table).decode("ascii")
+        return [raw[offset:offset + length] for offset in range(0, count * length, length)]
+
+    def _agencias(self, count):
+        return [str(value).zfill(4) for value in self._ints(count, 1, 9999)]
+
+    def _ints(self, count, low, high):
+        randrange = self.rng.randrange
+        return [randrange(low, high + 1) for _ in range(count)]
+
+    def build(self, ispb, count):
+        """Monta `count` instâncias (não salvas) de PixMessage para o ISPB recebedor"""
+        now = timezone.now()
+        choice = self.rng.choice
+        prefix = f"E{ispb}{self.salt}"
+        columns = zip(
+            self._strings(count, 17),
+            self._ints(count, 100, 100000),
+            self._strings(count, 5),
+            self._strings(count, 11, _DIGITS_TABLE),
+            self._strings(count, 8),
+            self._agencias(count),
+            self._strings(count, 7),
+            self._strings(count, 5),
+            self._strings(count, 11, _DIGITS_TABLE),
+            self._agencias(count),
+            self._strings(count, 7),
+            self._strings(count, 16),
+        )
+        return [
+            PixMessage(
+                end_to_end_id=prefix + end_to_end_id,
+                valor=Decimal(cents).scaleb(-2),
+                pagador_nome="Pagador " + pagador_nome,
+                pagador_cpf_cnpj=pagador_cpf_cnpj,
+                pagador_ispb=pagador_ispb,
+                pagador_agencia=pagador_agencia,
+                pagador_conta=pagador_conta,
+                pagador_tipo_conta=choice(TIPOS_CONTA),
+                recebedor_nome="Recebedor " + recebedor_nome,
+                recebedor_cpf_cnpj=recebedor_cpf_cnpj,
+                recebedor_ispb=ispb,
+                recebedor_agencia=recebedor_agencia,
+                recebedor_conta=recebedor_conta,
+                recebedor_tipo_conta=choice(TIPOS_CONTA),
+                campo_livre="",
+                tx_id=tx_id,
+                data_pagamento=now,
+            )
+            for (
+                end_to_end_id, cents, pagador_nome, pagador_cpf_cnpj, pagador_ispb,
+                pagador_agencia, pagador_conta, recebedor_nome, recebedor_cpf_cnpj,
+                recebedor_agencia, recebedor_conta, tx_id,
+            ) in columns
+        ]
+
+
+def generate_messages(ispb, number, seed=None, progress=None):
+    """
+    Gera e insere `number` mensagens para o ISPB em lotes de bulk_create
+
+    Args:
+        ispb: ISPB do recebedor
+        number: Quantidade de mensagens
+        seed: Semente opcional para reproduzir o mesmo conjunto
+        progress: Callback opcional chamado com o total inserido após cada lote
+
+    Returns:
+        Quantidade de mensagens inseridas
+    """
+    started = time.perf_counter()
+    # Sal por geração: a mesma seed pode ser repetida sem colidir no end_to_end_id
+    factory = PixMessageFactory(seed, salt=get_random_string(GENERATION_SALT_LENGTH))
+    chunk_size = settings.PIX_GENERATE_CHUNK_SIZE
+    notifier = get_notifier()
+    queue = get_queue()
+    created = 0
+    while created < number:
+        batch = factory.build(ispb, min(chunk_size, number - created))
+        for message in batch:
+            message.payload = instance_payload(message)
+            message.priority = message_priority(message.valor)
+        PixMessage.objects.bulk_create(batch, batch_size=chunk_size)
+        queue.publish(
+            ispb,
+            [message.pk for message in batch],
+            [message.pk for message in batch if message.priority],
+        )
+        remember(ispb, [(message.pk, message.payload) for message in batch])
+        created += len(batch)
+        metrics.GENERATED_MESSAGES.inc(len(batch))
+        # Acordar coletores em long polling neste ISPB a cada lote
+        notifier.notify(ispb)
+        if progress is not None:
+            progress(created)
+    metrics.GENERATIONS.observe(time.perf_counter() - started)
+    return created
+
+
+def _run_generation_job(job_id):
+    job = GenerationJob.objects.get(pk=job_id)
+    GenerationJob.objects.filter(pk=job_id).update(status=GenerationJob.RUNNING)
+    try:
+        generate_messages(
+            job.ispb,
+            job.requested,
+            seed=job.seed,
+            progress=lambda created: GenerationJob.objects.filter(pk=job_id).update(created=created),
+        )
+    except Exception as exc:
+        logger.exception(f"Falha na geração de mensagens do job {job_id}")
+        GenerationJob.objects.filter(pk=job_id).update(
+            status=GenerationJob.FAILED, error=str(exc), finished_at=timezone.now()
+        )
+    else:
+        GenerationJob.objects.filter(pk=job_id).update(status=GenerationJob.DONE, finished_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def start_generation_job(ispb, number, seed=None):
+    """Registra um GenerationJob e executa a geração em uma thread de background"""
+    job = GenerationJob.objects.create(ispb=ispb, requested=number, seed=seed)
+
+    # A thread usa outra conexão: só iniciar depois que o job estiver confirmado
+    transaction.on_commit(
+        lambda: threading.Thread(
+            target=_run_generation_job, args=(job.pk,), name=f"pix-generate-{job.pk}", daemon=True
+        ).start()
+    )
+    return job
@@ -0,0 +1,81 @@
+"""
+Perfil enxuto para as rotas da API de stream.
+
+``pixstream/wsgi.py`` e ``pixstream/asgi.py`` servem a aplicação por um
+despachante: requisições cujo caminho começa com ``PIX_API_PREFIX``
+(``/api/pix/``) vão para um handler que passa só por ``PIX_API_MIDDLEWARE`` e
+resolve na URLconf ``streaming.api_urls``. As demais (admin, utilitários,
+métricas, health checks) seguem pela pilha completa de ``MIDDLEWARE``.
+
+Sessões, CSRF, autenticação, mensagens e clickjacking não fazem sentido para
+a API de máquina por ISPB. A cadeia é montada pelo próprio
+``BaseHandler.load_middleware`` do Django com ``MIDDLEWARE`` trocado por
+``PIX_API_MIDDLEWARE`` (na criação do handler, uma vez por processo), então
+valem as mesmas regras e adaptações sync/async da pilha completa.
+"""
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.test.utils import override_settings
+
+API_URLCONF = "streaming.api_urls"
+
+
+class LeanHandlerMixin:
+    """Carrega PIX_API_MIDDLEWARE no lugar de MIDDLEWARE e usa a URLconf da API"""
+
+    def load_middleware(self, is_async=False):
+        with override_settings(MIDDLEWARE=settings.PIX_API_MIDDLEWARE):
+            super().load_middleware(is_async)
+
+    def resolve_request(self, request):
+        request.urlconf = API_URLCONF
+        return super().resolve_request(request)
+
+
+class LeanWSGIHandler(LeanHandlerMixin, WSGIHandler):
+    pass
+
+
+class LeanASGIHandler(LeanHandlerMixin, ASGIHandler):
+    pass
+
+
+class PathDispatchWSGI:
+    """Aplicação WSGI que escolhe o handler pelo prefixo do caminho"""
+
+    def __init__(self, full, lean, prefix):
+        self.full = full
+        self.lean = lean
+        self.prefix = prefix
+
+    def __call__(self, environ, start_response):
+        handler = self.lean if environ.get("PATH_INFO", "").startswith(self.prefix) else self.full
+        return handler(environ, start_response)
+
+
+class PathDispatchASGI:
+    """Aplicação ASGI que escolhe o handler pelo prefixo do caminho"""
+
+    def __init__(self, full, lean, prefix):
+        self.full = full
+        self.lean = lean
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        lean = scope["type"] == "http" and scope["path"].startswith(self.prefix)
+        await (self.lean if lean else self.full)(scope, receive, send)
+
+
+def wsgi_application(full):
+    """Envolve a aplicação WSGI completa com o perfil enxuto (se PIX_API_PREFIX)"""
+    if not settings.PIX_API_PREFIX:
+        return full
+    return PathDispatchWSGI(full, LeanWSGIHandler(), settings.PIX_API_PREFIX)
+
+
+def asgi_application(full):
+    """Envolve a aplicação ASGI completa com o perfil enxuto (se PIX_API_PREFIX)"""
+    if not settings.PIX_API_PREFIX:
+        return full
+    return PathDispatchASGI(full, LeanASGIHandler(), settings.PIX_API_PREFIX)
@@ -0,0 +1,185 @@
+"""
+Cache em memória das mensagens recém-inseridas.
+
+Mensagens costumam ser puxadas segundos depois de inseridas. Com
+``PIX_STREAM_HOT_CACHE_BYTES`` maior que zero, cada processo guarda o payload
+(``PixMessage.payload``, já em bytes) das mensagens que ele mesmo inseriu
+(gerador, ingestão em massa e ORM) e o claim passa a devolver só os ids
+(``RETURNING id``). Os payloads vêm do cache; os que faltam são lidos do
+banco pela chave primária, em uma consulta só.
+
+- Cada ISPB tem um buffer em ordem de inserção. Acima de
+  ``PIX_STREAM_HOT_CACHE_ISPB_BYTES``, saem as mensagens mais antigas do ISPB.
+- Acima de ``PIX_STREAM_HOT_CACHE_BYTES`` no total, saem as mais antigas do
+  ISPB que está há mais tempo sem inserir nem puxar (LRU entre ISPBs).
+- Uma mensagem sai do cache quando é entregue: a reentrega lê do banco.
+
+O cache é por processo: só acerta quando a mensagem é puxada no mesmo
+processo que a inseriu. Acertos e faltas aparecem em
+``pix_hot_cache_lookups_total`` e o uso de memória em ``pix_hot_cache_bytes``.
+Uma mensagem alterada pelo ORM sai do cache. ``backfill_payloads --all`` roda
+em outro processo: reinicie os servidores depois dele.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .models import PixMessage
+
+# Custo aproximado de uma entrada além dos bytes do payload (chave, objeto
+# bytes e nó do dicionário), contado no limite de memória
+ENTRY_OVERHEAD = 120
+
+
+def _entry_size(payload):
+    return len(payload) + ENTRY_OVERHEAD
+
+
+class HotRowCache:
+    """Payloads das mensagens recentes por ISPB, com limite de memória"""
+
+    def __init__(self, max_bytes, ispb_bytes=0):
+        self.max_bytes = max_bytes
+        self.ispb_bytes = min(ispb_bytes, max_bytes) if ispb_bytes > 0 else max_bytes
+        # ISPB -> {id: payload} em ordem de inserção; ISPBs do usado há mais tempo ao mais recente
+        self._rings = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def _pop_oldest(self, ispb, ring):
+        _, payload = ring.popitem(last=False)
+        size = _entry_size(payload)
+        self._sizes[ispb] -= size
+        self.bytes -= size
+        if not ring:
+            del self._rings[ispb]
+            del self._sizes[ispb]
+
+    def put(self, ispb, items):
+        """Guarda pares ``(id, payload)`` do ISPB, descartando os mais antigos se preciso"""
+        with self._lock:
+            ring = self._rings.pop(ispb, None)
+            if ring is None:
+                ring = OrderedDict()
+                self._sizes[ispb] = 0
+            self._rings[ispb] = ring
+            for pk, payload in items:
+                payload = bytes(payload)
+                size = _entry_size(payload)
+                if size > self.ispb_bytes:
+                    continue
+                old = ring.pop(pk, None)
+                if old is not None:
+                    self._sizes[ispb] -= _entry_size(old)
+                    self.bytes -= _entry_size(old)
+                ring[pk] = payload
+                self._sizes[ispb] += size
+                self.bytes += size
+                while self._sizes[ispb] > self.ispb_bytes:
+                    self._pop_oldest(ispb, ring)
+            if not ring:
+                del self._rings[ispb]
+                del self._sizes[ispb]
+            while self.bytes > self.max_bytes:
+                oldest_ispb, oldest_ring = next(iter(self._rings.items()))
+                self._pop_oldest(oldest_ispb, oldest_ring)
+
+    def take(self, ispb, ids):
+        """Tira do cache os payloads dos ids entregues. Returns: {id: payload} dos encontrados"""
+        found = {}
+        with self._lock:
+            ring = self._rings.get(ispb)
+            if ring is not None:
+                self._rings.move_to_end(ispb)
+                for pk in ids:
+                    payload = ring.pop(pk, None)
+                    if payload is not None:
+                        found[pk] = payload
+                        self._sizes[ispb] -= _entry_size(payload)
+                        self.bytes -= _entry_size(payload)
+                if not ring:
+                    del self._rings[ispb]
+                    del self._sizes[ispb]
+        metrics.HOT_CACHE_LOOKUPS["hit"].inc(len(found))
+        metrics.HOT_CACHE_LOOKUPS["miss"].inc(len(ids) - len(found))
+        return found
+
+    def discard(self, ispb, pk):
+        """Remove uma mensagem do cache (alterada depois de inserida)"""
+        with self._lock:
+            ring = self._rings.get(ispb)
+            payload = ring.pop(pk, None) if ring is not None else None
+            if payload is not None:
+                self._sizes[ispb] -= _entry_size(payload)
+                self.bytes -= _entry_size(payload)
+                if not ring:
+                    del self._rings[ispb]
+                    del self._sizes[ispb]
+
+    def usage(self):
+        """``(bytes, entradas)`` em uso"""
+        with self._lock:
+            return self.bytes, sum(len(ring) for ring in self._rings.values())
+
+    def rows(self, ispb, ids):
+        """
+        Tuplas ``(id, payload)`` dos ids reivindicados, na mesma ordem
+
+        Os que não estão no cache são lidos do banco em uma consulta. O
+        payload continua ``None`` para linhas antigas (ver ``stored_messages``).
+        """
+        found = self.take(ispb, ids)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            found.update(PixMessage.objects.filter(pk__in=missing).values_list("id", "payload"))
+        return [(pk, found.get(pk)) for pk in ids]
+
+
+def remember(ispb, items):
+    """Guarda no cache, depois do commit, os pares ``(id, payload)`` inseridos"""
+    cache = get_hot_cache()
+    if cache is not None:
+        items = list(items)
+        if items:
+            transaction.on_commit(lambda: cache.put(ispb, items))
+
+
+@receiver(post_save, sender=PixMessage)
+def _remember_saved(sender, instance, created, raw=False, **kwargs):
+    """Mensagens criadas pelo ORM entram no cache; alteradas saem dele"""
+    cache = get_hot_cache()
+    if cache is None or raw:
+        return
+    if created and instance.payload is not None:
+        remember(instance.recebedor_ispb, [(instance.pk, instance.payload)])
+    elif not created:
+        cache.discard(instance.recebedor_ispb, instance.pk)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_hot_cache():
+    """Retorna o cache do processo, ou None se ``PIX_STREAM_HOT_CACHE_BYTES`` for 0"""
+    global _cache
+    if _cache is None and settings.PIX_STREAM_HOT_CACHE_BYTES > 0:
+        with _cache_lock:
+            if _cache is None:
+                _cache = HotRowCache(settings.PIX_STREAM_HOT_CACHE_BYTES, settings.PIX_STREAM_HOT_CACHE_ISPB_BYTES)
+    return _cache
+
+
+@receiver(setting_changed)
+def _reset_hot_cache(setting, **kwargs):
+    """Descarta o cache atual quando uma setting dele muda (override_settings nos testes)"""
+    global _cache
+    if setting in ("PIX_STREAM_HOT_CACHE_BYTES", "PIX_STREAM_HOT_CACHE_ISPB_BYTES"):
+        _cache = None
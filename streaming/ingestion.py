@@ -0,0 +1,384 @@
+"""
+Ingestão em massa de mensagens Pix.
+
+``POST /api/pix/messages`` recebe um array JSON (``application/json``) ou uma
+mensagem por linha (``application/x-ndjson``) no mesmo formato de fio emitido
+pelo stream. O NDJSON é lido linha a linha, sem carregar o corpo inteiro.
+
+Cada mensagem passa por um validador enxuto (tipos, tamanhos das colunas,
+valor e data) em vez de um serializer do DRF por objeto. As válidas são
+inseridas em comandos de várias linhas
+``INSERT ... ON CONFLICT (end_to_end_id) DO NOTHING RETURNING end_to_end_id, id, priority``,
+então duplicatas são descartadas pelo próprio índice único e o ``RETURNING``
+diz exatamente quais linhas entraram (os ids vão para o backend de fila). Ids
+já movidos para ``PixMessageArchive`` também contam como duplicatas. O JSON
+de cada mensagem (``payload``) é gerado aqui, uma vez.
+
+O resultado traz o status de cada item, na ordem recebida: ``created``,
+``duplicate`` ou ``invalid`` (com os erros por campo).
+"""
+import decimal
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metrics
+from .encoders import WIRE_FIELDS, StreamMessage, render_payload
+from .hotcache import remember
+from .models import PixMessage, PixMessageArchive
+from .notify import get_notifier
+from .queues import get_queue
+from .scheduler import message_priority
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+MEDIA_TYPES = (JSON, NDJSON)
+
+CREATED = "created"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+
+_VALOR_FIELD = PixMessage._meta.get_field("valor")
+_VALOR_QUANTUM = decimal.Decimal(1).scaleb(-_VALOR_FIELD.decimal_places)
+_VALOR_MAX_INTEGER_DIGITS = _VALOR_FIELD.max_digits - _VALOR_FIELD.decimal_places
+
+
+def _text_field(name, column):
+    """(chave no formato de fio, coluna, tamanho máximo)"""
+    return name, column, PixMessage._meta.get_field(column).max_length
+
+
+# Campos de texto de primeiro nível e de pagador/recebedor
+_TOP_FIELDS = (_text_field("endToEndId", "end_to_end_id"), _text_field("txId", "tx_id"))
+_PARTY_FIELDS = tuple(
+    (party, tuple(
+        _text_field(key, f"{party}_{suffix}")
+        for key, suffix in (
+            ("nome", "nome"),
+            ("cpfCnpj", "cpf_cnpj"),
+            ("ispb", "ispb"),
+            ("agencia", "agencia"),
+            ("contaTransacional", "conta"),
+            ("tipoConta", "tipo_conta"),
+        )
+    ))
+    for party in ("pagador", "recebedor")
+)
+
+# Colunas do INSERT, na ordem das tuplas devolvidas por validate_message
+COLUMNS = (
+    *(column for _, column, _ in _TOP_FIELDS),
+    *(column for _, fields in _PARTY_FIELDS for _, column, _ in fields),
+    "campo_livre",
+    "valor",
+    "data_pagamento",
+)
+_INSERT_COLUMNS = COLUMNS + ("claimed", "created_at", "priority", "payload")
+_RECEBEDOR_ISPB = COLUMNS.index("recebedor_ispb")
+# Posição em COLUMNS de cada campo de StreamMessage (o id ainda não existe)
+_WIRE_POSITIONS = tuple(COLUMNS.index(name) for name in WIRE_FIELDS[1:])
+
+_MISSING = object()
+# Linha de NDJSON que não é JSON válido
+MALFORMED = object()
+
+
+class InvalidPayload(ValueError):
+    """Corpo que não é um array JSON de mensagens"""
+
+
+class PayloadTooLarge(Exception):
+    """Corpo maior que o limite, contado durante a leitura"""
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def decode_items(stream, media_type, max_bytes=None):
+    """
+    Itens do corpo da requisição (objetos decodificados, MALFORMED para linhas
+    NDJSON inválidas). Levanta InvalidPayload se o array JSON for inválido
+
+    Com ``max_bytes``, os bytes são contados durante a leitura (o corpo pode
+    vir sem Content-Length) e PayloadTooLarge é levantada assim que o limite
+    é ultrapassado.
+    """
+    if stream is None:
+        return []
+    if media_type == NDJSON:
+        return _ndjson_items(_limited_lines(stream, max_bytes) if max_bytes is not None else stream)
+    body = stream.read() if max_bytes is None else stream.read(max_bytes + 1)
+    if max_bytes is not None and len(body) > max_bytes:
+        raise PayloadTooLarge()
+    try:
+        items = loads(body)
+    except ValueError:
+        raise InvalidPayload()
+    if not isinstance(items, list):
+        raise InvalidPayload()
+    return items
+
+
+def _limited_lines(stream, max_bytes):
+    # readline com tamanho: uma linha sem fim não é lida inteira para a memória
+    remaining = max_bytes
+    while True:
+        line = stream.readline(remaining + 1)
+        if not line:
+            return
+        remaining -= len(line)
+        if remaining < 0:
+            raise PayloadTooLarge()
+        yield line
+
+
+def _ndjson_items(stream):
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield loads(line)
+        except ValueError:
+            yield MALFORMED
+
+
+def _text_error(value, max_length):
+    """Mensagem de erro de um campo de texto obrigatório"""
+    if value is None or value == "":
+        return "Campo obrigatório."
+    if not isinstance(value, str):
+        return "Esperado um texto."
+    return f"Máximo de {max_length} caracteres."
+
+
+def _campo_livre(value):
+    if value is _MISSING or value is None:
+        return ""
+    if not isinstance(value, str):
+        raise ValueError("Esperado um texto.")
+    return value
+
+
+def _valor(value):
+    if value is _MISSING or value is None:
+        raise ValueError("Campo obrigatório.")
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError("Esperado um número decimal.")
+    try:
+        amount = decimal.Decimal(str(value).strip())
+    except decimal.InvalidOperation:
+        raise ValueError("Esperado um número decimal.")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError("Esperado um valor positivo.")
+    if amount.adjusted() >= _VALOR_MAX_INTEGER_DIGITS:
+        raise ValueError(f"Máximo de {_VALOR_MAX_INTEGER_DIGITS} dígitos antes da vírgula.")
+    if amount != amount.quantize(_VALOR_QUANTUM):
+        raise ValueError(f"Máximo de {_VALOR_FIELD.decimal_places} casas decimais.")
+    return amount.quantize(_VALOR_QUANTUM)
+
+
+def _data_hora(value):
+    if value is _MISSING or value is None:
+        raise ValueError("Campo obrigatório.")
+    if not isinstance(value, str):
+        raise ValueError("Esperado data e hora ISO 8601.")
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError("Esperado data e hora ISO 8601.")
+    # Sem fuso: fuso padrão, como o DateTimeField do DRF
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def validate_message(item):
+    """
+    Valida uma mensagem no formato de fio, sem serializers do DRF
+
+    Returns:
+        (tupla de valores na ordem de COLUMNS, None) ou (None, erros por campo)
+    """
+    if item is MALFORMED:
+        return None, {"non_field_errors": "JSON inválido."}
+    if not isinstance(item, dict):
+        return None, {"non_field_errors": "Esperado um objeto JSON."}
+
+    values = []
+    append = values.append
+    errors = {}
+    # Caminho comum (texto não vazio dentro do tamanho) sem chamadas de função
+    for name, _, max_length in _TOP_FIELDS:
+        value = item.get(name)
+        if value.__class__ is str and 0 < len(value) <= max_length:
+            append(value)
+        else:
+            errors[name] = _text_error(value, max_length)
+    for party, fields in _PARTY_FIELDS:
+        data = item.get(party)
+        if not isinstance(data, dict):
+            errors[party] = "Esperado um objeto."
+            continue
+        for name, _, max_length in fields:
+            value = data.get(name)
+            if value.__class__ is str and 0 < len(value) <= max_length:
+                append(value)
+            else:
+                errors[f"{party}.{name}"] = _text_error(value, max_length)
+    for name, parse in (
+        ("campoLivre", _campo_livre),
+        ("valor", _valor),
+        ("dataHoraPagamento", _data_hora),
+    ):
+        try:
+            append(parse(item.get(name, _MISSING)))
+        except ValueError as exc:
+            errors[name] = str(exc)
+
+    if errors:
+        return None, errors
+    return tuple(values), None
+
+
+def _insert_sql(rows):
+    qn = connection.ops.quote_name
+    row_sql = "(" + ", ".join(["%s"] * len(_INSERT_COLUMNS)) + ")"
+    return (
+        f"INSERT INTO {qn(PixMessage._meta.db_table)} ({', '.join(qn(column) for column in _INSERT_COLUMNS)})"
+        f" VALUES {', '.join([row_sql] * rows)}"
+        f" ON CONFLICT ({qn('end_to_end_id')}) DO NOTHING"
+        f" RETURNING {qn('end_to_end_id')}, {qn('id')}, {qn('priority')}"
+    )
+
+
+def _insert_chunk(chunk, created_at):
+    """
+    Insere as linhas que ainda não existem
+
+    Retorna {end_to_end_id: (id, prioridade, payload)} das inseridas.
+    """
+    ids = [values[0] for values in chunk]
+    archived = set(PixMessageArchive.objects.filter(end_to_end_id__in=ids).values_list("end_to_end_id", flat=True))
+    ops = connection.ops
+    rows = []
+    for values in chunk:
+        if values[0] in archived:
+            continue
+        *texts, valor, data_pagamento = values
+        rows.append((
+            *texts,
+            ops.adapt_decimalfield_value(valor, _VALOR_FIELD.max_digits, _VALOR_FIELD.decimal_places),
+            ops.adapt_datetimefield_value(data_pagamento),
+            False,
+            created_at,
+            message_priority(valor),
+            render_payload(StreamMessage(None, *[values[position] for position in _WIRE_POSITIONS])),
+        ))
+
+    # Linhas por comando dentro do limite de parâmetros do banco (SQLite)
+    fields = [PixMessage._meta.get_field(column) for column in _INSERT_COLUMNS]
+    statement_rows = max(1, ops.bulk_batch_size(fields, rows))
+    payloads = {row[0]: row[-1] for row in rows}
+    inserted = {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), statement_rows):
+            statement = rows[start:start + statement_rows]
+            cursor.execute(_insert_sql(len(statement)), [value for row in statement for value in row])
+            inserted.update(
+                (end_to_end_id, (pk, priority, payloads[end_to_end_id]))
+                for end_to_end_id, pk, priority in cursor.fetchall()
+            )
+    return inserted
+
+
+def ingest_messages(items):
+    """
+    Valida e insere mensagens, com o resultado de cada item
+
+    Args:
+        items: Iterável de objetos decodificados (ver decode_items)
+
+    Returns:
+        Resumo com as contagens por status e ``results`` na ordem recebida
+    """
+    results = []
+    pending = []  # (posição em results, valores)
+    seen = set()
+    ids_by_ispb = defaultdict(list)
+    priority_ids_by_ispb = defaultdict(list)
+    payloads_by_ispb = defaultdict(list)
+    chunk_size = settings.PIX_INGEST_CHUNK_SIZE
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    def flush():
+        inserted = _insert_chunk([values for _, values in pending], created_at)
+        for index, values in pending:
+            if values[0] in inserted:
+                pk, priority, payload = inserted[values[0]]
+                ids_by_ispb[values[_RECEBEDOR_ISPB]].append(pk)
+                payloads_by_ispb[values[_RECEBEDOR_ISPB]].append((pk, payload))
+                if priority:
+                    priority_ids_by_ispb[values[_RECEBEDOR_ISPB]].append(pk)
+            else:
+                results[index]["status"] = DUPLICATE
+        pending.clear()
+
+    with transaction.atomic():
+        for item in items:
+            values, errors = validate_message(item)
+            index = len(results)
+            if errors:
+                end_to_end_id = item.get("endToEndId") if isinstance(item, dict) else None
+                results.append({"index": index, "endToEndId": end_to_end_id, "status": INVALID, "errors": errors})
+                continue
+            end_to_end_id = values[0]
+            if end_to_end_id in seen:
+                results.append({"index": index, "endToEndId": end_to_end_id, "status": DUPLICATE})
+                continue
+            seen.add(end_to_end_id)
+            results.append({"index": index, "endToEndId": end_to_end_id, "status": CREATED})
+            pending.append((index, values))
+            if len(pending) >= chunk_size:
+                flush()
+        if pending:
+            flush()
+        queue = get_queue()
+        for ispb, ids in ids_by_ispb.items():
+            queue.publish(ispb, ids, priority_ids_by_ispb.get(ispb, ()))
+            remember(ispb, payloads_by_ispb[ispb])
+
+    # Acordar coletores em long polling nos ISPBs que receberam mensagens
+    notifier = get_notifier()
+    for ispb in ids_by_ispb:
+        notifier.notify(ispb)
+
+    counts = {CREATED: 0, DUPLICATE: 0, INVALID: 0}
+    for result in results:
+        counts[result["status"]] += 1
+    for status, count in counts.items():
+        metrics.INGESTED_MESSAGES[status].inc(count)
+    return {
+        "received": len(results),
+        "created": counts[CREATED],
+        "duplicates": counts[DUPLICATE],
+        "invalid": counts[INVALID],
+        "results": results,
+    }
@@ -0,0 +1,184 @@
+"""
+Cliente de carga da API de stream (só biblioteca padrão).
+
+Roda K coletores concorrentes que fazem o ciclo completo de um coletor real:
+``stream/start``, segue o ``Pull-Next`` até um pull voltar vazio (204) e
+finaliza com ``DELETE``. Cada coletor usa um ISPB da lista (em rodízio) e o
+``Accept`` pedido (``application/json`` ou ``multipart/json``).
+
+O resultado traz requisições e mensagens por segundo, latência dos pulls (p50/p99),
+mensagens entregues mais de uma vez e, quando o transporte sabe contar
+(``bench_streams`` em processo), comandos SQL por pull.
+
+Uso direto contra um servidor em execução:
+
+    python -m streaming.loadclient --url http://localhost:8000 \\
+        --ispbs 32074986,12345678 --collectors 8 --accept multipart/json
+"""
+import argparse
+import collections
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+ACCEPT_TYPES = {"json": "application/json", "multipart": "multipart/json"}
+
+
+def percentile(samples, fraction):
+    """Percentil por vizinho mais próximo de uma lista de amostras"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class HttpTransport:
+    """Transporte HTTP com uma conexão keep-alive por coletor"""
+
+    def __init__(self, base_url):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.local = threading.local()
+
+    def _connection(self):
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = self.connection_class(self.host, self.port, timeout=120)
+        return self.local.connection
+
+    def request(self, method, path, accept):
+        """Retorna (status, cabeçalhos, corpo, comandos SQL ou None)"""
+        connection = self._connection()
+        try:
+            connection.request(method, path, headers={"Accept": accept})
+            response = connection.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            # Conexão derrubada pelo servidor: uma nova tentativa com outra conexão
+            connection.close()
+            self.local.connection = None
+            connection = self._connection()
+            connection.request(method, path, headers={"Accept": accept})
+            response = connection.getresponse()
+            body = response.read()
+        return response.status, {key.lower(): value for key, value in response.getheaders()}, body, None
+
+    def close(self):
+        if getattr(self.local, "connection", None) is not None:
+            self.local.connection.close()
+            self.local.connection = None
+
+
+class _Collector(threading.Thread):
+    def __init__(self, run, ispb):
+        super().__init__(daemon=True)
+        self.run_state = run
+        self.ispb = ispb
+        self.error = None
+
+    def run(self):
+        try:
+            self.run_state.collect(self.ispb)
+        except Exception as exc:  # reportado no resultado
+            self.error = repr(exc)
+        finally:
+            self.run_state.transport.close()
+
+
+class LoadRun:
+    """Uma rodada de carga: K coletores sobre uma lista de ISPBs"""
+
+    def __init__(self, transport, ispbs, collectors, accept, batch=None):
+        self.transport = transport
+        self.ispbs = list(ispbs)
+        self.collectors = collectors
+        self.accept = ACCEPT_TYPES.get(accept, accept)
+        self.query = f"?batch={batch}" if batch else ""
+        self.lock = threading.Lock()
+        self.deliveries = collections.Counter()
+        self.latencies = []
+        self.queries = []
+        self.statuses = collections.Counter()
+
+    def _pull(self, path):
+        started = time.perf_counter()
+        status, headers, body, queries = self.transport.request("GET", path + self.query, self.accept)
+        elapsed = time.perf_counter() - started
+        delivered = []
+        if status == 200:
+            data = json.loads(body)
+            delivered = [message["endToEndId"] for message in (data if isinstance(data, list) else [data])]
+        with self.lock:
+            self.statuses[status] += 1
+            if status in (200, 204):
+                self.latencies.append(elapsed)
+                if queries is not None:
+                    self.queries.append(queries)
+            self.deliveries.update(delivered)
+        return status, headers.get("pull-next")
+
+    def collect(self, ispb):
+        status, pull_next = self._pull(f"/api/pix/{ispb}/stream/start")
+        while status == 200 and pull_next:
+            last = pull_next
+            status, pull_next = self._pull(pull_next)
+            pull_next = pull_next or last
+        if pull_next:
+            status, _, _, _ = self.transport.request("DELETE", pull_next, self.accept)
+            with self.lock:
+                self.statuses[status] += 1
+
+    def run(self):
+        threads = [_Collector(self, self.ispbs[index % len(self.ispbs)]) for index in range(self.collectors)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        delivered = sum(self.deliveries.values())
+        return {
+            "accept": self.accept,
+            "collectors": self.collectors,
+            "ispbs": len(self.ispbs),
+            "seconds": round(elapsed, 3),
+            "messages_delivered": delivered,
+            "unique_messages": len(self.deliveries),
+            "duplicates": delivered - len(self.deliveries),
+            "messages_per_second": round(delivered / elapsed, 1) if elapsed else None,
+            "pulls": len(self.latencies),
+            "requests_per_second": round(sum(self.statuses.values()) / elapsed, 1) if elapsed else None,
+            "pull_latency_ms": {
+                "p50": _ms(percentile(self.latencies, 0.5)),
+                "p99": _ms(percentile(self.latencies, 0.99)),
+            },
+            "queries_per_pull": round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+            "status_counts": {str(code): count for code, count in sorted(self.statuses.items())},
+            "errors": [thread.error for thread in threads if thread.error],
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Coletores concorrentes contra a API de stream Pix")
+    parser.add_argument("--url", default="http://localhost:8000", help="Endereço do servidor")
+    parser.add_argument("--ispbs", required=True, help="ISPBs separados por vírgula")
+    parser.add_argument("--collectors", type=int, default=4, help="Coletores concorrentes")
+    parser.add_argument("--accept", default="multipart", help="json, multipart ou um media type")
+    parser.add_argument("--batch", type=int, default=None, help="?batch=N nos pulls")
+    args = parser.parse_args(argv)
+
+    transport = HttpTransport(args.url)
+    result = LoadRun(transport, args.ispbs.split(","), args.collectors, args.accept, args.batch).run()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Utilitários compartilhados pelos comandos de benchmark"""
+import sys
+from io import BytesIO
+
+from streaming.loadclient import percentile  # noqa: F401 - reexportado para os comandos
+
+BENCH_ISPB_PREFIX = "B"
+
+
+def bench_ispb(index):
+    """ISPB sintético usado pelos benchmarks (nunca colide com um ISPB real)"""
+    return f"{BENCH_ISPB_PREFIX}{index:07d}"
+
+
+def wsgi_environ(method, path, accept):
+    """Environ WSGI mínimo de uma requisição sem corpo (caminho com query string)"""
+    path, _, query = path.partition("?")
+    return {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "8000",
+        "HTTP_HOST": "localhost",
+        "HTTP_ACCEPT": accept,
+        "wsgi.input": BytesIO(),
+        "wsgi.url_scheme": "http",
+        "wsgi.errors": sys.stderr,
+    }
+
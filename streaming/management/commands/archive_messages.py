@@ -0,0 +1,32 @@
+"""
+Move mensagens confirmadas há mais de N horas da tabela quente para
+``PixMessageArchive``, em lotes.
+
+    python manage.py archive_messages --older-than-hours 24 --batch-size 5000 --prune-sessions
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from streaming.archive import archive_messages, prune_sessions
+
+
+class Command(BaseCommand):
+    help = "Arquiva mensagens Pix confirmadas para manter a tabela quente pequena"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-hours", type=float, default=None,
+                            help="Horas desde a confirmação da entrega (padrão PIX_ARCHIVE_AFTER_HOURS)")
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Mensagens movidas por comando (padrão PIX_ARCHIVE_BATCH_SIZE)")
+        parser.add_argument("--prune-sessions", action="store_true",
+                            help="Remove também sessões encerradas sem mensagens na tabela quente")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = {"archived": archive_messages(options["older_than_hours"], options["batch_size"])}
+        if options["prune_sessions"]:
+            result["pruned_sessions"] = prune_sessions(options["older_than_hours"])
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        self.stdout.write(json.dumps(result))
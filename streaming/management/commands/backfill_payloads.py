@@ -0,0 +1,25 @@
+"""
+Grava o JSON pré-codificado (``PixMessage.payload``) das mensagens antigas,
+em lotes. Com ``--all`` regrava todas (depois de mudar ``TIME_ZONE``).
+
+    python manage.py backfill_payloads --batch-size 1000
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from streaming.encoders import backfill_payloads
+
+
+class Command(BaseCommand):
+    help = "Preenche o payload pré-codificado das mensagens Pix sem payload"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Mensagens gravadas por lote")
+        parser.add_argument("--all", action="store_true", help="Regrava também as que já têm payload")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = backfill_payloads(options["batch_size"], rewrite=options["all"])
+        self.stdout.write(json.dumps({"written": written, "seconds": round(time.perf_counter() - started, 3)}))
@@ -0,0 +1,82 @@
+"""
+Microbenchmark: compressão dos lotes ``multipart/json`` por codificação.
+
+Para cada tamanho de lote, mede os bytes na rede (e a razão sobre o corpo sem
+compressão) e o tempo de CPU por mensagem para comprimir (servidor) e
+descomprimir (coletor) com ``gzip``, ``zstd`` e ``br`` nos níveis usados por
+``streaming/compression.py``. Codificações sem o pacote instalado ficam de
+fora. Sem banco (mensagens em memória).
+
+    python manage.py bench_compression --sizes 10,100,1000
+"""
+import json
+import time
+import zlib
+
+from django.core.management.base import BaseCommand
+
+from streaming import compression, encoders
+from streaming.generators import PixMessageFactory
+
+
+def _decompressors():
+    decompressors = {"gzip": lambda data: zlib.decompress(data, 31)}
+    if compression.zstandard is not None:
+        decompressors["zstd"] = lambda data: compression.zstandard.ZstdDecompressor().decompress(data)
+    if compression.brotli is not None:
+        decompressors["br"] = compression.brotli.decompress
+    return decompressors
+
+
+def _cpu_per_call(func, data, minimum):
+    """Tempo de CPU por chamada, repetindo até ``minimum`` segundos"""
+    calls = 0
+    started = time.process_time()
+    while True:
+        func(data)
+        calls += 1
+        elapsed = time.process_time() - started
+        if elapsed >= minimum:
+            return elapsed / calls
+
+
+class Command(BaseCommand):
+    help = "Mede bytes na rede e CPU por mensagem de gzip, zstd e br nos lotes multipart/json"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10,50,100,500,1000", help="Tamanhos de lote, separados por vírgula")
+        parser.add_argument("--seconds", type=float, default=0.5, help="CPU mínima por medição")
+
+    def handle(self, *args, **options):
+        decompressors = _decompressors()
+        results = []
+        for size in (int(value) for value in options["sizes"].split(",")):
+            instances = PixMessageFactory(seed=size).build("12345678", size)
+            for pk, instance in enumerate(instances, start=1):
+                instance.id = pk
+            body = encoders.encode_batch([
+                encoders.StoredMessage(instance.id, encoders.instance_payload(instance)) for instance in instances
+            ])
+
+            encodings = {"identity": {"bytes": len(body), "bytes_per_message": round(len(body) / size, 1)}}
+            for name, decompress in decompressors.items():
+                compress, _ = compression.CODECS[name]
+                compressed = compress(body)
+                assert decompress(compressed) == body
+                encodings[name] = {
+                    "bytes": len(compressed),
+                    "bytes_per_message": round(len(compressed) / size, 1),
+                    "ratio": round(len(compressed) / len(body), 3),
+                    "compress_us_per_message": round(
+                        _cpu_per_call(compress, body, options["seconds"]) / size * 1e6, 2
+                    ),
+                    "decompress_us_per_message": round(
+                        _cpu_per_call(decompress, compressed, options["seconds"]) / size * 1e6, 2
+                    ),
+                }
+            results.append({"batch": size, "encodings": encodings})
+
+        self.stdout.write(json.dumps({
+            "levels": {"gzip": compression.GZIP_LEVEL, "zstd": compression.ZSTD_LEVEL, "br": compression.BROTLI_QUALITY},
+            "results": results,
+        }, indent=2))
@@ -0,0 +1,188 @@
+"""
+Benchmark: quantos long pollings ociosos um processo mantém parados ao mesmo
+tempo sob WSGI (views síncronas, uma thread por requisição) e sob ASGI
+(views assíncronas, espera no event loop).
+
+Cada modo roda em um subprocesso próprio com N requisições ``stream/start``
+simultâneas em ISPBs sem mensagens, e reporta o pico de pollers parados, o
+pico de threads, o tempo total e a memória máxima (RSS).
+
+    python manage.py bench_idle_streams --streams 2000 --timeout 2 --wsgi-threads 64
+"""
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ._bench import BENCH_ISPB_PREFIX, bench_ispb
+
+
+class _Sampler(threading.Thread):
+    """Amostra periodicamente pollers parados e threads vivas"""
+
+    def __init__(self, notifier):
+        super().__init__(daemon=True)
+        self.notifier = notifier
+        self.parked_peak = 0
+        self.threads_peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(0.02):
+            self.parked_peak = max(self.parked_peak, self.notifier.waiting())
+            self.threads_peak = max(self.threads_peak, threading.active_count())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _run_wsgi(streams, threads):
+    from pixstream.wsgi import application
+
+    def call(index):
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": f"/api/pix/{bench_ispb(index)}/stream/start",
+            "QUERY_STRING": "",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "8000",
+            "HTTP_HOST": "localhost",
+            "HTTP_ACCEPT": "application/json",
+            "wsgi.input": BytesIO(),
+            "wsgi.url_scheme": "http",
+            "wsgi.errors": sys.stderr,
+        }
+        statuses = []
+        body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+        b"".join(body)
+        if hasattr(body, "close"):
+            body.close()
+        return int(statuses[0].split()[0])
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(call, range(streams)))
+
+
+def _run_asgi(streams):
+    from pixstream.asgi import application
+
+    async def call(index):
+        disconnected = asyncio.Event()
+        sent = {}
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                sent["status"] = message["status"]
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/api/pix/{bench_ispb(index)}/stream/start",
+            "raw_path": b"",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"localhost"), (b"accept", b"application/json")],
+            "client": ("127.0.0.1", 0),
+            "server": ("localhost", 8000),
+        }
+        await application(scope, receive, send)
+        disconnected.set()
+        return sent.get("status")
+
+    async def main():
+        return await asyncio.gather(*(call(index) for index in range(streams)))
+
+    return asyncio.run(main())
+
+
+class Command(BaseCommand):
+    help = "Compara o número máximo de long pollings ociosos simultâneos sob WSGI e ASGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--streams", type=int, default=1000, help="Requisições ociosas simultâneas")
+        parser.add_argument("--timeout", type=float, default=2.0, help="Timeout do long polling (s)")
+        parser.add_argument("--wsgi-threads", type=int, default=64, help="Threads do servidor WSGI simulado")
+        parser.add_argument("--mode", choices=["wsgi", "asgi"], help="Executa apenas um modo (uso interno)")
+
+    def handle(self, *args, **options):
+        if options["mode"]:
+            result = self._run_mode(options)
+            self.stdout.write(json.dumps(result))
+            return
+
+        results = {}
+        for mode in ("wsgi", "asgi"):
+            env = dict(
+                os.environ,
+                PIX_STREAM_ASYNC_VIEWS="1" if mode == "asgi" else "0",
+                PIX_STREAM_LONG_POLL_TIMEOUT=str(options["timeout"]),
+            )
+            completed = subprocess.run(
+                [
+                    sys.executable, str(settings.BASE_DIR / "manage.py"), "bench_idle_streams",
+                    "--mode", mode,
+                    "--streams", str(options["streams"]),
+                    "--timeout", str(options["timeout"]),
+                    "--wsgi-threads", str(options["wsgi_threads"]),
+                ],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if completed.returncode != 0:
+                raise CommandError(f"Modo {mode} falhou:\n{completed.stderr}")
+            results[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def _run_mode(self, options):
+        from streaming.models import StreamSession
+        from streaming.notify import get_notifier
+
+        mode, streams = options["mode"], options["streams"]
+        sampler = _Sampler(get_notifier())
+        sampler.start()
+        started = time.monotonic()
+        try:
+            if mode == "wsgi":
+                statuses = _run_wsgi(streams, options["wsgi_threads"])
+            else:
+                statuses = _run_asgi(streams)
+        finally:
+            elapsed = time.monotonic() - started
+            sampler.stop()
+            StreamSession.objects.filter(ispb__startswith=BENCH_ISPB_PREFIX).delete()
+
+        return {
+            "mode": mode,
+            "streams": streams,
+            "long_poll_timeout_s": options["timeout"],
+            "wsgi_threads": options["wsgi_threads"] if mode == "wsgi" else None,
+            "max_parked_streams": sampler.parked_peak,
+            "peak_threads": sampler.threads_peak,
+            "elapsed_s": round(elapsed, 3),
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "status_counts": {str(code): statuses.count(code) for code in sorted(set(statuses), key=str)},
+        }
@@ -0,0 +1,68 @@
+"""
+Benchmark: vazão da ingestão em massa (``POST /api/pix/messages``).
+
+Monta ``--messages`` mensagens no formato de fio, envia em requisições de
+``--request-size`` mensagens pelo cliente de teste do Django (sem rede) em
+JSON e NDJSON e mede mensagens por segundo, incluindo a decodificação, a
+validação e os INSERTs. Uma segunda rodada reenvia as mesmas mensagens para
+medir o caminho de duplicatas.
+
+    python manage.py bench_ingest --messages 100000 --request-size 10000
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from streaming.encoders import message_from_instance, message_to_dict
+from streaming.generators import PixMessageFactory
+from streaming.ingestion import orjson
+from streaming.models import PixMessage
+
+from ._bench import bench_ispb
+
+
+def _body(messages, media_type):
+    if media_type == "application/x-ndjson":
+        return "".join(json.dumps(message) + "\n" for message in messages)
+    return json.dumps(messages)
+
+
+class Command(BaseCommand):
+    help = "Mede a vazão da ingestão em massa de mensagens Pix"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=100000, help="Mensagens por formato")
+        parser.add_argument("--request-size", type=int, default=10000, help="Mensagens por requisição")
+
+    def handle(self, *args, **options):
+        ispb = bench_ispb(8)
+        client = Client()
+        results = []
+        try:
+            for media_type in ("application/json", "application/x-ndjson"):
+                PixMessage.objects.filter(recebedor_ispb=ispb).delete()
+                messages = [
+                    message_to_dict(message_from_instance(instance))
+                    for instance in PixMessageFactory(seed=len(media_type)).build(ispb, options["messages"])
+                ]
+                size = options["request_size"]
+                bodies = [_body(messages[start:start + size], media_type) for start in range(0, len(messages), size)]
+
+                timings = {}
+                for phase in ("insert", "duplicates"):
+                    started = time.perf_counter()
+                    for body in bodies:
+                        response = client.generic(
+                            "POST", "/api/pix/messages", body, content_type=media_type, HTTP_HOST="localhost"
+                        )
+                        assert response.status_code == 200, response.content
+                    elapsed = time.perf_counter() - started
+                    timings[phase] = round(len(messages) / elapsed)
+
+                results.append({"media_type": media_type, "messages_per_second": timings})
+        finally:
+            PixMessage.objects.filter(recebedor_ispb=ispb).delete()
+
+        self.stdout.write(json.dumps({"orjson": orjson is not None, "results": results}, indent=2))
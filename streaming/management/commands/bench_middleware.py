@@ -0,0 +1,76 @@
+"""
+Microbenchmark: custo por requisição da pilha completa de middlewares contra
+o perfil enxuto das rotas /api/pix/ (``streaming/handlers.py``).
+
+As requisições passam pelos handlers WSGI dentro do processo, sem rede. Os
+casos padrão não consultam o banco (resposta 400 por ``?batch=`` inválido e
+406 por ``Accept`` não suportado), então a diferença é só o framework:
+middlewares, URLconf e o ``initial()`` do DRF. O caso ``delete`` finaliza um
+stream inexistente (um comando SQL). Rode com ``DEBUG=False``.
+
+    python manage.py bench_middleware --requests 5000
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+
+from streaming.handlers import LeanWSGIHandler
+
+from ._bench import wsgi_environ
+
+CASES = {
+    "invalid_batch": ("GET", "/api/pix/12345678/stream/start?batch=abc", "multipart/json"),
+    "not_acceptable": ("GET", "/api/pix/12345678/stream/start", "text/html"),
+    "delete": ("DELETE", "/api/pix/12345678/stream/inexistente", "application/json"),
+}
+
+
+def _timed(handler, method, path, accept, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        result = handler(wsgi_environ(method, path, accept), lambda status, headers, exc_info=None: None)
+        b"".join(result)
+        result.close()
+    return time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = "Compara o custo por requisição da pilha completa de middlewares com o perfil enxuto"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=5000, help="Requisições por medição")
+        parser.add_argument("--repeat", type=int, default=7, help="Repetições (vale a melhor)")
+        parser.add_argument("--cases", default=",".join(CASES), help="Casos, separados por vírgula")
+
+    def handle(self, *args, **options):
+        handlers = {"full": WSGIHandler(), "lean": LeanWSGIHandler()}
+        number = options["requests"]
+        results = []
+        # As respostas 4xx dos casos seriam registradas no log a cada requisição
+        logging.disable(logging.WARNING)
+        try:
+            for case in options["cases"].split(","):
+                method, path, accept = CASES[case]
+                for handler in handlers.values():
+                    _timed(handler, method, path, accept, min(number, 200))
+                # Medições alternadas entre os handlers: a variação da máquina afeta os dois
+                best = {name: float("inf") for name in handlers}
+                for _ in range(options["repeat"]):
+                    for name, handler in handlers.items():
+                        best[name] = min(best[name], _timed(handler, method, path, accept, number))
+                timings = {name: round(seconds / number * 1e6, 1) for name, seconds in best.items()}
+                timings["saved"] = round(timings["full"] - timings["lean"], 1)
+                results.append({"case": case, "us_per_request": timings})
+        finally:
+            logging.disable(logging.NOTSET)
+
+        self.stdout.write(json.dumps({
+            "debug": settings.DEBUG,
+            "middleware": len(settings.MIDDLEWARE),
+            "api_middleware": len(settings.PIX_API_MIDDLEWARE),
+            "results": results,
+        }, indent=2))
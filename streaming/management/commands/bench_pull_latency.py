@@ -0,0 +1,116 @@
+"""
+Benchmark: latência do claim (pull) conforme cresce o histórico de mensagens
+já entregues.
+
+Para cada tamanho de histórico, mensagens entregues são criadas até atingir o
+total pedido, um backlog novo é inserido e ``--pulls`` claims de ``--batch``
+mensagens são cronometrados, enquanto ``--other-backlog`` mensagens de outros
+ISPBs aguardam na fila. Com o índice parcial da fila
+(``pixmsg_unclaimed_queue_idx``) a latência deve ficar estável; com
+``--compare-without-index`` a mesma medição é repetida sem o índice.
+
+    python manage.py bench_pull_latency --history 0,50000,200000 --compare-without-index
+"""
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from streaming.claims import _claim_sql, claim_messages
+from streaming.generators import generate_messages
+from streaming.models import PixMessage, StreamSession
+
+from ._bench import bench_ispb, percentile
+
+QUEUE_INDEX_NAME = "pixmsg_unclaimed_queue_idx"
+
+
+def _queue_index():
+    return next(index for index in PixMessage._meta.indexes if index.name == QUEUE_INDEX_NAME)
+
+
+class Command(BaseCommand):
+    help = "Mede a latência do claim conforme cresce o histórico de mensagens entregues"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--history", default="0,20000,100000",
+                            help="Tamanhos do histórico entregue, separados por vírgula")
+        parser.add_argument("--pulls", type=int, default=200, help="Claims cronometrados por etapa")
+        parser.add_argument("--batch", type=int, default=10, help="Mensagens por claim")
+        parser.add_argument("--other-backlog", type=int, default=20000,
+                            help="Mensagens não entregues de outros ISPBs na fila")
+        parser.add_argument("--compare-without-index", action="store_true",
+                            help="Repete cada etapa sem o índice parcial da fila")
+        parser.add_argument("--keep", action="store_true", help="Não apaga os dados do benchmark ao final")
+
+    def handle(self, *args, **options):
+        ispb, other_ispb = bench_ispb(6), bench_ispb(7)
+        history_sizes = sorted(int(size) for size in options["history"].split(","))
+        session = StreamSession.objects.create(ispb=ispb)
+        results = []
+        plans = {}
+        try:
+            generate_messages(other_ispb, options["other_backlog"])
+            plans["with_index"] = self._plan(ispb, session, options["batch"])
+            for target in history_sizes:
+                self._grow_history(ispb, session, target)
+                step = {"history_rows": self._history(ispb), "with_index": self._measure(ispb, session, options)}
+                if options["compare_without_index"]:
+                    with connection.schema_editor() as editor:
+                        editor.remove_index(PixMessage, _queue_index())
+                    try:
+                        plans["without_index"] = self._plan(ispb, session, options["batch"])
+                        step["without_index"] = self._measure(ispb, session, options)
+                    finally:
+                        with connection.schema_editor() as editor:
+                            editor.add_index(PixMessage, _queue_index())
+                results.append(step)
+                self.stderr.write(f"histórico {step['history_rows']}: {step['with_index']}")
+        finally:
+            if not options["keep"]:
+                PixMessage.objects.filter(recebedor_ispb__in=[ispb, other_ispb]).delete()
+                StreamSession.objects.filter(ispb=ispb).delete()
+
+        self.stdout.write(json.dumps({
+            "vendor": connection.vendor,
+            "pulls_per_step": options["pulls"],
+            "batch": options["batch"],
+            "other_backlog": options["other_backlog"],
+            "query_plan": plans,
+            "steps": results,
+        }, indent=2))
+
+    def _history(self, ispb):
+        return PixMessage.objects.filter(recebedor_ispb=ispb, claimed_by_stream__isnull=False).count()
+
+    def _grow_history(self, ispb, session, target):
+        missing = target - self._history(ispb)
+        if missing > 0:
+            generate_messages(ispb, missing)
+            PixMessage.objects.filter(recebedor_ispb=ispb, claimed_by_stream__isnull=True).update(
+                claimed_by_stream=session, claimed=True
+            )
+
+    def _measure(self, ispb, session, options):
+        generate_messages(ispb, options["pulls"] * options["batch"])
+        samples = []
+        for _ in range(options["pulls"]):
+            started = time.perf_counter()
+            claim_messages(ispb, session, options["batch"])
+            samples.append((time.perf_counter() - started) * 1000)
+        return {
+            "p50_ms": round(percentile(samples, 0.50), 3),
+            "p99_ms": round(percentile(samples, 0.99), 3),
+            "max_ms": round(max(samples), 3),
+        }
+
+    def _plan(self, ispb, session, batch):
+        sql = _claim_sql(connection.features.has_select_for_update_skip_locked, after_cursor=False)
+        explain = "EXPLAIN QUERY PLAN" if connection.vendor == "sqlite" else "EXPLAIN"
+        session_id = PixMessage._meta.get_field("claimed_by_stream").get_db_prep_value(session.pk, connection)
+        visible_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(f"{explain} {sql}", [session_id, True, visible_at, ispb, batch])
+            return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
@@ -0,0 +1,87 @@
+"""
+Microbenchmark: codificação de lotes de mensagens pelo ``PixMessageSerializer``
+(caminho original), pelo codificador de ``streaming/encoders.py`` a cada pull
+(``render``, como nas linhas sem payload) e a partir dos payloads gravados na
+inserção (``stored``, o caminho atual; a junção sem decodificar com
+``PIX_STREAM_COMPACT_BATCH_JSON=1``).
+
+Mede microssegundos por mensagem para lotes de 1, 10 e 1000 mensagens nos
+dois formatos de resposta, sem banco (instâncias em memória).
+
+    python manage.py bench_serializer --sizes 1,10,1000
+"""
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from streaming import encoders
+from streaming.generators import PixMessageFactory
+from streaming.serializers import PixMessageSerializer
+
+
+def _serializer_single(instances, rows, stored):
+    return JSONRenderer().render(PixMessageSerializer(instances, many=True).data[0])
+
+
+def _serializer_batch(instances, rows, stored):
+    return json.dumps(PixMessageSerializer(instances, many=True).data).encode("utf-8")
+
+
+def _render_single(instances, rows, stored):
+    return encoders.render_payload(rows[0])
+
+
+def _render_batch(instances, rows, stored):
+    return encoders.encode_batch([encoders.StoredMessage(row.id, encoders.render_payload(row)) for row in rows])
+
+
+def _stored_single(instances, rows, stored):
+    return encoders.encode_single(stored[0])
+
+
+def _stored_batch(instances, rows, stored):
+    return encoders.encode_batch(stored)
+
+
+CASES = {
+    "serializer_application_json": _serializer_single,
+    "render_application_json": _render_single,
+    "stored_application_json": _stored_single,
+    "serializer_multipart_json": _serializer_batch,
+    "render_multipart_json": _render_batch,
+    "stored_multipart_json": _stored_batch,
+}
+
+
+class Command(BaseCommand):
+    help = "Compara PixMessageSerializer, o codificador por pull e os payloads gravados"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1,10,1000", help="Tamanhos de lote, separados por vírgula")
+        parser.add_argument("--repeat", type=int, default=5, help="Repetições (vale a melhor)")
+        parser.add_argument("--messages", type=int, default=20000, help="Mensagens codificadas por medição")
+
+    def handle(self, *args, **options):
+        results = []
+        for size in (int(value) for value in options["sizes"].split(",")):
+            instances = PixMessageFactory(seed=size).build("12345678", size)
+            for pk, instance in enumerate(instances, start=1):
+                instance.id = pk
+            rows = [encoders.message_from_instance(instance) for instance in instances]
+            stored = [encoders.StoredMessage(row.id, encoders.render_payload(row)) for row in rows]
+            number = max(1, options["messages"] // size)
+
+            timings = {}
+            for name, case in CASES.items():
+                if name.endswith("application_json") and size != 1:
+                    continue
+                best = min(timeit.repeat(
+                    lambda: case(instances, rows, stored), number=number, repeat=options["repeat"]
+                ))
+                timings[name] = round(best / (number * size) * 1e6, 3)
+
+            results.append({"batch": size, "us_per_message": timings})
+
+        self.stdout.write(json.dumps({"orjson": encoders.orjson is not None, "results": results}, indent=2))
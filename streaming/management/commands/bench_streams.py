@@ -0,0 +1,154 @@
+"""
+Benchmark de carga reproduzível da API de stream.
+
+Semeia ``--messages`` mensagens (com ``--seed``) distribuídas entre
+``--ispbs`` ISPBs sintéticos e roda ``--collectors`` coletores concorrentes
+(``streaming/loadclient.py``) pelo ciclo start, continue e delete, uma vez
+para cada ``--accept``. Reporta em JSON mensagens por segundo, p50/p99 dos
+pulls, duplicatas, mensagens não entregues e comandos SQL por pull.
+
+Por padrão as requisições passam pela aplicação WSGI dentro do processo (sem
+rede), contando os comandos SQL de cada pull. Com ``--url`` o mesmo cliente
+usa HTTP contra um servidor em execução que aponte para o mesmo banco.
+
+Com ``--output`` o resultado é gravado para comparação; com ``--baseline``
+o resultado é comparado a uma rodada anterior e o comando falha se a vazão
+cair ou o p99 subir mais que ``--tolerance``.
+
+    python manage.py bench_streams --messages 20000 --ispbs 4 --collectors 8 --output run.json
+    python manage.py bench_streams --messages 20000 --ispbs 4 --collectors 8 --baseline run.json
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from streaming.admission import recount_sessions
+from streaming.generators import generate_messages
+from streaming.loadclient import ACCEPT_TYPES, HttpTransport, LoadRun
+from streaming.models import PixMessage, StreamSession
+from streaming.queues import get_queue
+
+from ._bench import bench_ispb, wsgi_environ
+
+
+class WsgiTransport:
+    """Transporte em processo pela aplicação WSGI, contando comandos SQL"""
+
+    def __init__(self):
+        from pixstream.wsgi import application
+
+        self.application = application
+
+    def request(self, method, path, accept):
+        environ = wsgi_environ(method, path, accept)
+        started = []
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            result = self.application(environ, lambda status, headers, exc_info=None: started.append((status, headers)))
+            try:
+                body = b"".join(result)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+        status, headers = started[0]
+        return int(status.split()[0]), {key.lower(): value for key, value in headers}, body, queries
+
+    def close(self):
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Benchmark de carga: coletores concorrentes pelo ciclo completo do stream"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=10000, help="Mensagens semeadas por rodada")
+        parser.add_argument("--ispbs", type=int, default=4, help="ISPBs recebedores")
+        parser.add_argument("--collectors", type=int, default=8, help="Coletores concorrentes")
+        parser.add_argument("--accept", default="json,multipart", help="Accept de cada rodada: json, multipart")
+        parser.add_argument("--batch", type=int, default=None, help="?batch=N nos pulls multipart")
+        parser.add_argument("--seed", type=int, default=42, help="Semente das mensagens semeadas")
+        parser.add_argument("--long-poll-timeout", type=float, default=0.2,
+                            help="Timeout do long polling em processo (s)")
+        parser.add_argument("--url", default=None, help="Servidor HTTP em execução (padrão: em processo)")
+        parser.add_argument("--output", default=None, help="Grava o resultado neste arquivo JSON")
+        parser.add_argument("--baseline", default=None, help="Resultado anterior para comparar")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Piora relativa aceita na comparação")
+
+    def handle(self, *args, **options):
+        ispbs = [bench_ispb(100 + index) for index in range(options["ispbs"])]
+        runs = []
+        with override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=options["long_poll_timeout"]):
+            for accept in options["accept"].split(","):
+                if accept not in ACCEPT_TYPES:
+                    raise CommandError(f"Accept desconhecido: {accept}")
+                runs.append(self._run(ispbs, accept, options))
+
+        result = {
+            "database": connection.vendor,
+            "transport": "http" if options["url"] else "wsgi",
+            "messages": options["messages"],
+            "seed": options["seed"],
+            "runs": runs,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(result, output, indent=2)
+        self.stdout.write(json.dumps(result, indent=2))
+
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                regressions = compare(json.load(baseline), result, options["tolerance"])
+            if regressions:
+                raise CommandError("Regressões em relação à linha de base:\n" + "\n".join(regressions))
+
+    def _reset(self, ispbs):
+        PixMessage.objects.filter(recebedor_ispb__in=ispbs).delete()
+        StreamSession.objects.filter(ispb__in=ispbs).delete()
+        for ispb in ispbs:
+            recount_sessions(ispb)
+            get_queue().clear(ispb)
+
+    def _run(self, ispbs, accept, options):
+        self._reset(ispbs)
+        per_ispb, extra = divmod(options["messages"], len(ispbs))
+        for index, ispb in enumerate(ispbs):
+            generate_messages(ispb, per_ispb + (index < extra), seed=options["seed"] + index)
+
+        transport = HttpTransport(options["url"]) if options["url"] else WsgiTransport()
+        batch = options["batch"] if accept == "multipart" else None
+        load = LoadRun(transport, ispbs, options["collectors"], accept, batch)
+        try:
+            run = load.run()
+        finally:
+            missing = PixMessage.objects.filter(recebedor_ispb__in=ispbs, claimed_by_stream__isnull=True).count()
+            self._reset(ispbs)
+        run["messages_missing"] = missing
+        return run
+
+
+def compare(baseline, current, tolerance):
+    """Lista de regressões (vazão menor ou p99 maior que a tolerância)"""
+    regressions = []
+    previous_runs = {run["accept"]: run for run in baseline.get("runs", [])}
+    for run in current["runs"]:
+        previous = previous_runs.get(run["accept"])
+        if previous is None:
+            continue
+        if run["messages_per_second"] < previous["messages_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{run['accept']}: {run['messages_per_second']} msg/s (antes {previous['messages_per_second']})"
+            )
+        p99, previous_p99 = run["pull_latency_ms"]["p99"], previous["pull_latency_ms"]["p99"]
+        if p99 is not None and previous_p99 and p99 > previous_p99 * (1 + tolerance):
+            regressions.append(f"{run['accept']}: p99 {p99} ms (antes {previous_p99} ms)")
+        if run["duplicates"] > previous["duplicates"]:
+            regressions.append(f"{run['accept']}: {run['duplicates']} duplicatas (antes {previous['duplicates']})")
+    return regressions
@@ -0,0 +1,70 @@
+"""
+Microbenchmark: formatos binários (MessagePack e CBOR) contra o JSON.
+
+Para cada tamanho de lote, mede os bytes por mensagem, o tempo de
+codificação no servidor (a partir dos payloads gravados, como no pull) e o
+tempo de decodificação no coletor, em µs por mensagem. Lotes de 1 usam os
+formatos de uma mensagem (``application/...``); os demais, os de lote
+(``multipart/...``). Formatos sem o pacote instalado ficam de fora. Sem banco.
+
+    python manage.py bench_wire_formats --sizes 1,10,100,1000
+"""
+import json
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from streaming import encoders, renderers
+from streaming.generators import PixMessageFactory
+
+
+def _json_loads():
+    # O coletor com orjson; "json_stdlib_decode" mede o json da biblioteca padrão
+    return encoders.orjson.loads if encoders.orjson is not None else json.loads
+
+
+def _formats(size):
+    """Nome -> (codifica uma lista de StoredMessage, decodifica os bytes)"""
+    single = size == 1
+    encode_json = (lambda stored: encoders.encode_single(stored[0])) if single else encoders.encode_batch
+    formats = {"json": (encode_json, _json_loads()), "json_stdlib_decode": (encode_json, json.loads)}
+    if renderers.msgpack is not None:
+        renderer = renderers.MsgpackRenderer() if single else renderers.MultipartMsgpackRenderer()
+        formats["msgpack"] = (renderer.encode, renderers.msgpack.unpackb)
+    if renderers.cbor2 is not None:
+        renderer = renderers.CborRenderer() if single else renderers.MultipartCborRenderer()
+        formats["cbor"] = (renderer.encode, renderers.cbor2.loads)
+    return formats
+
+
+class Command(BaseCommand):
+    help = "Compara bytes e tempo de codificação/decodificação de JSON, MessagePack e CBOR"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1,10,100,1000", help="Tamanhos de lote, separados por vírgula")
+        parser.add_argument("--repeat", type=int, default=5, help="Repetições (vale a melhor)")
+        parser.add_argument("--messages", type=int, default=20000, help="Mensagens codificadas por medição")
+
+    def handle(self, *args, **options):
+        results = []
+        for size in (int(value) for value in options["sizes"].split(",")):
+            instances = PixMessageFactory(seed=size).build("12345678", size)
+            stored = [
+                encoders.StoredMessage(pk, encoders.instance_payload(instance))
+                for pk, instance in enumerate(instances, start=1)
+            ]
+            number = max(1, options["messages"] // size)
+
+            formats = {}
+            for name, (encode, decode) in _formats(size).items():
+                body = encode(stored)
+                encode_best = min(timeit.repeat(lambda: encode(stored), number=number, repeat=options["repeat"]))
+                decode_best = min(timeit.repeat(lambda: decode(body), number=number, repeat=options["repeat"]))
+                formats[name] = {
+                    "bytes_per_message": round(len(body) / size, 1),
+                    "encode_us_per_message": round(encode_best / (number * size) * 1e6, 3),
+                    "decode_us_per_message": round(decode_best / (number * size) * 1e6, 3),
+                }
+            results.append({"batch": size, "formats": formats})
+
+        self.stdout.write(json.dumps({"orjson": encoders.orjson is not None, "results": results}, indent=2))
@@ -0,0 +1,33 @@
+"""
+Encerra sessões de stream ociosas (sem pull há mais de
+``PIX_STREAM_SESSION_IDLE_TIMEOUT`` segundos), devolve suas vagas e
+recoloca na fila as mensagens não confirmadas.
+
+    python manage.py reap_sessions
+    python manage.py reap_sessions --idle-timeout 120 --loop 30
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from streaming.reaper import run_reaper
+
+
+class Command(BaseCommand):
+    help = "Encerra sessões de stream ociosas e devolve mensagens não confirmadas à fila"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--idle-timeout", type=int, default=None,
+                            help="Segundos sem pull para considerar a sessão ociosa")
+        parser.add_argument("--loop", type=float, default=0,
+                            help="Repetir a cada N segundos (0 executa uma vez)")
+
+    def handle(self, *args, **options):
+        while True:
+            reaped, released = run_reaper(options["idle_timeout"])
+            self.stdout.write(f"{reaped} sessões encerradas, {released} mensagens devolvidas à fila")
+            if options["loop"] <= 0:
+                break
+            connection.close()
+            time.sleep(options["loop"])
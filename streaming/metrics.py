@@ -0,0 +1,278 @@
+"""
+Métricas do serviço no formato de texto do Prometheus (``GET /metrics``).
+
+Contadores e histogramas ficam em células por thread: cada thread escreve só
+nas suas células, sem lock e sem disputa, e a coleta soma todas. O lock só é
+usado na primeira escrita de cada thread em uma métrica (para registrar a
+célula). Células de threads encerradas são incorporadas a um total fixo, então
+servidores com uma thread por requisição não acumulam células.
+
+As combinações de labels do caminho quente são resolvidas uma vez, na
+importação (``PULLS["json"]``, ``LONG_POLLS["wakeup"]`` etc.): registrar um
+evento é só incrementar posições de uma lista.
+
+Os valores que já estão no banco (profundidade da fila por ISPB, mensagens em
+voo e sessões ativas) são lidos no momento da coleta.
+"""
+import bisect
+import threading
+
+from django.db.models import Count
+
+from .models import IspbStreamCounter, PixMessage
+
+# Limites (em segundos) dos histogramas de latência
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Acima deste total de células, as de threads encerradas são incorporadas
+_COMPACT_AFTER = 64
+
+
+REGISTRY = []
+
+
+def _format_value(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _ThreadCells:
+    """Células por thread de uma série (lista de `size` números)"""
+
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.cells = []  # (thread, células)
+        self.retired = [0] * size
+
+    def cell(self):
+        try:
+            return self.local.cell
+        except AttributeError:
+            pass
+        cell = [0] * self.size
+        with self.lock:
+            if len(self.cells) >= _COMPACT_AFTER:
+                self._compact()
+            self.cells.append((threading.current_thread(), cell))
+        self.local.cell = cell
+        return cell
+
+    def _compact(self):
+        alive = []
+        for thread, cell in self.cells:
+            if thread.is_alive():
+                alive.append((thread, cell))
+            else:
+                for position, value in enumerate(cell):
+                    self.retired[position] += value
+        self.cells = alive
+
+    def totals(self):
+        with self.lock:
+            totals = list(self.retired)
+            for _, cell in self.cells:
+                for position, value in enumerate(cell):
+                    totals[position] += value
+        return totals
+
+
+class _CounterChild:
+    def __init__(self):
+        self._cells = _ThreadCells(1)
+
+    def inc(self, amount=1):
+        self._cells.cell()[0] += amount
+
+    def samples(self, name):
+        """(nome da amostra, labels extras, valor)"""
+        yield f"{name}_total", (), self._cells.totals()[0]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # Uma posição por limite, uma para +Inf, a soma e a contagem
+        self._cells = _ThreadCells(len(buckets) + 3)
+
+    def observe(self, value):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self._buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def samples(self, name):
+        totals = self._cells.totals()
+        cumulative = 0
+        for bound, count in zip((*self._buckets, "+Inf"), totals):
+            cumulative += count
+            le = bound if bound == "+Inf" else _format_value(float(bound))
+            yield f"{name}_bucket", (("le", le),), cumulative
+        yield f"{name}_sum", (), totals[-2]
+        yield f"{name}_count", (), totals[-1]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Série de uma combinação de labels (resolver uma vez, fora do caminho quente)"""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            for sample_name, extra, value in child.samples(self.name):
+                names = self.labelnames + tuple(name for name, _ in extra)
+                label_values = values + tuple(label_value for _, label_value in extra)
+                lines.append(f"{sample_name}{_format_labels(names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+def _labeled(metric, *values):
+    """Séries pré-resolvidas por valor de label"""
+    return {value: metric.labels(value) for value in values}
+
+
+PULLS = _labeled(
+    Histogram("pix_stream_pull_seconds", "Duração de um pull de stream, incluindo o long polling", ["format"]),
+    "json", "multipart", "msgpack", "cbor",
+)
+CLAIMS = Histogram("pix_stream_claim_seconds", "Duração do comando de claim de um lote").labels()
+CLAIMED_MESSAGES = Counter("pix_stream_claimed_messages", "Mensagens reivindicadas por streams").labels()
+ENCODES = _labeled(
+    Histogram("pix_stream_encode_seconds", "Tempo de codificação da resposta de um pull", ["format"]),
+    "json", "multipart", "stream", "msgpack", "cbor",
+)
+LONG_POLLS = _labeled(
+    Counter(
+        "pix_stream_long_polls",
+        "Pulls por desfecho: immediate (havia mensagens), wakeup (acordado por aviso) ou timeout",
+        ["result"],
+    ),
+    "immediate", "wakeup", "timeout",
+)
+ADMISSIONS = _labeled(
+    Counter("pix_stream_admissions", "Aberturas de stream admitidas ou recusadas (429)", ["result"]),
+    "admitted", "rejected",
+)
+THROTTLED_PULLS = Counter(
+    "pix_stream_throttled_pulls", "Pulls adiados pelo limite de mensagens por ISPB (sem ir ao banco)"
+).labels()
+HOT_CACHE_LOOKUPS = _labeled(
+    Counter(
+        "pix_hot_cache_lookups",
+        "Mensagens reivindicadas procuradas no cache de mensagens recentes: hit ou miss (lidas do banco)",
+        ["result"],
+    ),
+    "hit", "miss",
+)
+GENERATIONS = Histogram("pix_generate_seconds", "Duração de uma geração de mensagens de teste").labels()
+GENERATED_MESSAGES = Counter("pix_generate_messages", "Mensagens de teste geradas").labels()
+INGESTED_MESSAGES = _labeled(
+    Counter("pix_ingest_messages", "Itens recebidos pela ingestão em massa, por status", ["status"]),
+    "created", "duplicate", "invalid",
+)
+
+
+def pull_outcome(messages, waited):
+    """Label de LONG_POLLS para o desfecho de um pull"""
+    if not messages:
+        return "timeout"
+    return "wakeup" if waited else "immediate"
+
+
+def _gauge(name, documentation, labelnames, rows):
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for *values, value in rows:
+        lines.append(f"{name}{_format_labels(labelnames, values)} {_format_value(value)}")
+    return lines
+
+
+def _database_gauges():
+    queue = (
+        PixMessage.objects.filter(claimed_by_stream__isnull=True)
+        .values_list("recebedor_ispb")
+        .annotate(depth=Count("id"))
+        .order_by("recebedor_ispb")
+    )
+    in_flight = PixMessage.objects.filter(visible_at__isnull=False).count()
+    sessions = IspbStreamCounter.objects.filter(active_sessions__gt=0).order_by("ispb").values_list(
+        "ispb", "active_sessions"
+    )
+    return [
+        *_gauge("pix_queue_depth", "Mensagens na fila (não reivindicadas) por ISPB recebedor", ("ispb",), queue),
+        *_gauge("pix_messages_in_flight", "Mensagens entregues aguardando confirmação", (), [(in_flight,)]),
+        *_gauge("pix_stream_active_sessions", "Sessões de stream ativas por ISPB", ("ispb",), sessions),
+    ]
+
+
+def _hot_cache_gauges():
+    from .hotcache import get_hot_cache
+
+    cache = get_hot_cache()
+    used, entries = cache.usage() if cache is not None else (0, 0)
+    return [
+        *_gauge("pix_hot_cache_bytes", "Memória estimada do cache de mensagens recentes", (), [(used,)]),
+        *_gauge("pix_hot_cache_entries", "Mensagens no cache de mensagens recentes", (), [(entries,)]),
+    ]
+
+
+def render_metrics():
+    """Texto de todas as métricas (formato de exposição 0.0.4 do Prometheus)"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    lines.extend(_database_gauges())
+    lines.extend(_hot_cache_gauges())
+    return "\n".join(lines) + "\n"
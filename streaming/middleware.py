@@ -0,0 +1,124 @@
+"""
+Contagem de comandos SQL por requisição.
+
+``QueryCountMiddleware`` abre um contador por requisição (em uma
+``ContextVar``) e um ``execute_wrapper`` instalado em cada conexão soma nele
+os comandos e o tempo de banco. A contagem acompanha a requisição também nas
+views assíncronas, cujo trabalho de banco roda no pool de threads
+(``async_views.run_db`` propaga o contexto). Comandos de savepoint não
+contam: são controle de transação e mudariam conforme a view rode ou não
+dentro de outra transação (como nos testes).
+
+Por endpoint (nome da rota), os totais vão para as métricas
+``pix_db_queries`` e ``pix_db_seconds``. Com ``PIX_DB_DEBUG_HEADERS`` a
+resposta traz ``X-DB-Queries`` e ``X-DB-Time-Ms``.
+
+``PIX_DB_QUERY_BUDGETS`` define o máximo de comandos por endpoint. Acima dele
+um aviso é registrado no log; com ``PIX_DB_QUERY_BUDGET_ENFORCE`` (usado nos
+testes) a requisição falha com ``QueryBudgetExceeded``.
+
+O corpo de respostas contínuas (``StreamingHttpResponse``) é gerado depois
+do middleware e não entra na contagem.
+"""
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_SAVEPOINT_PREFIXES = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+_current = ContextVar("pix_query_stats", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Endpoint executou mais comandos SQL que o orçamento"""
+
+
+class QueryStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+def count_queries(execute, sql, params, many, context):
+    """execute_wrapper que soma os comandos no contador da requisição atual"""
+    stats = _current.get()
+    if stats is None or sql.lstrip().upper().startswith(_SAVEPOINT_PREFIXES):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.seconds += time.perf_counter() - started
+        stats.queries += 1
+
+
+@receiver(connection_created)
+def _install_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+QUERY_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100)
+_QUERIES = metrics.Histogram(
+    "pix_db_queries", "Comandos SQL por requisição, por endpoint", ["endpoint"], buckets=QUERY_BUCKETS
+)
+_SECONDS = metrics.Histogram("pix_db_seconds", "Tempo de banco por requisição, por endpoint", ["endpoint"])
+
+
+class QueryCountMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self._acall(request)
+        stats = QueryStats()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats)
+
+    async def _acall(self, request):
+        stats = QueryStats()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats)
+
+    def _finish(self, request, response, stats):
+        match = request.resolver_match
+        endpoint = match.url_name if match is not None and match.url_name else "other"
+        _QUERIES.labels(endpoint).observe(stats.queries)
+        _SECONDS.labels(endpoint).observe(stats.seconds)
+
+        if settings.PIX_DB_DEBUG_HEADERS:
+            response["X-DB-Queries"] = str(stats.queries)
+            response["X-DB-Time-Ms"] = f"{stats.seconds * 1000:.3f}"
+
+        budget = settings.PIX_DB_QUERY_BUDGETS.get(f"{endpoint}:{request.method}")
+        if budget is not None and stats.queries > budget:
+            message = f"{request.method} {endpoint} executou {stats.queries} comandos SQL (orçamento {budget})"
+            if settings.PIX_DB_QUERY_BUDGET_ENFORCE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.2 on 2026-10-17 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamsession',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='streamsession',
+            name='interaction_id',
+            field=models.CharField(blank=True, max_length=12, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='streamsession',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-17 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0004_unclaimed_queue_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamsession',
+            name='batch_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.2 on 2026-10-17 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0005_stream_batch_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IspbStreamCounter',
+            fields=[
+                ('ispb', models.CharField(max_length=8, primary_key=True, serialize=False)),
+                ('active_sessions', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='streamsession',
+            index=models.Index(fields=['ispb', 'active'], name='streamsession_ispb_active_idx'),
+        ),
+    ]
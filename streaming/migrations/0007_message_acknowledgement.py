@@ -0,0 +1,26 @@
+# Generated by Django 5.2.2 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0006_stream_admission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pixmessage',
+            name='visible_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='pixmessage',
+            index=models.Index(condition=models.Q(('visible_at__isnull', False)), fields=['claimed_by_stream'], name='pixmsg_inflight_stream_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pixmessage',
+            index=models.Index(condition=models.Q(('visible_at__isnull', False)), fields=['visible_at'], name='pixmsg_inflight_visible_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.2 on 2026-10-17 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0007_message_acknowledgement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PixMessageArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('end_to_end_id', models.CharField(db_index=True, max_length=100)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('pagador_nome', models.CharField(max_length=100)),
+                ('pagador_cpf_cnpj', models.CharField(max_length=14)),
+                ('pagador_ispb', models.CharField(max_length=8)),
+                ('pagador_agencia', models.CharField(max_length=10)),
+                ('pagador_conta', models.CharField(max_length=20)),
+                ('pagador_tipo_conta', models.CharField(max_length=10)),
+                ('recebedor_nome', models.CharField(max_length=100)),
+                ('recebedor_cpf_cnpj', models.CharField(max_length=14)),
+                ('recebedor_ispb', models.CharField(max_length=8)),
+                ('recebedor_agencia', models.CharField(max_length=10)),
+                ('recebedor_conta', models.CharField(max_length=20)),
+                ('recebedor_tipo_conta', models.CharField(max_length=10)),
+                ('campo_livre', models.TextField(blank=True)),
+                ('tx_id', models.CharField(max_length=100)),
+                ('data_pagamento', models.DateTimeField()),
+                ('stream_session_id', models.UUIDField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.2 on 2026-10-17 21:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0008_message_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pixmessage',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='streamsession',
+            name='weight',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.AddIndex(
+            model_name='pixmessage',
+            index=models.Index(condition=models.Q(('claimed_by_stream__isnull', True), ('priority__gt', 0)), fields=['recebedor_ispb', '-priority', 'id'], name='pixmsg_priority_queue_idx'),
+        ),
+    ]
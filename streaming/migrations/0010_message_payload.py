@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-17 21:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0009_message_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pixmessage',
+            name='payload',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.2 on 2026-10-17 22:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0010_message_payload'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pixmessage',
+            index=models.Index(condition=models.Q(('claimed_by_stream__isnull', True)), fields=['recebedor_ispb', 'data_pagamento', 'id'], name='pixmsg_aged_queue_idx'),
+        ),
+    ]
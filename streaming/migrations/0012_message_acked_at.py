@@ -0,0 +1,27 @@
+# Generated by Django 5.2.2 on 2026-10-17 22:18
+
+from django.db import migrations, models
+
+
+def backfill_acked_at(apps, schema_editor):
+    # Confirmadas antes da coluna: sem o instante da confirmação, vale a criação
+    PixMessage = apps.get_model('streaming', 'PixMessage')
+    PixMessage.objects.filter(claimed_by_stream__isnull=False, visible_at__isnull=True).update(
+        acked_at=models.F('created_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0011_aged_queue_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pixmessage',
+            name='acked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_acked_at, migrations.RunPython.noop),
+    ]
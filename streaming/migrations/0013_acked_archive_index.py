@@ -0,0 +1,17 @@
+# Generated by Django 5.2.2 on 2026-10-17 22:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streaming', '0012_message_acked_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pixmessage',
+            index=models.Index(condition=models.Q(('claimed_by_stream__isnull', False), ('visible_at__isnull', True)), fields=['acked_at'], name='pixmsg_acked_archive_idx'),
+        ),
+    ]
@@ -26,8 +26,97 @@ class PixMessage(models.Model):
     claimed = models.BooleanField(default=False)
     claimed_by_stream = models.ForeignKey('StreamSession', null=True, blank=True, on_delete=models.SET_NULL, related_name='messages')
 
+    # Em voo: entregue e ainda não confirmada. Volta para a fila se não for
+    # confirmada até este instante (NULL quando confirmada ou na fila)
+    visible_at = models.DateTimeField(null=True, blank=True)
+
+    # Quando a entrega foi confirmada (NULL até a confirmação). O arquivamento
+    # conta o prazo a partir daqui
+    acked_at = models.DateTimeField(null=True, blank=True)
+
+    # Prioridade de entrega pelo valor (0 ou 1), calculada na inserção. A da
+    # idade do pagamento é avaliada no claim (streaming/scheduler.py)
+    priority = models.PositiveSmallIntegerField(default=0)
+
+    # JSON do formato de fio, gerado na inserção (streaming/encoders.py).
+    # NULL em linhas antigas: codificado no claim até o backfill_payloads
+    payload = models.BinaryField(null=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Fila de cada ISPB: só mensagens não reivindicadas, em ordem FIFO (id)
+            models.Index(
+                fields=['recebedor_ispb', 'id'],
+                condition=models.Q(claimed_by_stream__isnull=True),
+                name='pixmsg_unclaimed_queue_idx',
+            ),
+            # Faixa prioritária da fila: só mensagens livres com prioridade
+            models.Index(
+                fields=['recebedor_ispb', '-priority', 'id'],
+                condition=models.Q(claimed_by_stream__isnull=True, priority__gt=0),
+                name='pixmsg_priority_queue_idx',
+            ),
+            # Faixa por idade: mensagens livres pela data do pagamento
+            models.Index(
+                fields=['recebedor_ispb', 'data_pagamento', 'id'],
+                condition=models.Q(claimed_by_stream__isnull=True),
+                name='pixmsg_aged_queue_idx',
+            ),
+            # Mensagens em voo: confirmação por sessão e varredura de prazos vencidos
+            models.Index(
+                fields=['claimed_by_stream'],
+                condition=models.Q(visible_at__isnull=False),
+                name='pixmsg_inflight_stream_idx',
+            ),
+            models.Index(
+                fields=['visible_at'],
+                condition=models.Q(visible_at__isnull=False),
+                name='pixmsg_inflight_visible_idx',
+            ),
+            # Arquivamento: só mensagens confirmadas, pelo instante da confirmação
+            models.Index(
+                fields=['acked_at'],
+                condition=models.Q(visible_at__isnull=True, claimed_by_stream__isnull=False),
+                name='pixmsg_acked_archive_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return self.end_to_end_id
+
+
+class PixMessageArchive(models.Model):
+    """Mensagens entregues e confirmadas, movidas para fora da tabela quente"""
+    id = models.BigIntegerField(primary_key=True)
+    end_to_end_id = models.CharField(max_length=100, db_index=True)
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+
+    pagador_nome = models.CharField(max_length=100)
+    pagador_cpf_cnpj = models.CharField(max_length=14)
+    pagador_ispb = models.CharField(max_length=8)
+    pagador_agencia = models.CharField(max_length=10)
+    pagador_conta = models.CharField(max_length=20)
+    pagador_tipo_conta = models.CharField(max_length=10)
+
+    recebedor_nome = models.CharField(max_length=100)
+    recebedor_cpf_cnpj = models.CharField(max_length=14)
+    recebedor_ispb = models.CharField(max_length=8)
+    recebedor_agencia = models.CharField(max_length=10)
+    recebedor_conta = models.CharField(max_length=20)
+    recebedor_tipo_conta = models.CharField(max_length=10)
+
+    campo_livre = models.TextField(blank=True)
+    tx_id = models.CharField(max_length=100)
+    data_pagamento = models.DateTimeField()
+
+    # Sessão que entregou a mensagem (sem FK: sessões antigas podem ser removidas)
+    stream_session_id = models.UUIDField(null=True, blank=True)
+
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+
     def __str__(self):
         return self.end_to_end_id
 
@@ -39,6 +128,57 @@ class StreamSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     last_pull_at = models.DateTimeField(null=True, blank=True)
 
+    # Cursor do Pull-Next: token atual, última mensagem entregue e validade
+    interaction_id = models.CharField(max_length=12, unique=True, null=True, blank=True)
+    last_message_id = models.BigIntegerField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    # Lote atual do modo adaptativo (batch=adaptive)
+    batch_size = models.PositiveIntegerField(null=True, blank=True)
+
+    # Peso na divisão justa entre os coletores do ISPB (?weight= no start)
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ispb', 'active'], name='streamsession_ispb_active_idx'),
+        ]
+
     def __str__(self):
         return f"{self.ispb} - {self.id}"
 
+
+class IspbStreamCounter(models.Model):
+    """Sessões ativas por ISPB, usado para admitir streams de forma atômica"""
+    ispb = models.CharField(max_length=8, primary_key=True)
+    active_sessions = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.ispb} - {self.active_sessions}"
+
+
+class GenerationJob(models.Model):
+    """Geração de mensagens de teste executada em background"""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    ispb = models.CharField(max_length=8)
+    requested = models.PositiveIntegerField()
+    created = models.PositiveIntegerField(default=0)
+    seed = models.BigIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.ispb} - {self.created}/{self.requested} ({self.status})"
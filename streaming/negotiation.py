@@ -0,0 +1,34 @@
+"""
+Negociação de conteúdo com a escolha do renderer memorizada.
+
+Os coletores repetem o mesmo ``Accept`` em todos os pulls, então a escolha
+do DRF (renderer e media type aceito) é calculada uma vez por combinação de
+``Accept``, ``?format=`` e lista de renderers e reaproveitada depois. O
+resultado é o mesmo de ``DefaultContentNegotiation``, inclusive os erros
+``406``, que não são memorizados.
+"""
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+
+# Combinações distintas guardadas; acima disso a negociação é calculada a cada vez
+MAX_CACHED_CHOICES = 512
+
+_choices = {}
+
+
+class CachedContentNegotiation(DefaultContentNegotiation):
+    """DefaultContentNegotiation com a escolha memorizada por Accept"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format = format_suffix or request.GET.get(self.settings.URL_FORMAT_OVERRIDE)
+        key = (request.META.get("HTTP_ACCEPT", "*/*"), format, tuple(type(renderer) for renderer in renderers))
+        choice = _choices.get(key)
+        if choice is None:
+            if not isinstance(request, Request):
+                request = Request(request)
+            renderer, media_type = super().select_renderer(request, renderers, format_suffix)
+            choice = (renderers.index(renderer), media_type)
+            if len(_choices) < MAX_CACHED_CHOICES:
+                _choices[key] = choice
+        index, media_type = choice
+        return renderers[index], media_type
@@ -0,0 +1,215 @@
+"""
+Notificação de novas mensagens por ISPB para o long polling.
+
+Quem insere mensagens publica o ISPB do recebedor; pollers parados naquele
+ISPB acordam na hora e reivindicam o lote em vez de dormir o timeout inteiro.
+
+- ``PostgresNotifier``: ``pg_notify`` no insert e uma única conexão por
+  processo fazendo ``LISTEN``, que distribui os avisos para os pollers locais.
+- ``LocalNotifier``: substituto em memória (mesmo processo), usado com SQLite
+  nos testes e no CI.
+"""
+import asyncio
+import logging
+import select
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, connections, transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Interesse de um poller em um ISPB. Registrar antes do claim evita perder avisos"""
+
+    def __init__(self, notifier, ispb):
+        self.notifier = notifier
+        self.ispb = ispb
+        self.event = threading.Event()
+
+    def __enter__(self):
+        self.notifier._register(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.notifier._unregister(self)
+
+    def set(self):
+        self.event.set()
+
+    def wait(self, timeout):
+        """Aguarda um aviso por até `timeout` segundos. Retorna se houve aviso"""
+        woke = self.event.wait(timeout)
+        self.event.clear()
+        return woke
+
+
+class AsyncSubscription(Subscription):
+    """Variante para views assíncronas: espera no event loop, sem ocupar thread"""
+
+    def __init__(self, notifier, ispb):
+        super().__init__(notifier, ispb)
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def set(self):
+        # Avisos chegam de outras threads (listener, on_commit em thread do ORM)
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            pass  # Event loop já encerrado
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            woke = True
+        except asyncio.TimeoutError:
+            woke = False
+        self.event.clear()
+        return woke
+
+
+class BaseNotifier:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, ispb):
+        return Subscription(self, ispb)
+
+    def subscribe_async(self, ispb):
+        return AsyncSubscription(self, ispb)
+
+    def notify(self, ispb):
+        """Publica que há novas mensagens para o ISPB (entregue no commit)"""
+        raise NotImplementedError
+
+    def waiting(self):
+        """Quantidade de pollers aguardando avisos neste processo"""
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscriptions.values())
+
+    def _register(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.ispb].add(subscription)
+
+    def _unregister(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.ispb)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.ispb]
+
+    def _wake(self, ispb):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(ispb, ()))
+        for subscription in subscribers:
+            subscription.set()
+
+    def _wake_all(self):
+        with self._lock:
+            subscribers = [sub for subs in self._subscriptions.values() for sub in subs]
+        for subscription in subscribers:
+            subscription.set()
+
+
+class LocalNotifier(BaseNotifier):
+    """Notificador em memória: só acorda pollers do mesmo processo"""
+
+    def notify(self, ispb):
+        transaction.on_commit(lambda: self._wake(ispb))
+
+
+class PostgresNotifier(BaseNotifier):
+    """Notificador via LISTEN/NOTIFY do PostgreSQL"""
+
+    channel = "pix_messages"
+    poll_interval = 5
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def notify(self, ispb):
+        # pg_notify é transacional: o aviso só sai quando o insert é confirmado
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, ispb])
+
+    def subscribe(self, ispb):
+        self._ensure_listener()
+        return super().subscribe(ispb)
+
+    def subscribe_async(self, ispb):
+        self._ensure_listener()
+        return super().subscribe_async(ispb)
+
+    def _ensure_listener(self):
+        if self._listener is not None and self._listener.is_alive():
+            return
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen_forever, name="pix-notify-listener", daemon=True)
+                self._listener.start()
+
+    def _listen_forever(self):
+        while True:
+            wrapper = connections.create_connection("default")
+            try:
+                wrapper.ensure_connection()
+                raw = wrapper.connection
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                # Avisos podem ter sido perdidos durante a (re)conexão
+                self._wake_all()
+                while True:
+                    if select.select([raw], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        self._wake(raw.notifies.pop(0).payload)
+            except Exception:
+                logger.exception("Listener de notificações Pix caiu, reconectando")
+                threading.Event().wait(1)
+            finally:
+                wrapper.close()
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier():
+    """
+    Retorna o notificador do processo
+
+    Usa ``settings.PIX_STREAM_NOTIFIER`` (caminho de classe); se vazio, escolhe
+    pelo banco: PostgresNotifier no PostgreSQL e LocalNotifier nos demais.
+    """
+    global _notifier
+    if _notifier is None:
+        with _notifier_lock:
+            if _notifier is None:
+                path = settings.PIX_STREAM_NOTIFIER
+                if path:
+                    notifier_class = import_string(path)
+                elif connection.vendor == "postgresql":
+                    notifier_class = PostgresNotifier
+                else:
+                    notifier_class = LocalNotifier
+                _notifier = notifier_class()
+    return _notifier
+
+
+@receiver(setting_changed)
+def _reset_notifier(setting, **kwargs):
+    """Descarta o notificador atual quando a setting muda (override_settings nos testes)"""
+    global _notifier
+    if setting == "PIX_STREAM_NOTIFIER":
+        _notifier = None
@@ -0,0 +1,222 @@
+"""
+Passos comuns dos pulls de stream, usados pelas views síncronas (``views.py``)
+e assíncronas (``async_views.py``).
+
+Tudo aqui é síncrono: negociação do lote, claim com a decisão do limite por
+ISPB (``Throttled`` vira uma pausa), quanto esperar, codificação com as
+métricas e montagem das respostas. As views só fazem a espera entre os pulls:
+``subscription.wait`` bloqueante nas síncronas, ``await`` no event loop nas
+assíncronas (com os métodos de banco em ``run_db``).
+
+- ``LongPoll``: um pull com long polling (``application/json``,
+  ``multipart/json`` e os formatos binários).
+- ``StreamWindow``: a janela de uma resposta contínua (NDJSON e
+  ``multipart/mixed``, ver ``streams.py``).
+"""
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+
+from . import metrics
+from .batching import ADAPTIVE, batch_limit, requested_batch
+from .cursors import acknowledge_cursor, advance_cursor, pull_batch
+from .encoders import encode_batch, encode_single
+from .renderers import BinaryRenderer, accepts_batch
+from .scheduler import Throttled
+
+# Corpos de erro das views de stream
+STALE_CURSOR = "Stream já continuado por outra requisição."
+INVALID_BATCH = "Parâmetro batch inválido."
+INVALID_WEIGHT = "Parâmetro weight inválido."
+TOO_MANY_STREAMS = "Limite de streams ativos atingido."
+STREAM_NOT_FOUND = "Stream não encontrado ou expirado."
+
+
+def negotiated_batch(renderer, params, media_type):
+    """Lote pedido para os formatos de lote e modos contínuos (levanta InvalidBatchSize)"""
+    if not accepts_batch(renderer):
+        return None
+    return requested_batch(params, media_type)
+
+
+def pull_next(ispb, session):
+    """Pull-Next do cursor atual da sessão"""
+    return f"/api/pix/{ispb}/stream/{session.interaction_id}"
+
+
+def try_pull(ispb, session, limit, adaptive=False, rotate=True, acknowledge=False):
+    """
+    Um claim pelo escalonador. Retorna ``(mensagens, pausa)``
+
+    Sem fichas no limite do ISPB o pull não vai ao banco: a lista vem vazia e
+    a pausa diz quanto esperar pelas fichas (None se não houve limite).
+    """
+    try:
+        return pull_batch(ispb, session, limit, adaptive=adaptive, rotate=rotate, acknowledge=acknowledge), None
+    except Throttled as exc:
+        return [], exc.retry_after
+
+
+def wait_timeout(remaining, pause):
+    """Quanto esperar por um aviso: o que resta do prazo, ou menos se o ISPB está limitado"""
+    return remaining if pause is None else min(remaining, pause)
+
+
+def frame_batch(renderer, messages):
+    """Trecho do corpo com um lote de mensagens no formato do renderer"""
+    started = time.perf_counter()
+    chunk = b"".join(renderer.frame(encode_single(message)) for message in messages)
+    metrics.ENCODES["stream"].observe(time.perf_counter() - started)
+    return chunk
+
+
+def encode_messages(renderer, messages):
+    """Corpo e content type de um pull com mensagens (formato de fio, sem serializer)"""
+    if isinstance(renderer, BinaryRenderer):
+        # MessagePack/CBOR: uma mensagem ou um array, conforme o media type
+        return renderer.encode(messages), renderer.media_type
+    if accepts_batch(renderer):
+        # multipart/json: o array diretamente
+        return encode_batch(messages), "application/json"
+    # application/json ou padrão: uma única mensagem
+    return encode_single(messages[0]), "application/json"
+
+
+def response_format(renderer):
+    """Rótulo das métricas de pull e codificação para o renderer"""
+    if isinstance(renderer, BinaryRenderer):
+        return renderer.codec
+    return "multipart" if accepts_batch(renderer) else "json"
+
+
+class LongPoll:
+    """
+    Um pull com long polling, sem a espera
+
+    ``pull`` faz um claim e diz quanto esperar por um aviso antes do próximo
+    (None: responder). O interesse no ISPB é registrado pela view antes do
+    primeiro ``pull``, então um insert entre o claim vazio e a espera acorda
+    o poller imediatamente. Se a espera termina no prazo sem aviso
+    (``expired``), a view responde sem outro claim: nada novo foi commitado
+    no ISPB desde o último.
+
+    Com ``acknowledge`` (continuação pelo Pull-Next), o primeiro pull que vai
+    ao banco confirma o lote entregue com o interactionId seguido, na
+    transação do claim.
+    """
+
+    def __init__(self, renderer, ispb, session, batch=None, acknowledge=False):
+        self.renderer = renderer
+        self.ispb = ispb
+        self.session = session
+        batched = accepts_batch(renderer)
+        self.limit = batch_limit(batch, session) if batched else 1
+        self.adaptive = batched and batch == ADAPTIVE
+        self.started = time.perf_counter()
+        self.deadline = time.monotonic() + settings.PIX_STREAM_LONG_POLL_TIMEOUT
+        self.messages = []
+        self.waited = False
+        self.acknowledge = acknowledge
+
+    def pull(self):
+        """Um claim (banco). Retorna quanto esperar, ou None para responder"""
+        self.messages, pause = try_pull(
+            self.ispb, self.session, self.limit, self.adaptive, acknowledge=self.acknowledge
+        )
+        if pause is None:
+            self.acknowledge = False
+        remaining = self.deadline - time.monotonic()
+        if self.messages or remaining <= 0:
+            return None
+        self.waited = True
+        return wait_timeout(remaining, pause)
+
+    def expired(self):
+        """Se o prazo do long polling acabou"""
+        return time.monotonic() >= self.deadline
+
+    def finish(self):
+        """Timeout sem dados: renovar a validade do cursor (banco), confirmando se nenhum pull confirmou"""
+        if not self.messages:
+            adaptive_limit = self.limit if self.adaptive else None
+            if self.acknowledge:
+                acknowledge_cursor(self.session, adaptive_limit)
+            else:
+                advance_cursor(self.session, [], adaptive_limit=adaptive_limit)
+
+    def response(self):
+        """Resposta 200 com o lote ou 204, com o Pull-Next do cursor atual e as métricas"""
+        metrics.LONG_POLLS[metrics.pull_outcome(self.messages, self.waited)].inc()
+        label = response_format(self.renderer)
+        if not self.messages:
+            response = HttpResponse(status=204)
+            response["Pull-Next"] = pull_next(self.ispb, self.session)
+            response["Content-Length"] = "0"
+            metrics.PULLS[label].observe(time.perf_counter() - self.started)
+            return response
+
+        encode_started = time.perf_counter()
+        content, content_type = encode_messages(self.renderer, self.messages)
+        finished = time.perf_counter()
+        metrics.ENCODES[label].observe(finished - encode_started)
+        metrics.PULLS[label].observe(finished - self.started)
+        response = HttpResponse(content, content_type=content_type, status=200)
+        response["Pull-Next"] = pull_next(self.ispb, self.session)
+        return response
+
+
+class StreamWindow:
+    """
+    A janela de uma resposta contínua, sem a espera
+
+    ``pull`` reivindica o próximo lote (sem rotacionar o cursor) e devolve o
+    trecho do corpo e quanto esperar antes do próximo: 0 segue na hora,
+    None encerra a janela.
+    """
+
+    def __init__(self, renderer, ispb, session, batch=None):
+        self.renderer = renderer
+        self.ispb = ispb
+        self.session = session
+        self.batch = batch
+        self.adaptive = batch == ADAPTIVE
+        self.deadline = time.monotonic() + settings.PIX_STREAM_WINDOW
+        self.remaining_messages = settings.PIX_STREAM_WINDOW_MAX_MESSAGES
+
+    def pull(self):
+        """Um lote da janela (banco). Retorna ``(trecho ou None, espera ou None)``"""
+        if self.remaining_messages <= 0:
+            return None, None
+        limit = min(batch_limit(self.batch, self.session), self.remaining_messages)
+        messages, pause = try_pull(self.ispb, self.session, limit, self.adaptive, rotate=False)
+        chunk = None
+        if messages:
+            self.remaining_messages -= len(messages)
+            chunk = frame_batch(self.renderer, messages)
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            return chunk, None
+        if messages:
+            return chunk, 0
+        return chunk, wait_timeout(remaining, pause)
+
+    def finish(self):
+        """Fim da janela: renovar a validade do cursor para a continuação (banco)"""
+        advance_cursor(self.session, [])
+
+    def close(self):
+        """Trecho final do corpo (o fechamento do multipart/mixed)"""
+        return self.renderer.close()
+
+
+def stream_response(renderer, ispb, session, chunks):
+    """
+    Resposta contínua com os trechos de ``chunks`` (gerador síncrono ou assíncrono)
+
+    O cursor já deve ter sido rotacionado: o Pull-Next sai nos cabeçalhos.
+    """
+    response = StreamingHttpResponse(chunks, content_type=renderer.stream_content_type())
+    response["Pull-Next"] = pull_next(ispb, session)
+    response["X-Accel-Buffering"] = "no"
+    return response
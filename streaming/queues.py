@@ -0,0 +1,267 @@
+"""
+Backends de fila: qual mensagem cada pull reivindica.
+
+O PostgreSQL continua sendo o registro das mensagens. O claim, a confirmação
+e a reentrega funcionam sempre no banco (``streaming/claims.py``). O backend
+só decide quais ids o próximo pull tenta reivindicar.
+
+- ``DatabaseQueue`` (padrão): varre a fila no banco a partir do cursor da
+  sessão (índice parcial ``pixmsg_unclaimed_queue_idx`` e ``SKIP LOCKED``).
+- ``RedisQueue``: uma lista de ids prontos por ISPB em um servidor com o
+  protocolo do Redis (Redis 6.2+ ou ``fakeredis`` no processo). Cada pull tira
+  os ids com ``LPOP`` e os reivindica no banco pela chave primária, sem
+  varrer a fila. A disputa entre coletores fica no Redis.
+
+A lista só recebe ids depois do commit da mensagem (``publish``). Ids
+repetidos ou já reivindicados são descartados no claim, que é condicional no
+banco. Por isso publicar um id a mais nunca entrega uma mensagem duas vezes.
+Na primeira vez que uma lista é usada (ou depois de o Redis perder os dados),
+ela é reconstruída com as mensagens livres do banco (``prepare``, antes da
+transação do pull).
+
+A classe é escolhida por ``settings.PIX_STREAM_QUEUE`` (vazio usa o banco).
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .claims import claim_message_ids, claim_messages
+from .models import PixMessage, StreamSession
+from .notify import get_notifier
+from .scheduler import aged_before, priority_enabled
+
+try:
+    import redis
+except ImportError:  # dependência opcional (RedisQueue)
+    redis = None
+
+try:
+    import fakeredis
+except ImportError:  # dependência opcional (RedisQueue nos testes)
+    fakeredis = None
+
+logger = logging.getLogger(__name__)
+
+
+class BaseQueue:
+    """Interface dos backends de fila"""
+
+    def prepare(self, ispb):
+        """Chamado antes da transação do pull (estado da fila que depende de leituras no banco)"""
+
+    def claim(self, ispb, session, limit):
+        """
+        Reivindica o próximo lote da sessão
+
+        Retorna ``(mensagens, cursor)``: a lista de StoredMessage em ordem de
+        id e o ``last_message_id`` a gravar na sessão junto com o lote.
+        """
+        raise NotImplementedError
+
+    def publish(self, ispb, ids, priority_ids=()):
+        """
+        Mensagens novas do ISPB (chamado dentro da transação que as insere)
+
+        ``priority_ids`` são as que têm prioridade de entrega (também em ``ids``).
+        """
+
+    def requeue(self, ispb, ids):
+        """Mensagens devolvidas para a fila (reentrega, antes das mais novas)"""
+
+    def unclaim(self, ispb, messages):
+        """Claim desfeito por rollback: as mensagens continuam livres no banco"""
+
+    def clear(self, ispb):
+        """Descarta o estado da fila do ISPB (benchmarks e testes)"""
+
+
+def claim_priority_lanes(ispb, session, limit, cutoff):
+    """
+    Faixas prioritárias no banco: primeiro as de valor alto (as já
+    envelhecidas antes), depois os pagamentos feitos antes de ``cutoff``
+    (None: regra de idade desligada)
+    """
+    messages = claim_messages(ispb, session, limit, priority_only=True, aged_before=cutoff)
+    if cutoff is not None and len(messages) < limit:
+        messages += claim_messages(ispb, session, limit - len(messages), aged_before=cutoff)
+    return messages
+
+
+class DatabaseQueue(BaseQueue):
+    """Fila no próprio banco: varredura por faixa a partir do cursor da sessão"""
+
+    def publish(self, ispb, ids, priority_ids=()):
+        if ids:
+            first = min(ids)
+            # No PostgreSQL o id é alocado antes do commit: um cursor que já
+            # passou de uma mensagem commitada depois volta para antes dela
+            transaction.on_commit(lambda: StreamSession.objects.filter(
+                ispb=ispb, active=True, last_message_id__gte=first,
+            ).update(last_message_id=first - 1))
+
+    def claim(self, ispb, session, limit):
+        # Só a faixa FIFO, depois do cursor, avança o cursor. Mensagens com id
+        # menor voltam a ficar livres por _release (que zera os cursores do
+        # ISPB) ou por commits fora de ordem (``publish`` recua os cursores)
+        cursor = session.last_message_id
+        messages = []
+        if priority_enabled():
+            # Primeiro as faixas prioritárias, que não movem o cursor: as
+            # mensagens comuns com id menor que uma prioritária seguem à frente dele
+            messages = claim_priority_lanes(ispb, session, limit, aged_before())
+        if len(messages) < limit:
+            fifo = claim_messages(ispb, session, limit - len(messages), after_id=cursor)
+            if fifo:
+                cursor = fifo[-1].id
+                messages += fifo
+                messages.sort(key=lambda message: message.id)
+        return messages, cursor
+
+
+_fake_server = None
+
+
+def redis_client(url):
+    """Cliente para a URL (``fakeredis://`` usa um servidor em memória do processo)"""
+    global _fake_server
+    if url.startswith("fakeredis://"):
+        if fakeredis is None:
+            raise RuntimeError("fakeredis não está instalado")
+        if _fake_server is None:
+            _fake_server = fakeredis.FakeServer()
+        return fakeredis.FakeRedis(server=_fake_server)
+    if redis is None:
+        raise RuntimeError("O pacote redis não está instalado")
+    return redis.Redis.from_url(url)
+
+
+class RedisQueue(BaseQueue):
+    """Listas de ids prontos por ISPB no Redis, reivindicados no banco pela chave"""
+
+    # Rodadas de LPOP por claim quando os ids tirados já tinham sido reivindicados
+    max_rounds = 4
+
+    def __init__(self, client=None):
+        self.client = client if client is not None else redis_client(settings.PIX_STREAM_QUEUE_REDIS_URL)
+        self.prefix = settings.PIX_STREAM_QUEUE_REDIS_PREFIX
+
+    def _key(self, ispb):
+        return f"{self.prefix}{ispb}"
+
+    def _push_front(self, ispb, ids):
+        if ids:
+            # LPUSH insere um a um na frente: na ordem inversa, o primeiro fica na frente
+            self.client.lpush(self._key(ispb), *reversed(ids))
+
+    def _publish_now(self, ispb, ids, priority_ids):
+        # Prioritárias na frente da lista, as demais no fim
+        if priority_ids:
+            self._push_front(ispb, priority_ids)
+            priority = set(priority_ids)
+            ids = [pk for pk in ids if pk not in priority]
+        if ids:
+            self.client.rpush(self._key(ispb), *ids)
+
+    def publish(self, ispb, ids, priority_ids=()):
+        ids = list(ids)
+        priority_ids = list(priority_ids)
+        if ids:
+            # Só depois do commit: um id tirado antes disso não seria encontrado no banco
+            transaction.on_commit(lambda: self._publish_now(ispb, ids, priority_ids))
+
+    def requeue(self, ispb, ids):
+        ids = sorted(ids)
+        transaction.on_commit(lambda: self._push_front(ispb, ids))
+
+    def unclaim(self, ispb, messages):
+        self._push_front(ispb, [message.id for message in messages])
+
+    def clear(self, ispb):
+        self.client.delete(self._key(ispb), f"{self._key(ispb)}:built")
+
+    def _rebuild(self, ispb):
+        """Refaz a lista com todas as mensagens livres do ISPB no banco"""
+        # Descartar antes de ler: o que for publicado depois já está commitado
+        # e aparece na leitura (no máximo repetido, nunca perdido)
+        self.client.delete(self._key(ispb))
+        ids = list(
+            PixMessage.objects.filter(recebedor_ispb=ispb, claimed_by_stream__isnull=True)
+            .order_by("-priority", "id")
+            .values_list("id", flat=True)
+        )
+        self._push_front(ispb, ids)
+        logger.info(f"Fila Redis do ISPB {ispb} reconstruída com {len(ids)} mensagens")
+
+    def prepare(self, ispb):
+        # Fora da transação do claim: no SQLite, uma leitura antes do UPDATE
+        # na mesma transação falha com "database is locked" sob concorrência
+        if self.client.set(f"{self._key(ispb)}:built", 1, nx=True):
+            try:
+                self._rebuild(ispb)
+            except Exception:
+                self.client.delete(f"{self._key(ispb)}:built")
+                raise
+
+    def claim(self, ispb, session, limit):
+        key = self._key(ispb)
+        messages = []
+        cutoff = aged_before()
+        if cutoff is not None:
+            # A idade muda enquanto a mensagem espera e a lista não é
+            # reordenada: as faixas prioritárias vêm do banco. Os ids delas
+            # continuam na lista e são descartados ao serem tirados
+            messages = claim_priority_lanes(ispb, session, limit, cutoff)
+        for _ in range(self.max_rounds):
+            if len(messages) >= limit:
+                break
+            popped = self.client.lpop(key, limit - len(messages))
+            if not popped:
+                break
+            ids = [int(value) for value in popped]
+            try:
+                messages.extend(claim_message_ids(ispb, session, ids))
+            except Exception:
+                self._push_front(ispb, ids)
+                raise
+            if len(messages) >= limit:
+                break
+        messages.sort(key=lambda message: message.id)
+        # A lista não usa o cursor: fica o id da última mensagem entregue
+        return messages, messages[-1].id if messages else session.last_message_id
+
+
+@receiver(post_save, sender=PixMessage)
+def _publish_created(sender, instance, created, raw=False, **kwargs):
+    """Mensagens criadas pelo ORM (admin, testes) entram na fila e acordam os coletores"""
+    if created and not raw:
+        get_queue().publish(instance.recebedor_ispb, [instance.pk], [instance.pk] if instance.priority else ())
+        get_notifier().notify(instance.recebedor_ispb)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Retorna o backend de fila do processo (``settings.PIX_STREAM_QUEUE``)"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                path = settings.PIX_STREAM_QUEUE
+                _queue = import_string(path)() if path else DatabaseQueue()
+    return _queue
+
+
+@receiver(setting_changed)
+def _reset_queue(setting, **kwargs):
+    """Descarta o backend atual quando a setting muda (override_settings nos testes)"""
+    global _queue
+    if setting in ("PIX_STREAM_QUEUE", "PIX_STREAM_QUEUE_REDIS_URL", "PIX_STREAM_QUEUE_REDIS_PREFIX"):
+        _queue = None
@@ -0,0 +1,123 @@
+"""
+Expiração de sessões de stream abandonadas.
+
+Cada pull grava ``StreamSession.last_pull_at`` no mesmo UPDATE que já avança o
+cursor (sem comando extra). Sessões ativas sem pull há mais de
+``PIX_STREAM_SESSION_IDLE_TIMEOUT`` segundos, como as de coletores que caíram
+sem DELETE, são encerradas em lote e suas vagas no limite do ISPB são
+devolvidas.
+
+As mensagens em voo das sessões encerradas voltam para a fila na hora, e a
+mesma passada devolve os lotes cujo prazo de confirmação venceu
+(``PIX_STREAM_VISIBILITY_TIMEOUT``).
+
+O reaper roda pelo comando ``reap_sessions`` ou como tarefa periódica do
+próprio processo (``PIX_STREAM_REAPER_INTERVAL``; 0 desliga), iniciada no
+primeiro stream aberto.
+"""
+import logging
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .admission import recount_sessions
+from .claims import release_expired_messages, release_session_messages
+from .models import IspbStreamCounter, StreamSession
+
+logger = logging.getLogger(__name__)
+
+
+def _idle_filter(cutoff):
+    return Q(last_pull_at__lt=cutoff) | Q(last_pull_at__isnull=True, created_at__lt=cutoff)
+
+
+def run_reaper(idle_timeout=None):
+    """Uma passada completa: sessões ociosas e lotes com prazo vencido"""
+    return reap_idle_sessions(idle_timeout), release_expired_messages()
+
+
+def reap_idle_sessions(idle_timeout=None):
+    """
+    Encerra as sessões ociosas, devolve suas vagas e suas mensagens em voo
+
+    Returns:
+        Quantidade de sessões encerradas
+    """
+    if idle_timeout is None:
+        idle_timeout = settings.PIX_STREAM_SESSION_IDLE_TIMEOUT
+    cutoff = now() - timedelta(seconds=idle_timeout)
+
+    with transaction.atomic():
+        # Sessões no meio de um pull estão travadas pelo avanço do cursor e
+        # não são ociosas: pular em vez de esperar
+        candidates = list(
+            StreamSession.objects.filter(_idle_filter(cutoff), active=True)
+            .select_for_update(skip_locked=True)
+            .values_list("pk", "ispb")
+        )
+        if not candidates:
+            return 0
+
+        reaped = StreamSession.objects.filter(
+            _idle_filter(cutoff),
+            pk__in=[pk for pk, _ in candidates],
+            active=True,
+        ).update(active=False)
+
+        reaped_ids = [pk for pk, _ in candidates]
+        per_ispb = Counter(ispb for _, ispb in candidates)
+        if reaped == len(candidates):
+            for ispb, count in per_ispb.items():
+                IspbStreamCounter.objects.filter(ispb=ispb).update(
+                    active_sessions=F("active_sessions") - count
+                )
+        else:
+            # Sem travas de linha (SQLite) alguma sessão voltou a puxar no meio
+            # do caminho: recalcular os contadores dos ISPBs envolvidos
+            for ispb in per_ispb:
+                recount_sessions(ispb)
+            reaped_ids = list(
+                StreamSession.objects.filter(pk__in=reaped_ids, active=False).values_list("pk", flat=True)
+            )
+
+        release_session_messages(reaped_ids)
+
+    logger.info(f"{reaped} sessões ociosas encerradas")
+    return reaped
+
+
+class _ReaperThread(threading.Thread):
+    def __init__(self, interval):
+        super().__init__(name="pix-session-reaper", daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                run_reaper()
+            except Exception:
+                logger.exception("Falha ao encerrar sessões ociosas")
+            finally:
+                connection.close()
+
+
+_reaper = None
+_reaper_lock = threading.Lock()
+
+
+def ensure_reaper_started():
+    """Inicia a tarefa periódica do reaper neste processo (uma vez)"""
+    global _reaper
+    interval = settings.PIX_STREAM_REAPER_INTERVAL
+    if interval <= 0 or (_reaper is not None and _reaper.is_alive()):
+        return
+    with _reaper_lock:
+        if _reaper is None or not _reaper.is_alive():
+            _reaper = _ReaperThread(interval)
+            _reaper.start()
@@ -1,5 +1,20 @@
 import json
-from rest_framework.renderers import BaseRenderer
+from django.utils.crypto import get_random_string
+from django.utils.functional import cached_property
+from django.utils.http import parse_header_parameters
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .encoders import binary_message
+
+try:
+    import msgpack
+except ImportError:  # dependência opcional (application/msgpack)
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # dependência opcional (application/cbor)
+    cbor2 = None
 
 class MultipartJsonRenderer(BaseRenderer):
     media_type = 'multipart/json'
@@ -9,3 +24,137 @@ class MultipartJsonRenderer(BaseRenderer):
     def render(self, data, media_type=None, renderer_context=None):
         return json.dumps(data).encode(self.charset)
 
+    @staticmethod
+    def batch_parameter(media_type):
+        """Valor do parâmetro ``batch`` do media type aceito (``multipart/json; batch=50``)"""
+        if not media_type:
+            return None
+        _, params = parse_header_parameters(media_type)
+        return params.get('batch')
+
+
+class StreamingRenderer(JSONRenderer):
+    """
+    Base dos formatos de resposta contínua (``StreamingHttpResponse``)
+
+    Cada mensagem já codificada em JSON vira um trecho com ``frame``; ``close``
+    encerra o corpo. Respostas comuns (erros) continuam sendo JSON.
+    """
+
+    def stream_content_type(self):
+        return self.media_type
+
+    def frame(self, body):
+        raise NotImplementedError
+
+    def close(self):
+        return b''
+
+
+class NdjsonRenderer(StreamingRenderer):
+    """Uma mensagem JSON por linha (``application/x-ndjson``)"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def frame(self, body):
+        return body + b'\n'
+
+
+class MultipartMixedRenderer(StreamingRenderer):
+    """Uma parte ``application/json`` por mensagem (``multipart/mixed``)"""
+    media_type = 'multipart/mixed'
+    format = 'multipartmixed'
+
+    @cached_property
+    def boundary(self):
+        # Gerado só quando a resposta é contínua: o DRF instancia todos os
+        # renderers da view a cada requisição
+        return get_random_string(32)
+
+    def stream_content_type(self):
+        return f'{self.media_type}; boundary={self.boundary}'
+
+    def frame(self, body):
+        return b'--%s\r\nContent-Type: application/json\r\n\r\n%s\r\n' % (self.boundary.encode('ascii'), body)
+
+    def close(self):
+        return b'--%s--\r\n' % self.boundary.encode('ascii')
+
+
+class BinaryRenderer(JSONRenderer):
+    """
+    Base dos formatos binários (MessagePack e CBOR)
+
+    Mesma semântica do JSON: ``application/...`` entrega uma mensagem e
+    ``multipart/...`` um array (lote, com ``batch`` no Accept ou em
+    ``?batch=``). ``valor`` é inteiro em centavos e ``dataHoraPagamento``
+    inteiro em microssegundos desde a época Unix (ver
+    ``encoders.binary_message``). Respostas comuns (erros) continuam sendo JSON.
+    """
+    codec = None
+    batch = False
+
+    def dumps(self, data):
+        raise NotImplementedError
+
+    def encode(self, messages):
+        """Bytes da resposta para uma lista de StoredMessage"""
+        if self.batch:
+            return self.dumps([binary_message(message.payload) for message in messages])
+        return self.dumps(binary_message(messages[0].payload))
+
+
+class MsgpackRenderer(BinaryRenderer):
+    """Uma mensagem em MessagePack (``application/msgpack``)"""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    codec = 'msgpack'
+
+    def dumps(self, data):
+        return msgpack.packb(data)
+
+
+class MultipartMsgpackRenderer(MsgpackRenderer):
+    """Lote de mensagens em um array MessagePack (``multipart/msgpack``)"""
+    media_type = 'multipart/msgpack'
+    format = 'multipartmsgpack'
+    batch = True
+
+
+class CborRenderer(BinaryRenderer):
+    """Uma mensagem em CBOR (``application/cbor``)"""
+    media_type = 'application/cbor'
+    format = 'cbor'
+    codec = 'cbor'
+
+    def dumps(self, data):
+        return cbor2.dumps(data)
+
+
+class MultipartCborRenderer(CborRenderer):
+    """Lote de mensagens em um array CBOR (``multipart/cbor``)"""
+    media_type = 'multipart/cbor'
+    format = 'multipartcbor'
+    batch = True
+
+
+def _binary_renderers():
+    renderers = []
+    if msgpack is not None:
+        renderers += [MultipartMsgpackRenderer, MsgpackRenderer]
+    if cbor2 is not None:
+        renderers += [MultipartCborRenderer, CborRenderer]
+    return renderers
+
+
+# Renderers dos endpoints de stream (os binários só com o pacote instalado)
+STREAM_RENDERER_CLASSES = [
+    MultipartJsonRenderer, JSONRenderer, NdjsonRenderer, MultipartMixedRenderer, *_binary_renderers()
+]
+
+
+def accepts_batch(renderer):
+    """Se o formato do renderer entrega lotes (multipart e respostas contínuas)"""
+    if isinstance(renderer, BinaryRenderer):
+        return renderer.batch
+    return isinstance(renderer, (MultipartJsonRenderer, StreamingRenderer))
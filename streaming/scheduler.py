@@ -0,0 +1,206 @@
+"""
+Escalonador do caminho de stream: prioridade, divisão justa e limite por ISPB.
+
+- **Prioridade por mensagem**: ``message_priority`` calcula, na inserção, a
+  coluna ``PixMessage.priority`` (0 ou 1) pelo valor, a partir de
+  ``PIX_STREAM_PRIORITY_MIN_VALOR``. A idade é avaliada no claim: um
+  pagamento feito antes de ``aged_before()`` (há mais de
+  ``PIX_STREAM_PRIORITY_MIN_AGE`` segundos) passa à frente da fila comum
+  enquanto espera, mesmo que tenha chegado novo. O claim tira primeiro as
+  mensagens com prioridade (ver ``streaming/queues.py``).
+- **Divisão justa entre coletores**: cada sessão tem um peso (``?weight=`` no
+  start, padrão 1). Com ``PIX_STREAM_FAIR_SHARE``, o lote de um pull fica
+  limitado à fração do peso da sessão sobre o peso dos coletores do ISPB que
+  puxaram recentemente neste processo. A fração vale sobre a rajada do limite
+  por ISPB ou, sem limite, sobre a soma dos lotes pedidos por esses coletores.
+- **Limite por ISPB**: um balde de fichas por ISPB (``PIX_STREAM_ISPB_RATE``
+  mensagens por segundo, rajada ``PIX_STREAM_ISPB_BURST``). Sem fichas, o pull
+  não vai ao banco: ``Throttled`` diz quanto esperar e o long polling aguarda.
+
+O estado da divisão justa e dos baldes é por processo, como as métricas: com
+``N`` workers, cada ISPB recebe até ``N`` vezes a taxa configurada.
+"""
+import math
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics
+from .models import PixMessage
+
+
+class Throttled(Exception):
+    """O ISPB esgotou o limite de mensagens; tentar de novo em ``retry_after`` s"""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class InvalidWeight(ValueError):
+    """Peso de sessão que não é inteiro entre 1 e PIX_STREAM_MAX_WEIGHT"""
+
+
+def parse_weight(value):
+    """Converte o ``?weight=`` pedido no start (1 se ausente)"""
+    if value is None or value == "":
+        return 1
+    try:
+        weight = int(value)
+    except ValueError:
+        raise InvalidWeight(value)
+    if not 1 <= weight <= settings.PIX_STREAM_MAX_WEIGHT:
+        raise InvalidWeight(value)
+    return weight
+
+
+def priority_enabled():
+    return bool(settings.PIX_STREAM_PRIORITY_MIN_VALOR) or settings.PIX_STREAM_PRIORITY_MIN_AGE > 0
+
+
+def message_priority(valor):
+    """Prioridade gravada na inserção (0 ou 1): a regra do valor"""
+    min_valor = settings.PIX_STREAM_PRIORITY_MIN_VALOR
+    return int(bool(min_valor) and Decimal(valor) >= Decimal(min_valor))
+
+
+def aged_before(reference=None):
+    """Pagamentos feitos antes deste instante têm prioridade por idade (None se desligada)"""
+    min_age = settings.PIX_STREAM_PRIORITY_MIN_AGE
+    if min_age <= 0:
+        return None
+    return (reference or timezone.now()) - timedelta(seconds=min_age)
+
+
+@receiver(pre_save, sender=PixMessage)
+def _set_priority(sender, instance, raw=False, **kwargs):
+    """Mensagens criadas pelo ORM (admin, testes) recebem a prioridade calculada"""
+    if instance._state.adding and not raw and not instance.priority:
+        instance.priority = message_priority(instance.valor)
+
+
+class TokenBucket:
+    """Balde de fichas: ``rate`` fichas por segundo, no máximo ``burst`` acumuladas"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, current):
+        if current > self.updated:
+            self.tokens = min(self.burst, self.tokens + (current - self.updated) * self.rate)
+            self.updated = current
+
+    def take(self, wanted, current):
+        """Tira até ``wanted`` fichas inteiras. Retorna quantas foram tiradas"""
+        self._refill(current)
+        taken = min(wanted, int(self.tokens))
+        self.tokens -= taken
+        return taken
+
+    def give_back(self, count):
+        self.tokens = min(self.burst, self.tokens + count)
+
+    def wait_time(self):
+        """Segundos até haver uma ficha inteira"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Scheduler:
+    """Decide quantas mensagens cada pull pode reivindicar"""
+
+    def __init__(self):
+        self.rate = settings.PIX_STREAM_ISPB_RATE
+        self.burst = settings.PIX_STREAM_ISPB_BURST or max(1, math.ceil(self.rate))
+        self.fair_share = settings.PIX_STREAM_FAIR_SHARE
+        # Coletores que puxaram há menos que isto contam na divisão justa
+        self.horizon = 2 * settings.PIX_STREAM_LONG_POLL_TIMEOUT + 1
+        self._buckets = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _fair_limit(self, ispb, session, limit, current):
+        """
+        Fatia da sessão: seu peso sobre o peso dos coletores recentes do ISPB,
+        aplicada à rajada ou, sem limite por ISPB, à soma dos lotes pedidos
+        """
+        collectors = self._collectors.setdefault(ispb, {})
+        weight = session.weight or 1
+        collectors[session.pk] = (weight, limit, current)
+        cutoff = current - self.horizon
+        total_weight = 0
+        requested = 0
+        for pk, (other_weight, other_limit, seen) in list(collectors.items()):
+            if seen < cutoff:
+                del collectors[pk]
+            else:
+                total_weight += other_weight
+                requested += other_limit
+        base = self.burst if self.rate else requested
+        return min(limit, max(1, math.ceil(base * weight / total_weight)))
+
+    def grant(self, ispb, session, limit):
+        """
+        Quantas mensagens o pull pode reivindicar (no máximo ``limit``)
+
+        Levanta Throttled quando o ISPB não tem fichas. As fichas que o pull
+        não usar voltam com ``settle``.
+        """
+        if not self.rate and not self.fair_share:
+            return limit
+        current = time.monotonic()
+        with self._lock:
+            if self.fair_share:
+                limit = self._fair_limit(ispb, session, limit, current)
+            if not self.rate:
+                return limit
+            bucket = self._buckets.get(ispb)
+            if bucket is None:
+                bucket = self._buckets[ispb] = TokenBucket(self.rate, self.burst)
+            granted = bucket.take(limit, current)
+            if not granted:
+                metrics.THROTTLED_PULLS.inc()
+                raise Throttled(bucket.wait_time())
+        return granted
+
+    def settle(self, ispb, granted, used):
+        """Devolve as fichas de um pull que reivindicou menos que o concedido"""
+        if self.rate and used < granted:
+            with self._lock:
+                self._buckets[ispb].give_back(granted - used)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Retorna o escalonador do processo"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler()
+    return _scheduler
+
+
+@receiver(setting_changed)
+def _reset_scheduler(setting, **kwargs):
+    """Descarta o escalonador atual quando uma setting dele muda (override_settings nos testes)"""
+    global _scheduler
+    if setting in (
+        "PIX_STREAM_ISPB_RATE",
+        "PIX_STREAM_ISPB_BURST",
+        "PIX_STREAM_FAIR_SHARE",
+        "PIX_STREAM_LONG_POLL_TIMEOUT",
+    ):
+        _scheduler = None
@@ -0,0 +1,47 @@
+"""
+Respostas de stream contínuas (``StreamingHttpResponse``).
+
+Com ``Accept: application/x-ndjson`` (uma mensagem por linha) ou
+``Accept: multipart/mixed`` (uma parte ``application/json`` por mensagem), uma
+única requisição mantém a conexão aberta por até ``PIX_STREAM_WINDOW``
+segundos e envia cada lote assim que ele é reivindicado, até
+``PIX_STREAM_WINDOW_MAX_MESSAGES`` mensagens. Só o lote atual fica em memória.
+
+O interactionId é rotacionado antes do primeiro byte, então o ``Pull-Next``
+enviado nos cabeçalhos já aponta para o cursor que continua de onde a janela
+parar. Os lotes da janela avançam esse cursor sem rotacioná-lo; se o stream
+for finalizado (DELETE) ou continuado por outra requisição, a janela termina.
+
+Os passos da janela ficam em ``pulls.StreamWindow``. Aqui só a espera
+bloqueante entre os lotes; a versão assíncrona (``aiter_stream``) fica em
+``async_views.py``.
+"""
+import logging
+
+from .cursors import StaleCursor
+from .notify import get_notifier
+from .pulls import StreamWindow
+
+logger = logging.getLogger(__name__)
+
+
+def iter_stream(renderer, ispb, session, batch=None):
+    """Gerador dos trechos do corpo de uma janela de stream (views síncronas)"""
+    window = StreamWindow(renderer, ispb, session, batch)
+    try:
+        with get_notifier().subscribe(ispb) as subscription:
+            while True:
+                chunk, timeout = window.pull()
+                if chunk:
+                    yield chunk
+                if timeout is None:
+                    break
+                if timeout:
+                    subscription.wait(timeout)
+        window.finish()
+    except StaleCursor:
+        logger.info(f"Janela de stream encerrada para ISPB {ispb}: cursor consumido por outra requisição")
+
+    closing = window.close()
+    if closing:
+        yield closing
@@ -1,25 +1,47 @@
 from rest_framework.test import APITestCase
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
 from rest_framework import status
 from django.urls import reverse
-from .models import PixMessage, StreamSession
+from . import metrics, queues
+from .claims import claim_message_ids, release_session_messages
+from .cursors import StaleCursor, pull_batch
+from .encoders import message_from_instance, message_to_dict
+from .generators import PixMessageFactory, generate_messages
+from .hotcache import ENTRY_OVERHEAD, HotRowCache, get_hot_cache
+from .models import IspbStreamCounter, PixMessage, PixMessageArchive, StreamSession
+from .scheduler import Throttled, aged_before, get_scheduler, message_priority
 from django.utils.crypto import get_random_string
 from django.utils import timezone
 import json
+import os
 import time
+import zlib
+from datetime import timedelta
+from decimal import Decimal
+import threading
 from unittest.mock import patch
 
 
-class PixStreamAPITests(APITestCase):
-    """Testes de integração para a API de streaming Pix"""
+def require_concurrent_writes(test):
+    """
+    Pula o teste de concorrência no SQLite em memória compartilhada
+
+    Ele não suporta escrita concorrente entre threads; os testes rodam no
+    PostgreSQL (CI) ou num SQLite em arquivo. Com
+    ``PIX_TEST_REQUIRE_CONCURRENCY=1`` o pulo vira falha, para o CI não
+    passar sem exercitar a concorrência.
+    """
+    if connection.vendor == "sqlite" and connection.is_in_memory_db():
+        reason = "SQLite em memória compartilhada não suporta escrita concorrente entre threads"
+        if os.environ.get("PIX_TEST_REQUIRE_CONCURRENCY") == "1":
+            test.fail(reason)
+        test.skipTest(reason)
 
-    def setUp(self):
-        """Configuração inicial para cada teste"""
-        self.ispb = "12345678"
-        self.start_url = f"/api/pix/{self.ispb}/stream/start"
-        
-        # Limpar sessões e mensagens antes de cada teste para garantir um estado limpo
-        StreamSession.objects.all().delete()
-        PixMessage.objects.all().delete()
+
+class PixMessagesMixin:
+    """Criação de mensagens Pix pelo ORM, compartilhada pelas classes de teste (usa ``self.ispb``)"""
 
     def _create_pix_messages(self, count=1, ispb=None):
         """Helper para criar mensagens Pix para os testes"""
@@ -48,6 +70,20 @@ class PixStreamAPITests(APITestCase):
             ))
         return messages
 
+
+@override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixStreamAPITests(PixMessagesMixin, APITestCase):
+    """Testes de integração para a API de streaming Pix"""
+
+    def setUp(self):
+        """Configuração inicial para cada teste"""
+        self.ispb = "12345678"
+        self.start_url = f"/api/pix/{self.ispb}/stream/start"
+        
+        # Limpar sessões e mensagens antes de cada teste para garantir um estado limpo
+        StreamSession.objects.all().delete()
+        PixMessage.objects.all().delete()
+
     def _extract_interaction_id_from_pull_next(self, pull_next_header):
         """Extrai o interaction_id do cabeçalho Pull-Next"""
         # Pull-Next format: "/api/pix/12345678/stream/ABC123DEF456"
@@ -94,16 +130,16 @@ class PixStreamAPITests(APITestCase):
         self.assertEqual(len(data), 5)
         self.assertIn("endToEndId", data[0])
 
-    @patch('streaming.views.time.sleep')  # Mock do sleep para acelerar o teste
-    def test_start_stream_no_messages_returns_204(self, mock_sleep):
+    def test_start_stream_no_messages_returns_204(self):
         """Teste: GET /stream/start sem mensagens deve retornar 204 após long polling"""
         # Não criar mensagens
         
+        started = time.monotonic()
         response = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
         
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertIn("Pull-Next", response.headers)
-        mock_sleep.assert_called_once_with(8)  # Verifica se o long polling foi executado
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)  # Verifica se o long polling foi executado
 
     def test_start_stream_session_limit_reached(self):
         """Teste: GET /stream/start deve retornar 429 quando limite de 6 sessões é atingido"""
@@ -128,13 +164,75 @@ class PixStreamAPITests(APITestCase):
         self.assertIsInstance(data, list)
         self.assertEqual(len(data), 10)  # Deve retornar apenas 10
 
+    def test_start_stream_multipart_batch_query_param(self):
+        """Teste: ?batch=N define o tamanho do lote multipart/json"""
+        self._create_pix_messages(count=30)
+
+        response = self.client.get(f"{self.start_url}?batch=25", HTTP_ACCEPT="multipart/json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self._get_response_data(response)), 25)
+
+    def test_start_stream_multipart_batch_accept_param(self):
+        """Teste: o parâmetro batch do Accept define o tamanho do lote"""
+        self._create_pix_messages(count=10)
+
+        response = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json; batch=3")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self._get_response_data(response)), 3)
+
+    @override_settings(PIX_STREAM_MAX_BATCH_SIZE=5)
+    def test_start_stream_batch_limited_by_server_maximum(self):
+        """Teste: lotes acima de PIX_STREAM_MAX_BATCH_SIZE são limitados ao máximo"""
+        self._create_pix_messages(count=10)
+
+        response = self.client.get(f"{self.start_url}?batch=100", HTTP_ACCEPT="multipart/json")
+
+        self.assertEqual(len(self._get_response_data(response)), 5)
+
+    def test_start_stream_invalid_batch_returns_400(self):
+        """Teste: batch inválido retorna 400 sem abrir sessão"""
+        for value in ("0", "-1", "abc"):
+            response = self.client.get(f"{self.start_url}?batch={value}", HTTP_ACCEPT="multipart/json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StreamSession.objects.exists())
+
+    def test_application_json_ignores_batch(self):
+        """Teste: application/json sempre entrega uma única mensagem"""
+        self._create_pix_messages(count=5)
+
+        response = self.client.get(f"{self.start_url}?batch=5", HTTP_ACCEPT="application/json")
+
+        self.assertIsInstance(self._get_response_data(response), dict)
+
+    def test_adaptive_batch_grows_with_backlog_and_shrinks(self):
+        """Teste: batch=adaptive dobra com lotes cheios e cai pela metade com backlog raso"""
+        self._create_pix_messages(count=45)
+
+        sizes = []
+        response = self.client.get(f"{self.start_url}?batch=adaptive", HTTP_ACCEPT="multipart/json")
+        sizes.append(len(self._get_response_data(response)))
+        for _ in range(2):
+            response = self.client.get(f"{response.headers['Pull-Next']}?batch=adaptive", HTTP_ACCEPT="multipart/json")
+            sizes.append(len(self._get_response_data(response)))
+
+        self.assertEqual(sizes, [10, 20, 15])
+        session = StreamSession.objects.get(ispb=self.ispb)
+        self.assertEqual(session.batch_size, 20)
+
     # ==================== TESTES PARA STREAM/CONTINUE ====================
 
+    def _start_stream(self, accept="application/json"):
+        """Helper para iniciar um stream e retornar a URL do Pull-Next"""
+        response = self.client.get(self.start_url, HTTP_ACCEPT=accept)
+        self.assertIn("Pull-Next", response.headers)
+        return response.headers["Pull-Next"]
+
     def test_continue_stream_application_json(self):
         """Teste: GET /stream/{id} com Accept: application/json"""
         self._create_pix_messages(count=2)
-        interaction_id = "test123"
-        continue_url = f"/api/pix/{self.ispb}/stream/{interaction_id}"
+        continue_url = self._start_stream()
         
         response = self.client.get(continue_url, HTTP_ACCEPT="application/json")
         
@@ -145,9 +243,8 @@ class PixStreamAPITests(APITestCase):
 
     def test_continue_stream_multipart_json(self):
         """Teste: GET /stream/{id} com Accept: multipart/json"""
-        self._create_pix_messages(count=5)
-        interaction_id = "test456"
-        continue_url = f"/api/pix/{self.ispb}/stream/{interaction_id}"
+        self._create_pix_messages(count=15)
+        continue_url = self._start_stream(accept="multipart/json")
         
         response = self.client.get(continue_url, HTTP_ACCEPT="multipart/json")
         
@@ -155,17 +252,17 @@ class PixStreamAPITests(APITestCase):
         self.assertIn("Pull-Next", response.headers)
         data = self._get_response_data(response)
         self.assertIsInstance(data, list)
+        self.assertEqual(len(data), 5)  # Restante depois das 10 do start
 
     def test_continue_stream_no_session_limit_check(self):
         """Teste: GET /stream/{id} não deve verificar limite de sessões"""
-        # Criar 6 sessões ativas (que bloquearia stream/start)
-        for i in range(6):
+        self._create_pix_messages(count=2)
+        continue_url = self._start_stream()
+
+        # Completar 6 sessões ativas (que bloqueariam stream/start)
+        for i in range(5):
             StreamSession.objects.create(ispb=self.ispb, active=True)
         
-        self._create_pix_messages(count=1)
-        interaction_id = "test789"
-        continue_url = f"/api/pix/{self.ispb}/stream/{interaction_id}"
-        
         response = self.client.get(continue_url, HTTP_ACCEPT="application/json")
         
         # Deve funcionar mesmo com 6 sessões ativas
@@ -176,7 +273,7 @@ class PixStreamAPITests(APITestCase):
     def test_delete_stream_success(self):
         """Teste: DELETE /stream/{id} deve retornar 200 e finalizar sessão"""
         # Criar uma sessão ativa
-        session = StreamSession.objects.create(ispb=self.ispb, active=True)
+        session = StreamSession.objects.create(ispb=self.ispb, active=True, interaction_id="delete123")
         interaction_id = "delete123"
         delete_url = f"/api/pix/{self.ispb}/stream/{interaction_id}"
         
@@ -201,6 +298,105 @@ class PixStreamAPITests(APITestCase):
         data = self._get_response_data(response)
         self.assertEqual(data, {})
 
+    def test_delete_stream_closes_only_owning_session(self):
+        """Teste: DELETE /stream/{id} deve encerrar exatamente a sessão dona do interactionId"""
+        other = StreamSession.objects.create(ispb=self.ispb, active=True, interaction_id="other123")
+        owner = StreamSession.objects.create(ispb=self.ispb, active=True, interaction_id="owner123")
+
+        response = self.client.delete(f"/api/pix/{self.ispb}/stream/owner123")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        owner.refresh_from_db()
+        other.refresh_from_db()
+        self.assertFalse(owner.active)
+        self.assertTrue(other.active)
+
+    # ==================== TESTES DE CURSOR (PULL-NEXT) ====================
+
+    def test_continue_unknown_interaction_id_returns_404(self):
+        """Teste: GET /stream/{id} com interactionId desconhecido deve retornar 404"""
+        self._create_pix_messages(count=1)
+
+        response = self.client.get(f"/api/pix/{self.ispb}/stream/naoexiste123", HTTP_ACCEPT="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(PixMessage.objects.filter(claimed_by_stream__isnull=False).exists())
+
+    def test_continue_expired_interaction_id_returns_404(self):
+        """Teste: GET /stream/{id} com cursor expirado deve retornar 404"""
+        self._create_pix_messages(count=2)
+        continue_url = self._start_stream()
+        StreamSession.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.client.get(continue_url, HTTP_ACCEPT="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_continue_claims_after_cursor_without_repeating(self):
+        """Teste: continuações reivindicam mensagens em ordem, sem repetir, e rotacionam o Pull-Next"""
+        created = self._create_pix_messages(count=3)
+        pull_next = self._start_stream()
+        delivered = [PixMessage.objects.get(id=created[0].id).end_to_end_id]
+
+        for _ in range(2):
+            response = self.client.get(pull_next, HTTP_ACCEPT="application/json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotEqual(response.headers["Pull-Next"], pull_next)
+            delivered.append(self._get_response_data(response)["endToEndId"])
+            pull_next = response.headers["Pull-Next"]
+
+        self.assertEqual(delivered, [msg.end_to_end_id for msg in created])
+        session = StreamSession.objects.get()
+        self.assertEqual(session.last_message_id, created[-1].id)
+        self.assertEqual(PixMessage.objects.filter(claimed_by_stream=session).count(), 3)
+
+    def test_empty_pull_scans_after_cursor_once(self):
+        """Teste: um pull vazio faz um único claim, a partir do cursor, sem reler a fila desde o início"""
+
+        created = self._create_pix_messages(count=2)
+        session = StreamSession.objects.create(ispb=self.ispb, last_message_id=created[-1].id)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(pull_batch(self.ispb, session, 5), [])
+
+        claims = [query["sql"] for query in queries.captured_queries if "SET claimed_by_stream_id" in query["sql"]]
+        self.assertEqual(len(claims), 1)
+        self.assertIn("id >", claims[0])
+
+    def test_late_commit_moves_cursor_back(self):
+        """Teste: mensagem commitada depois de uma com id maior recua o cursor e é entregue"""
+        from .queues import get_queue
+
+        late, newer = self._create_pix_messages(count=2)
+        pull_next = self._start_stream()
+        PixMessage.objects.filter(pk=late.pk).update(claimed_by_stream=None, claimed=False, visible_at=None)
+        StreamSession.objects.update(last_message_id=newer.id)  # Como se late tivesse sido commitada depois
+
+        with self.captureOnCommitCallbacks(execute=True):
+            get_queue().publish(self.ispb, [late.pk])
+
+        response = self.client.get(pull_next, HTTP_ACCEPT="application/json")
+        self.assertEqual(self._get_response_data(response)["endToEndId"], late.end_to_end_id)
+
+    def test_continue_with_consumed_interaction_id_returns_404(self):
+        """Teste: um interactionId já rotacionado não pode ser reutilizado"""
+        self._create_pix_messages(count=3)
+        first_pull_next = self._start_stream()
+        self.client.get(first_pull_next, HTTP_ACCEPT="application/json")
+
+        response = self.client.get(first_pull_next, HTTP_ACCEPT="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_empty_start_keeps_cursor_for_continue(self):
+        """Teste: stream iniciado sem mensagens mantém o cursor para a continuação"""
+        pull_next = self._start_stream()
+        self._create_pix_messages(count=1)
+
+        response = self.client.get(pull_next, HTTP_ACCEPT="application/json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     # ==================== TESTES DE FLUXO COMPLETO ====================
 
     def test_complete_stream_flow(self):
@@ -231,14 +427,14 @@ class PixStreamAPITests(APITestCase):
         # Criar 6 sessões ativas para atingir o limite
         sessions = []
         for i in range(6):
-            sessions.append(StreamSession.objects.create(ispb=self.ispb, active=True))
+            sessions.append(StreamSession.objects.create(ispb=self.ispb, active=True, interaction_id=f"test12{i}"))
         
         # Tentar iniciar stream (deve falhar)
         response = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
         self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
         
         # Finalizar um stream via DELETE
-        delete_url = f"/api/pix/{self.ispb}/stream/test123"
+        delete_url = f"/api/pix/{self.ispb}/stream/test120"
         delete_response = self.client.delete(delete_url)
         self.assertEqual(delete_response.status_code, status.HTTP_200_OK)
         
@@ -285,6 +481,293 @@ class PixStreamAPITests(APITestCase):
         self.assertEqual(response2.status_code, status.HTTP_204_NO_CONTENT)
 
 
+@override_settings(PIX_STREAM_WINDOW=0.2, PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixStreamingResponseTests(PixMessagesMixin, APITestCase):
+    """Testes das respostas contínuas (NDJSON e multipart/mixed)"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def _body(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_ndjson_window_delivers_all_batches_in_one_response(self):
+        """Teste: uma janela NDJSON entrega vários lotes, uma mensagem por linha"""
+        created = self._create_pix_messages(count=25)
+
+        response = self.client.get(self.start_url, HTTP_ACCEPT="application/x-ndjson")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = self._body(response).splitlines()
+        self.assertEqual(
+            [json.loads(line)["endToEndId"] for line in lines],
+            [msg.end_to_end_id for msg in created],
+        )
+        self.assertEqual(PixMessage.objects.filter(claimed_by_stream__isnull=True).count(), 0)
+
+    def test_multipart_mixed_emits_one_part_per_message(self):
+        """Teste: multipart/mixed envia cada mensagem como uma parte application/json"""
+        created = self._create_pix_messages(count=3)
+
+        response = self.client.get(self.start_url, HTTP_ACCEPT="multipart/mixed")
+
+        content_type = response["Content-Type"]
+        self.assertTrue(content_type.startswith("multipart/mixed; boundary="))
+        boundary = content_type.split("boundary=")[1].encode()
+        body = self._body(response)
+        self.assertTrue(body.endswith(b"--" + boundary + b"--\r\n"))
+        parts = body.split(b"--" + boundary)[1:-1]
+        self.assertEqual(len(parts), 3)
+        for part, msg in zip(parts, created):
+            headers, payload = part.split(b"\r\n\r\n", 1)
+            self.assertIn(b"Content-Type: application/json", headers)
+            self.assertEqual(json.loads(payload)["endToEndId"], msg.end_to_end_id)
+
+    @override_settings(PIX_STREAM_WINDOW_MAX_MESSAGES=7)
+    def test_window_message_cap_and_pull_next_continuation(self):
+        """Teste: a janela para no limite de mensagens e o Pull-Next continua dali"""
+        created = self._create_pix_messages(count=10)
+
+        response = self.client.get(f"{self.start_url}?batch=4", HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(len(self._body(response).splitlines()), 7)
+
+        follow = self.client.get(response["Pull-Next"], HTTP_ACCEPT="multipart/json")
+        self.assertEqual(
+            [msg["endToEndId"] for msg in json.loads(follow.content)],
+            [msg.end_to_end_id for msg in created[7:]],
+        )
+
+    def test_streaming_continue_consumes_interaction_id(self):
+        """Teste: o interactionId usado por uma janela não pode ser reutilizado"""
+        start = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
+        pull_next = start["Pull-Next"]
+
+        window = self.client.get(pull_next, HTTP_ACCEPT="application/x-ndjson")
+        self._body(window)
+        reused = self.client.get(pull_next, HTTP_ACCEPT="application/x-ndjson")
+
+        self.assertNotEqual(window["Pull-Next"], pull_next)
+        self.assertEqual(reused.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(reused["Content-Type"], "application/json")
+
+
+@override_settings(PIX_STREAM_WINDOW=0.2, PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixCompressionTests(PixMessagesMixin, TransactionTestCase):
+    """Testes da compressão das respostas negociada por Accept-Encoding"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def _decompress(self, encoding, body):
+        from . import compression
+
+        if encoding == "gzip":
+            return zlib.decompress(body, 31)
+        if encoding == "zstd":
+            return compression.zstandard.ZstdDecompressor().decompressobj().decompress(body)
+        return compression.brotli.decompress(body)
+
+    def test_select_encoding(self):
+        """Teste: maior q vence; no empate, a preferência do servidor; * cobre as não citadas"""
+        from .compression import select_encoding
+
+        encodings = ("zstd", "br", "gzip")
+        self.assertEqual(select_encoding("gzip, deflate, br", encodings), "br")
+        self.assertEqual(select_encoding("gzip;q=1.0, zstd;q=0.5", encodings), "gzip")
+        self.assertEqual(select_encoding("x-gzip", encodings), "gzip")
+        self.assertEqual(select_encoding("*", encodings), "zstd")
+        self.assertEqual(select_encoding("*;q=0.5, zstd;q=0", encodings), "br")
+        self.assertIsNone(select_encoding("gzip;q=0, identity", encodings))
+        self.assertIsNone(select_encoding("", encodings))
+
+    def test_batch_compressed_with_each_encoding(self):
+        """Teste: lote multipart/json comprimido com a codificação aceita"""
+        from . import compression
+
+        self._create_pix_messages(count=30)
+        installed = {"gzip": True, "zstd": compression.zstandard is not None, "br": compression.brotli is not None}
+        pulled = []
+        url = f"{self.start_url}?batch=10"
+        for encoding in ("gzip", "zstd", "br"):
+            if not installed[encoding]:
+                continue
+            response = self.client.get(url, HTTP_ACCEPT="multipart/json", HTTP_ACCEPT_ENCODING=encoding)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response["Content-Encoding"], encoding)
+            self.assertEqual(response["Content-Length"], str(len(response.content)))
+            self.assertIn("Accept-Encoding", response["Vary"])
+            messages = json.loads(self._decompress(encoding, response.content))
+            self.assertEqual(len(messages), 10)
+            pulled += [message["endToEndId"] for message in messages]
+            url = f"{response['Pull-Next']}?batch=10"
+        self.assertEqual(len(set(pulled)), len(pulled))
+
+    def test_small_and_disabled_responses_not_compressed(self):
+        """Teste: uma mensagem (abaixo do mínimo) e PIX_STREAM_COMPRESSION vazio saem sem compressão"""
+        created = self._create_pix_messages(count=12)
+
+        single = self.client.get(self.start_url, HTTP_ACCEPT="application/json", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(single.has_header("Content-Encoding"))
+        self.assertEqual(json.loads(single.content)["endToEndId"], created[0].end_to_end_id)
+
+        with override_settings(PIX_STREAM_COMPRESSION=""):
+            batch = self.client.get(
+                f"{single['Pull-Next']}?batch=10", HTTP_ACCEPT="multipart/json", HTTP_ACCEPT_ENCODING="gzip"
+            )
+        self.assertFalse(batch.has_header("Content-Encoding"))
+        self.assertEqual(len(json.loads(batch.content)), 10)
+
+    def test_stream_chunks_decodable_as_they_arrive(self):
+        """Teste: cada trecho de uma resposta contínua pode ser descomprimido ao chegar"""
+        created = self._create_pix_messages(count=5)
+
+        response = self.client.get(
+            f"{self.start_url}?batch=2", HTTP_ACCEPT="application/x-ndjson", HTTP_ACCEPT_ENCODING="gzip"
+        )
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertFalse(response.has_header("Content-Length"))
+        decompressor = zlib.decompressobj(31)
+        lines = []
+        for chunk in response.streaming_content:
+            text = decompressor.decompress(chunk)
+            self.assertTrue(not text or text.endswith(b"\n"))
+            lines += text.splitlines()
+        self.assertTrue(decompressor.eof)
+        self.assertEqual([json.loads(line)["endToEndId"] for line in lines], [m.end_to_end_id for m in created])
+
+    @override_settings(ROOT_URLCONF="streaming.async_urls", PIX_STREAM_NOTIFIER="streaming.notify.LocalNotifier")
+    async def test_async_views_compress(self):
+        """Teste: as views assíncronas comprimem lotes e respostas contínuas"""
+        from asgiref.sync import sync_to_async
+
+        created = await sync_to_async(self._create_pix_messages)(count=12)
+
+        batch = await self.async_client.get(
+            f"{self.start_url}?batch=10", headers={"Accept": "multipart/json", "Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(batch["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(zlib.decompress(batch.content, 31))), 10)
+
+        window = await self.async_client.get(
+            batch["Pull-Next"], headers={"Accept": "application/x-ndjson", "Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(window["Content-Encoding"], "gzip")
+        body = b"".join([chunk async for chunk in window.streaming_content])
+        self.assertEqual(
+            [json.loads(line)["endToEndId"] for line in zlib.decompress(body, 31).splitlines()],
+            [m.end_to_end_id for m in created[10:]],
+        )
+
+
+class PixBinaryFormatTests(PixMessagesMixin, TransactionTestCase):
+    """Testes dos formatos binários (MessagePack e CBOR): ida e volta contra o JSON"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def setUp(self):
+        from . import renderers
+
+        if renderers.msgpack is None or renderers.cbor2 is None:
+            self.skipTest("msgpack ou cbor2 não está instalado")
+        self.codecs = {
+            "msgpack": (renderers.msgpack.packb, renderers.msgpack.unpackb),
+            "cbor": (renderers.cbor2.dumps, renderers.cbor2.loads),
+        }
+        self.loads = {codec: loads for codec, (_, loads) in self.codecs.items()}
+
+    def _json(self, message):
+        return json.loads(bytes(PixMessage.objects.get(pk=message.pk).payload))
+
+    def _assert_round_trip(self, decoded, expected):
+        """O binário decodificado volta exatamente ao formato de fio JSON"""
+        from datetime import datetime, timezone as dt_timezone
+
+        decoded = dict(decoded)
+        self.assertIsInstance(decoded["valor"], int)
+        self.assertIsInstance(decoded["dataHoraPagamento"], int)
+        decoded["valor"] = f"{Decimal(decoded['valor']).scaleb(-2):f}"
+        moment = datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=decoded.pop("dataHoraPagamento"))
+        expected = dict(expected)
+        self.assertEqual(moment, datetime.fromisoformat(expected.pop("dataHoraPagamento")))
+        self.assertEqual(decoded, expected)
+
+    def test_batch_round_trip(self):
+        """Teste: multipart/msgpack e multipart/cbor entregam lotes equivalentes ao JSON"""
+        created = self._create_pix_messages(count=6)
+
+        msgpack_batch = self.client.get(f"{self.start_url}?batch=3", HTTP_ACCEPT="multipart/msgpack")
+        self.assertEqual(msgpack_batch.status_code, status.HTTP_200_OK)
+        self.assertEqual(msgpack_batch["Content-Type"], "multipart/msgpack")
+        cbor_batch = self.client.get(msgpack_batch["Pull-Next"], HTTP_ACCEPT="multipart/cbor; batch=3")
+        self.assertEqual(cbor_batch["Content-Type"], "multipart/cbor")
+
+        decoded = self.loads["msgpack"](msgpack_batch.content) + self.loads["cbor"](cbor_batch.content)
+        self.assertEqual(len(decoded), 6)
+        for message, data in zip(created, decoded):
+            self._assert_round_trip(data, self._json(message))
+
+    def test_single_message_round_trip(self):
+        """Teste: application/msgpack e application/cbor entregam uma mensagem (mapa)"""
+        created = self._create_pix_messages(count=2)
+
+        first = self.client.get(self.start_url, HTTP_ACCEPT="application/msgpack")
+        second = self.client.get(first["Pull-Next"], HTTP_ACCEPT="application/cbor")
+
+        self.assertEqual(first["Content-Type"], "application/msgpack")
+        self._assert_round_trip(self.loads["msgpack"](first.content), self._json(created[0]))
+        self.assertEqual(second["Content-Type"], "application/cbor")
+        self._assert_round_trip(self.loads["cbor"](second.content), self._json(created[1]))
+
+    @override_settings(TIME_ZONE="America/Sao_Paulo")
+    def test_scaled_valor_and_epoch_edge_values(self):
+        """Teste: centavos e microssegundos exatos, inclusive fora de UTC"""
+        from datetime import datetime, timezone as dt_timezone
+        from .encoders import binary_message, instance_payload
+
+        messages = self._create_pix_messages(count=3)
+        cases = [
+            (Decimal("0.01"), datetime(1970, 1, 1, tzinfo=dt_timezone.utc), 1, 0),
+            (Decimal("99999999.99"), datetime(2024, 2, 29, 23, 59, 59, 999999, tzinfo=dt_timezone.utc),
+             9999999999, 1709251199999999),
+            (Decimal("100"), datetime(2024, 1, 1, 12, 0, 0, 123, tzinfo=dt_timezone.utc), 10000, 1704110400000123),
+        ]
+        for message, (valor, data_pagamento, cents, micros) in zip(messages, cases):
+            message.valor, message.data_pagamento = valor, data_pagamento
+            payload = instance_payload(message)
+            data = binary_message(payload)
+            self.assertEqual((data["valor"], data["dataHoraPagamento"]), (cents, micros))
+            for dumps, loads in self.codecs.values():
+                self._assert_round_trip(loads(dumps(data)), json.loads(payload))
+
+    def test_errors_are_json(self):
+        """Teste: erros com Accept binário continuam sendo documentos JSON"""
+        response = self.client.get(f"{self.start_url}?batch=abc", HTTP_ACCEPT="multipart/msgpack")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(response.content), {"detail": "Parâmetro batch inválido."})
+
+    @override_settings(ROOT_URLCONF="streaming.async_urls", PIX_STREAM_NOTIFIER="streaming.notify.LocalNotifier")
+    async def test_async_views(self):
+        """Teste: as views assíncronas negociam os mesmos formatos binários"""
+        from asgiref.sync import sync_to_async
+
+        created = await sync_to_async(self._create_pix_messages)(count=4)
+        expected = [await sync_to_async(self._json)(message) for message in created]
+
+        batch = await self.async_client.get(self.start_url, headers={"Accept": "multipart/cbor; batch=4"})
+
+        self.assertEqual(batch["Content-Type"], "multipart/cbor")
+        decoded = self.loads["cbor"](batch.content)
+        self.assertEqual(len(decoded), 4)
+        for data, wire in zip(decoded, expected):
+            self._assert_round_trip(data, wire)
+
+
 class PixStreamUnitTests(APITestCase):
     """Testes unitários para componentes específicos"""
 
@@ -304,6 +787,86 @@ class PixStreamUnitTests(APITestCase):
         self.assertEqual(len(result), 11)
         self.assertTrue(result.isdigit())
 
+    def test_pix_message_factory_is_reproducible_with_seed(self):
+        """Teste: PixMessageFactory com a mesma seed gera as mesmas mensagens"""
+
+        first = PixMessageFactory(seed=42).build("12345678", 50)
+        second = PixMessageFactory(seed=42).build("12345678", 50)
+        other = PixMessageFactory(seed=7).build("12345678", 50)
+
+        fields = lambda msg: (msg.end_to_end_id, msg.valor, msg.pagador_cpf_cnpj, msg.tx_id, msg.recebedor_tipo_conta)
+        self.assertEqual([fields(m) for m in first], [fields(m) for m in second])
+        self.assertNotEqual([fields(m) for m in first], [fields(m) for m in other])
+
+    def test_pix_message_factory_field_formats(self):
+        """Teste: PixMessageFactory gera campos no mesmo formato do gerador original"""
+
+        for msg in PixMessageFactory(seed=1).build("12345678", 200):
+            self.assertEqual(len(msg.end_to_end_id), 26)
+            self.assertTrue(msg.end_to_end_id.startswith("E12345678"))
+            self.assertTrue(msg.end_to_end_id.isalnum())
+            self.assertTrue(msg.pagador_cpf_cnpj.isdigit())
+            self.assertEqual(len(msg.pagador_cpf_cnpj), 11)
+            self.assertEqual(len(msg.pagador_agencia), 4)
+            self.assertTrue(1 <= msg.valor <= 1000)
+            self.assertEqual(msg.valor.as_tuple().exponent, -2)
+            self.assertIn(msg.pagador_tipo_conta, ("CACC", "SVGS"))
+            self.assertEqual(msg.recebedor_ispb, "12345678")
+
+    def test_generate_endpoint_bulk_inserts(self):
+        """Teste: POST /api/util/msgs insere as mensagens em lotes"""
+        with self.settings(PIX_GENERATE_CHUNK_SIZE=7):
+            response = self.client.post("/api/util/msgs/12345678/20?seed=3")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(PixMessage.objects.filter(recebedor_ispb="12345678").count(), 20)
+
+    def test_generate_endpoint_reuses_seed(self):
+        """Teste: a mesma seed pode ser repetida no mesmo ISPB e em outro ISPB"""
+        for ispb in ("11111111", "22222222", "22222222"):
+            response = self.client.post(f"/api/util/msgs/{ispb}/5?seed=1")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(PixMessage.objects.filter(recebedor_ispb="11111111").count(), 5)
+        self.assertEqual(PixMessage.objects.filter(recebedor_ispb="22222222").count(), 10)
+        first, second = (
+            sorted(PixMessage.objects.filter(recebedor_ispb=ispb).values_list("tx_id", flat=True))
+            for ispb in ("11111111", "22222222")
+        )
+        # Mesmo conteúdo (seed), identificadores diferentes
+        self.assertEqual(sorted(set(second)), first)
+
+    def test_generate_endpoint_invalid_seed(self):
+        """Teste: seed inválida deve retornar 400"""
+        response = self.client.post("/api/util/msgs/12345678/5?seed=abc")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PIX_STREAM_MAX_BATCH_SIZE=64)
+    def test_next_adaptive_size(self):
+        """Teste: regra do lote adaptativo entre 1 e o máximo"""
+        from .batching import next_adaptive_size
+
+        self.assertEqual(next_adaptive_size(10, 10), 20)
+        self.assertEqual(next_adaptive_size(40, 40), 64)
+        self.assertEqual(next_adaptive_size(10, 5), 10)
+        self.assertEqual(next_adaptive_size(10, 4), 5)
+        self.assertEqual(next_adaptive_size(1, 0), 1)
+
+    def test_claim_messages_is_fifo(self):
+        """Teste: o claim entrega as mensagens mais antigas primeiro (ordem de id)"""
+        from .claims import claim_messages
+
+        generate_messages("12345678", 25, seed=11)
+        session = StreamSession.objects.create(ispb="12345678")
+        expected = list(PixMessage.objects.order_by("id").values_list("id", flat=True))
+
+        delivered = []
+        while batch := claim_messages("12345678", session, 10):
+            delivered.extend(msg.id for msg in batch)
+
+        self.assertEqual(delivered, expected)
+
     def test_pix_message_model_creation(self):
         """Teste: Criação de PixMessage com campos obrigatórios"""
         message = PixMessage.objects.create(
@@ -338,3 +901,1708 @@ class PixStreamUnitTests(APITestCase):
         self.assertEqual(session.ispb, "12345678")
         self.assertTrue(session.active)  # Deve ser True por padrão
 
+
+
+class PixClaimConcurrencyTests(TransactionTestCase):
+    """Testes de concorrência para o motor de claim (SKIP LOCKED)"""
+
+    def test_concurrent_collectors_never_overlap(self):
+        """Teste: vários coletores simultâneos no mesmo ISPB não recebem mensagens repetidas"""
+        from .claims import claim_messages
+
+        require_concurrent_writes(self)
+
+        ispb = "12345678"
+        PixMessage.objects.bulk_create([
+            PixMessage(
+                end_to_end_id=f"E{ispb}2024{i:010d}",
+                valor=100,
+                pagador_nome="Pagador",
+                pagador_cpf_cnpj="11122233344",
+                pagador_ispb="00000000",
+                pagador_agencia="0001",
+                pagador_conta="1234567",
+                pagador_tipo_conta="CACC",
+                recebedor_nome="Recebedor",
+                recebedor_cpf_cnpj="55566677788",
+                recebedor_ispb=ispb,
+                recebedor_agencia="0002",
+                recebedor_conta="7654321",
+                recebedor_tipo_conta="SVGS",
+                campo_livre="",
+                tx_id=f"TX{i}",
+                data_pagamento=timezone.now(),
+            )
+            for i in range(300)
+        ])
+        sessions = [StreamSession.objects.create(ispb=ispb) for _ in range(6)]
+        delivered = {session.pk: [] for session in sessions}
+        errors = []
+        barrier = threading.Barrier(len(sessions))
+
+        def collector(session):
+            try:
+                barrier.wait()
+                while True:
+                    batch = claim_messages(ispb, session, 7)
+                    if not batch:
+                        break
+                    delivered[session.pk].extend(msg.id for msg in batch)
+            except Exception as exc:  # pragma: no cover - reportado abaixo
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=collector, args=(session,)) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        all_ids = [pk for ids in delivered.values() for pk in ids]
+        self.assertEqual(len(all_ids), len(set(all_ids)))  # Nenhuma sobreposição
+        self.assertEqual(set(all_ids), set(PixMessage.objects.values_list("id", flat=True)))
+        for session in sessions:
+            self.assertEqual(
+                sorted(delivered[session.pk]),
+                sorted(PixMessage.objects.filter(claimed_by_stream=session).values_list("id", flat=True)),
+            )
+
+
+@override_settings(
+    PIX_STREAM_QUEUE="streaming.queues.RedisQueue",
+    PIX_STREAM_QUEUE_REDIS_URL="fakeredis://",
+    PIX_STREAM_QUEUE_REDIS_PREFIX="pix:test:ready:",
+    PIX_STREAM_LONG_POLL_TIMEOUT=0.05,
+)
+class PixRedisQueueTests(TransactionTestCase):
+    """Testes do backend de fila com listas de ids prontos no Redis (fakeredis)"""
+
+    ispb = "12345678"
+
+    def setUp(self):
+        if queues.fakeredis is None:
+            self.skipTest("fakeredis não está instalado")
+        self.queue = queues.get_queue()
+        self.queue.clear(self.ispb)
+
+    def _generate(self, count, seed=1):
+        generate_messages(self.ispb, count, seed=seed)
+        return list(PixMessage.objects.filter(recebedor_ispb=self.ispb).order_by("id").values_list("id", flat=True))
+
+    def _start(self):
+        return f"/api/pix/{self.ispb}/stream/start"
+
+    def _drained(self, path):
+        """A lista não tem mais nada para a sessão: a continuação termina em 204"""
+        response = self.client.get(path, HTTP_ACCEPT="multipart/json")
+        return response.status_code == status.HTTP_204_NO_CONTENT
+
+    def _pull(self, path, batch=4):
+        response = self.client.get(f"{path}?batch={batch}", HTTP_ACCEPT="multipart/json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = list(
+            PixMessage.objects.filter(end_to_end_id__in=[m["endToEndId"] for m in json.loads(response.content)])
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        return ids, response["Pull-Next"]
+
+    def test_stream_delivers_in_order_from_ready_list(self):
+        """Teste: start e continue entregam as mensagens publicadas em ordem de id"""
+        ids = self._generate(10)
+
+        first, pull_next = self._pull(f"/api/pix/{self.ispb}/stream/start")
+        second, pull_next = self._pull(pull_next)
+        third, pull_next = self._pull(pull_next)
+
+        self.assertEqual(first + second + third, ids)
+        self.assertTrue(self._drained(pull_next))
+
+    def test_new_messages_published_after_commit(self):
+        """Teste: mensagens geradas e ingeridas entram no fim da lista já construída"""
+        self.queue.prepare(self.ispb)
+        self._generate(2)
+
+        wire = [message_to_dict(message_from_instance(m)) for m in PixMessageFactory(seed=9).build(self.ispb, 2)]
+        response = self.client.generic("POST", "/api/pix/messages", json.dumps(wire), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        # A lista já estava construída: só o que foi publicado depois do commit é entregue
+        all_ids = list(PixMessage.objects.filter(recebedor_ispb=self.ispb).order_by("id").values_list("id", flat=True))
+        delivered, pull_next = self._pull(self._start(), batch=10)
+        self.assertEqual(delivered, all_ids)
+        self.assertTrue(self._drained(pull_next))
+
+    def test_released_messages_redelivered_first(self):
+        """Teste: mensagens liberadas voltam para a frente da lista"""
+        ids = self._generate(6)
+        delivered, _ = self._pull(self._start(), batch=3)
+        session = StreamSession.objects.get(ispb=self.ispb)
+
+        release_session_messages([session.pk])
+
+        redelivered, _ = self._pull(self._start(), batch=3)
+        self.assertEqual(redelivered, delivered)
+        rest, _ = self._pull(self._start(), batch=6)
+        self.assertEqual(rest, ids[3:])
+
+    def test_stale_and_duplicate_ids_are_skipped(self):
+        """Teste: ids repetidos ou já reivindicados na lista não são entregues de novo"""
+        ids = self._generate(4)
+        self.queue.prepare(self.ispb)
+        session = StreamSession.objects.create(ispb=self.ispb)
+        claim_message_ids(self.ispb, session, ids[:2])
+        self.queue.requeue(self.ispb, [ids[2]])
+
+        delivered, pull_next = self._pull(self._start(), batch=10)
+
+        self.assertEqual(delivered, ids[2:])
+        self.assertTrue(self._drained(pull_next))
+
+    def test_list_rebuilt_after_redis_loses_data(self):
+        """Teste: sem a lista no Redis, o próximo pull a reconstrói pelo banco"""
+        ids = self._generate(5)
+        delivered, _ = self._pull(self._start(), batch=2)
+
+        self.queue.clear(self.ispb)
+        rest, _ = self._pull(self._start(), batch=5)
+
+        self.assertEqual(delivered + rest, ids)
+
+    @override_settings(PIX_STREAM_PRIORITY_MIN_VALOR="1000")
+    def test_priority_messages_published_to_front(self):
+        """Teste: mensagens com prioridade entram na frente da lista"""
+        self.queue.prepare(self.ispb)
+        ids = self._generate(3)
+        high = PixMessageFactory(seed=5).build(self.ispb, 1)[0]
+        high.valor = Decimal("5000.00")
+        high.save()
+
+        self.assertEqual(high.priority, 1)
+        first, pull_next = self._pull(self._start(), batch=1)
+        rest, _ = self._pull(pull_next, batch=5)
+        self.assertEqual(first + rest, [high.pk, *ids])
+
+    @override_settings(PIX_STREAM_PRIORITY_MIN_AGE=3600)
+    def test_aged_payments_claimed_before_ready_list(self):
+        """Teste: com a regra de idade, os pagamentos antigos vêm do banco antes da lista"""
+        self.queue.prepare(self.ispb)
+        ids = self._generate(3)
+        backdated = PixMessageFactory(seed=5).build(self.ispb, 1)[0]
+        backdated.data_pagamento = timezone.now() - timedelta(days=1)
+        backdated.save()  # No fim da lista
+
+        first, pull_next = self._pull(self._start(), batch=2)
+        rest, _ = self._pull(pull_next, batch=5)
+
+        self.assertEqual(first, [ids[0], backdated.pk])
+        self.assertEqual(rest, ids[1:])
+
+    def test_rolled_back_claim_returns_ids(self):
+        """Teste: um claim desfeito por rollback devolve os ids para a lista"""
+        ids = self._generate(3)
+        session = StreamSession.objects.create(ispb=self.ispb)
+        StreamSession.objects.filter(pk=session.pk).update(interaction_id="consumido")
+
+        with self.assertRaises(StaleCursor):
+            pull_batch(self.ispb, session, 3)
+
+        self.assertEqual(PixMessage.objects.filter(claimed_by_stream__isnull=False).count(), 0)
+        delivered, _ = self._pull(self._start(), batch=3)
+        self.assertEqual(delivered, ids)
+
+    def test_concurrent_collectors_never_overlap(self):
+        """Teste: coletores simultâneos pela lista do Redis não recebem mensagens repetidas"""
+        require_concurrent_writes(self)
+
+        ids = self._generate(120)
+        sessions = [StreamSession.objects.create(ispb=self.ispb) for _ in range(4)]
+        delivered = {session.pk: [] for session in sessions}
+        errors = []
+        barrier = threading.Barrier(len(sessions))
+
+        def collector(session):
+            try:
+                barrier.wait()
+                while True:
+                    batch = pull_batch(self.ispb, session, 7)
+                    if not batch:
+                        break
+                    delivered[session.pk].extend(msg.id for msg in batch)
+            except Exception as exc:  # pragma: no cover - reportado abaixo
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=collector, args=(session,)) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        all_ids = [pk for pks in delivered.values() for pk in pks]
+        self.assertEqual(len(all_ids), len(set(all_ids)))
+        self.assertEqual(sorted(all_ids), ids)
+
+
+@override_settings(PIX_STREAM_HOT_CACHE_BYTES=1_000_000, PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixHotCacheTests(PixMessagesMixin, TransactionTestCase):
+    """Testes do cache em memória das mensagens recém-inseridas"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def setUp(self):
+        # Cache novo a cada teste: a mudança da setting descarta o do processo
+        self.enterContext(override_settings(PIX_STREAM_HOT_CACHE_BYTES=1_000_000))
+
+    def _samples(self):
+        samples = {}
+        for line in self.client.get("/metrics").content.decode().splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def _lookups(self):
+        samples = self._samples()
+        return tuple(samples.get(f'pix_hot_cache_lookups_total{{result="{result}"}}', 0) for result in ("hit", "miss"))
+
+    def _entries(self):
+        return self._samples()["pix_hot_cache_entries"]
+
+    def _pull(self, batch=10):
+        response = self.client.get(f"{self.start_url}?batch={batch}", HTTP_ACCEPT="multipart/json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)
+
+    def _expected(self):
+        return [
+            json.loads(bytes(payload))
+            for payload in PixMessage.objects.filter(recebedor_ispb=self.ispb).order_by("id").values_list(
+                "payload", flat=True
+            )
+        ]
+
+    def test_ring_eviction_and_accounting(self):
+        """Teste: limite por ISPB descarta as mais antigas; o total descarta o ISPB usado há mais tempo"""
+        entry = 10 + ENTRY_OVERHEAD
+        cache = HotRowCache(max_bytes=5 * entry, ispb_bytes=3 * entry)
+        cache.put("A", [(pk, b"x" * 10) for pk in range(1, 5)])
+        self.assertEqual(cache.usage(), (3 * entry, 3))
+        self.assertEqual(cache.take("A", [1, 2]), {2: b"x" * 10})
+
+        cache.put("B", [(10, b"y" * 10), (11, b"y" * 10)])
+        cache.put("C", [(20, b"z" * 10), (21, b"z" * 10)])
+        self.assertEqual(cache.usage(), (5 * entry, 5))
+        self.assertEqual(cache.take("A", [3, 4]), {4: b"x" * 10})
+        self.assertEqual(cache.take("B", [10, 11]), {10: b"y" * 10, 11: b"y" * 10})
+
+        cache.put("C", [(22, b"z" * 100 * entry)])
+        cache.discard("C", 20)
+        self.assertEqual(cache.usage(), (entry, 1))
+
+    def test_stream_payloads_from_cache(self):
+        """Teste: mensagens geradas neste processo são entregues do cache, iguais às do banco"""
+        generate_messages(self.ispb, 6, seed=3)
+        hits, misses = self._lookups()
+
+        self.assertEqual(self._pull(), self._expected())
+        self.assertEqual(self._lookups(), (hits + 6, misses))
+
+    def test_misses_and_legacy_rows_read_from_database(self):
+        """Teste: fora do cache o payload vem do banco; linhas sem payload são codificadas"""
+        generate_messages(self.ispb, 4, seed=4)
+        expected = self._expected()
+        ids = list(PixMessage.objects.order_by("id").values_list("id", flat=True))
+        self.assertEqual(len(get_hot_cache().take(self.ispb, ids)), 4)  # Como se viessem de outro processo
+        PixMessage.objects.filter(pk=ids[1]).update(payload=None)
+        hits, misses = self._lookups()
+
+        self.assertEqual(self._pull(), expected)
+        self.assertEqual(self._lookups(), (hits, misses + 4))
+
+    def test_ingested_and_orm_messages(self):
+        """Teste: a ingestão e o ORM alimentam o cache; mensagem alterada sai dele"""
+        wire = [message_to_dict(message_from_instance(m)) for m in PixMessageFactory(seed=5).build(self.ispb, 3)]
+        response = self.client.generic("POST", "/api/pix/messages", json.dumps(wire), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        created = self._create_pix_messages(count=1)[0]
+        self.assertEqual(self._entries(), 4)
+
+        created.campo_livre = "alterado"
+        created.save()
+        self.assertEqual(self._entries(), 3)
+
+        hits, misses = self._lookups()
+        self.assertEqual(self._pull(), self._expected())
+        self.assertEqual(self._lookups(), (hits + 3, misses + 1))
+
+    def test_cache_gauges(self):
+        """Teste: uso de memória e entradas do cache em /metrics"""
+        generate_messages(self.ispb, 2, seed=6)
+        text = self.client.get("/metrics").content.decode()
+
+        self.assertIn("pix_hot_cache_entries 2", text)
+        self.assertIn("pix_hot_cache_bytes ", text)
+        self.assertIn('pix_hot_cache_lookups_total{result="hit"}', text)
+
+
+@override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixSessionAdmissionTests(TransactionTestCase):
+    """Testes da admissão atômica de sessões (limite de 6 por ISPB)"""
+
+    ispb = "12345678"
+
+    def test_concurrent_starts_admit_exactly_six(self):
+        """Teste: 50 starts simultâneos no mesmo ISPB admitem exatamente 6 sessões"""
+        from django.test import Client
+
+        require_concurrent_writes(self)
+
+        statuses = []
+        errors = []
+        barrier = threading.Barrier(50)
+
+        def start():
+            try:
+                client = Client()
+                barrier.wait()
+                response = client.get(f"/api/pix/{self.ispb}/stream/start", HTTP_ACCEPT="application/json")
+                statuses.append(response.status_code)
+            except Exception as exc:  # pragma: no cover - reportado abaixo
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=start) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(statuses.count(status.HTTP_204_NO_CONTENT), 6)
+        self.assertEqual(statuses.count(status.HTTP_429_TOO_MANY_REQUESTS), 44)
+        self.assertEqual(StreamSession.objects.filter(ispb=self.ispb, active=True).count(), 6)
+        self.assertEqual(IspbStreamCounter.objects.get(ispb=self.ispb).active_sessions, 6)
+
+    def test_counter_starts_from_active_sessions_and_is_released(self):
+        """Teste: o contador nasce do total de sessões ativas e devolve a vaga no DELETE"""
+        from .cursors import close_cursor, open_cursor
+
+        for i in range(5):
+            StreamSession.objects.create(ispb=self.ispb, active=True, interaction_id=f"existing{i}")
+
+        session = open_cursor(self.ispb)
+        self.assertIsNotNone(session)
+        self.assertIsNone(open_cursor(self.ispb))
+        self.assertEqual(IspbStreamCounter.objects.get(ispb=self.ispb).active_sessions, 6)
+
+        self.assertTrue(close_cursor(self.ispb, session.interaction_id))
+        self.assertFalse(close_cursor(self.ispb, session.interaction_id))
+        self.assertEqual(IspbStreamCounter.objects.get(ispb=self.ispb).active_sessions, 5)
+        self.assertIsNotNone(open_cursor(self.ispb))
+
+    def test_recount_sessions_fixes_drift(self):
+        """Teste: recount_sessions recalcula o contador a partir das sessões ativas"""
+        from .admission import recount_sessions
+
+        IspbStreamCounter.objects.create(ispb=self.ispb, active_sessions=6)
+        StreamSession.objects.create(ispb=self.ispb, active=True)
+
+        recount_sessions()
+
+        self.assertEqual(IspbStreamCounter.objects.get(ispb=self.ispb).active_sessions, 1)
+
+
+@override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=0.05, PIX_STREAM_SESSION_IDLE_TIMEOUT=60)
+class PixSessionReaperTests(APITestCase):
+    """Testes do heartbeat das sessões e do reaper de sessões ociosas"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def _make_idle(self, session, seconds=120):
+        StreamSession.objects.filter(pk=session.pk).update(last_pull_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_pulls_update_heartbeat(self):
+        """Teste: start e continue gravam last_pull_at"""
+        start = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
+        session = StreamSession.objects.get(ispb=self.ispb)
+        self.assertIsNotNone(session.last_pull_at)
+
+        self._make_idle(session)
+        self.client.get(start["Pull-Next"], HTTP_ACCEPT="application/json")
+
+        session.refresh_from_db()
+        self.assertGreater(session.last_pull_at, timezone.now() - timedelta(seconds=5))
+
+    def test_reaper_expires_idle_sessions_and_frees_slots(self):
+        """Teste: sessões ociosas são encerradas e as vagas voltam para o ISPB"""
+        from .cursors import open_cursor
+        from .reaper import reap_idle_sessions
+
+        sessions = [open_cursor(self.ispb) for _ in range(6)]
+        self.assertIsNone(open_cursor(self.ispb))
+        for session in sessions[:4]:
+            self._make_idle(session)
+        # Sessão antiga sem heartbeat também é considerada ociosa
+        StreamSession.objects.filter(pk=sessions[4].pk).update(
+            last_pull_at=None, created_at=timezone.now() - timedelta(hours=1)
+        )
+
+        self.assertEqual(reap_idle_sessions(), 5)
+
+        self.assertEqual(list(StreamSession.objects.filter(active=True)), [sessions[5]])
+        self.assertEqual(IspbStreamCounter.objects.get(ispb=self.ispb).active_sessions, 1)
+        response = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_reaped_interaction_id_returns_404(self):
+        """Teste: o Pull-Next de uma sessão encerrada pelo reaper não continua"""
+        from .reaper import reap_idle_sessions
+
+        start = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
+        self._make_idle(StreamSession.objects.get(ispb=self.ispb))
+        reap_idle_sessions()
+
+        response = self.client.get(start["Pull-Next"], HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reap_sessions_command(self):
+        """Teste: o comando reap_sessions encerra as sessões ociosas"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .cursors import open_cursor
+
+        self._make_idle(open_cursor(self.ispb))
+        out = StringIO()
+        call_command("reap_sessions", stdout=out)
+
+        self.assertIn("1 sessões encerradas", out.getvalue())
+        self.assertFalse(StreamSession.objects.filter(active=True).exists())
+
+
+@override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixAcknowledgementTests(PixMessagesMixin, APITestCase):
+    """Testes da entrega pelo menos uma vez (confirmação e reentrega)"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def _in_flight(self):
+        return PixMessage.objects.filter(visible_at__isnull=False)
+
+    def _expire_in_flight(self):
+        self._in_flight().update(visible_at=timezone.now() - timedelta(seconds=1))
+
+    def test_pull_next_acknowledges_previous_batch(self):
+        """Teste: o lote fica em voo até o coletor seguir o Pull-Next"""
+        self._create_pix_messages(count=5)
+
+        start = self.client.get(f"{self.start_url}?batch=3", HTTP_ACCEPT="multipart/json")
+        self.assertEqual(self._in_flight().count(), 3)
+
+        follow = self.client.get(start["Pull-Next"], HTTP_ACCEPT="multipart/json")
+        self.assertEqual(len(json.loads(follow.content)), 2)
+        # O primeiro lote foi confirmado; o segundo está em voo
+        self.assertEqual(self._in_flight().count(), 2)
+
+    def test_racing_continues_do_not_acknowledge_the_next_batch(self):
+        """Teste: duas continuações com o mesmo token; a perdedora não confirma o lote da vencedora"""
+        from . import views
+
+        created = self._create_pix_messages(count=4)
+        start = self.client.get(f"{self.start_url}?batch=2", HTTP_ACCEPT="multipart/json")
+        resolve_cursor = views.resolve_cursor
+        winner = []
+        raced = []
+
+        def resolve_then_race(ispb, interaction_id):
+            # A requisição B achou a sessão pelo token; antes do seu pull, A
+            # (mesmo token) entrega o lote seguinte e rotaciona o cursor
+            session = resolve_cursor(ispb, interaction_id)
+            if not raced:
+                raced.append(True)
+                winner.append(self.client.get(f"{start['Pull-Next']}?batch=2", HTTP_ACCEPT="multipart/json"))
+            return session
+
+        with patch("streaming.views.resolve_cursor", side_effect=resolve_then_race):
+            loser = self.client.get(f"{start['Pull-Next']}?batch=2", HTTP_ACCEPT="multipart/json")
+
+        self.assertEqual(loser.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(winner[0].status_code, status.HTTP_200_OK)
+        delivered = [msg["endToEndId"] for msg in json.loads(winner[0].content)]
+        self.assertEqual(delivered, [msg.end_to_end_id for msg in created[2:]])
+        # O lote entregue a A continua em voo até A seguir o seu Pull-Next
+        self.assertEqual(
+            sorted(self._in_flight().values_list("end_to_end_id", flat=True)), sorted(delivered)
+        )
+        self.client.get(winner[0]["Pull-Next"], HTTP_ACCEPT="multipart/json")
+        self.assertFalse(self._in_flight().exists())
+
+    def test_delete_acknowledges_last_batch(self):
+        """Teste: DELETE com o interactionId confirma o último lote"""
+        self._create_pix_messages(count=2)
+
+        start = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        self.client.delete(start["Pull-Next"])
+
+        self.assertFalse(self._in_flight().exists())
+
+    def test_unacknowledged_batch_is_redelivered_after_timeout(self):
+        """Teste: um lote sem confirmação volta para a fila e é entregue de novo"""
+        from .claims import release_expired_messages
+
+        created = self._create_pix_messages(count=3)
+        lost = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        self.assertEqual(lost.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(release_expired_messages(), 0)  # Ainda dentro do prazo
+        self._expire_in_flight()
+        self.assertEqual(release_expired_messages(), 3)
+
+        retry = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        self.assertEqual(
+            [msg["endToEndId"] for msg in json.loads(retry.content)],
+            [msg.end_to_end_id for msg in created],
+        )
+
+    def test_late_pull_next_does_not_acknowledge_redelivered_messages(self):
+        """Teste: seguir o Pull-Next depois da reentrega não confirma o lote de outra sessão"""
+        from .claims import release_expired_messages
+
+        self._create_pix_messages(count=2)
+        first = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        self._expire_in_flight()
+        release_expired_messages()
+        self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+
+        self.client.get(first["Pull-Next"], HTTP_ACCEPT="multipart/json")
+
+        self.assertEqual(self._in_flight().count(), 2)
+
+    def test_released_messages_reach_sessions_past_them(self):
+        """Teste: mensagens devolvidas voltam antes das mais novas, mesmo para cursores já depois delas"""
+        from .claims import release_expired_messages
+
+        created = self._create_pix_messages(count=3)
+        lost = self.client.get(f"{self.start_url}?batch=1", HTTP_ACCEPT="multipart/json")
+        collector = self.client.get(f"{self.start_url}?batch=1", HTTP_ACCEPT="multipart/json")
+        self.assertEqual(json.loads(lost.content)[0]["endToEndId"], created[0].end_to_end_id)
+        self.assertEqual(json.loads(collector.content)[0]["endToEndId"], created[1].end_to_end_id)
+
+        self._expire_in_flight()
+        release_expired_messages()
+
+        # O cursor do coletor está depois da mensagem devolvida, e ainda há uma mais nova
+        follow = self.client.get(f"{collector['Pull-Next']}?batch=1", HTTP_ACCEPT="multipart/json")
+        self.assertEqual(json.loads(follow.content)[0]["endToEndId"], created[0].end_to_end_id)
+
+    @override_settings(PIX_STREAM_SESSION_IDLE_TIMEOUT=60)
+    def test_reaper_releases_in_flight_messages_of_idle_sessions(self):
+        """Teste: o reaper devolve na hora as mensagens em voo das sessões encerradas"""
+        from .reaper import run_reaper
+
+        self._create_pix_messages(count=3)
+        self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        StreamSession.objects.update(last_pull_at=timezone.now() - timedelta(seconds=120))
+
+        self.assertEqual(run_reaper(), (1, 0))
+        self.assertFalse(self._in_flight().exists())
+        self.assertEqual(PixMessage.objects.filter(claimed_by_stream__isnull=True).count(), 3)
+
+
+@override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixArchiveTests(PixMessagesMixin, APITestCase):
+    """Testes do arquivamento de mensagens confirmadas"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def _age(self, hours):
+        PixMessage.objects.filter(acked_at__isnull=False).update(acked_at=timezone.now() - timedelta(hours=hours))
+
+    def test_archive_moves_only_old_acknowledged_messages(self):
+        """Teste: só mensagens confirmadas e antigas saem da tabela quente"""
+        from .archive import archive_messages
+
+        created = self._create_pix_messages(count=6)
+        start = self.client.get(f"{self.start_url}?batch=3", HTTP_ACCEPT="multipart/json")
+        self.client.get(f"{start['Pull-Next']}?batch=2", HTTP_ACCEPT="multipart/json")  # Confirma 3, 2 em voo
+        self._age(hours=48)
+
+        self.assertEqual(archive_messages(older_than_hours=24, batch_size=2), 3)
+
+        archived = {msg.end_to_end_id for msg in created[:3]}
+        self.assertEqual(set(PixMessageArchive.objects.values_list("end_to_end_id", flat=True)), archived)
+        self.assertFalse(PixMessage.objects.filter(end_to_end_id__in=archived).exists())
+        self.assertEqual(PixMessage.objects.count(), 3)  # 2 em voo + 1 na fila
+
+        original = created[0]
+        copy = PixMessageArchive.objects.get(end_to_end_id=original.end_to_end_id)
+        self.assertEqual(copy.id, original.id)
+        self.assertEqual(copy.valor, original.valor)
+        self.assertEqual(copy.tx_id, original.tx_id)
+        self.assertEqual(copy.stream_session_id, StreamSession.objects.get().pk)
+        self.assertIsNotNone(copy.archived_at)
+
+    def test_archive_keeps_recent_messages(self):
+        """Teste: mensagens confirmadas mais novas que o limite ficam na tabela quente"""
+        from .archive import archive_messages
+
+        self._create_pix_messages(count=2)
+        start = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        self.client.delete(start["Pull-Next"])
+
+        self.assertEqual(archive_messages(older_than_hours=24), 0)
+        self.assertEqual(PixMessage.objects.count(), 2)
+
+    def test_archive_counts_from_acknowledgement(self):
+        """Teste: o prazo conta da confirmação, não da criação da mensagem"""
+        from .archive import archive_messages
+
+        self._create_pix_messages(count=2)
+        PixMessage.objects.update(created_at=timezone.now() - timedelta(hours=48))
+        start = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        self.client.delete(start["Pull-Next"])
+
+        self.assertEqual(PixMessage.objects.filter(acked_at__isnull=False).count(), 2)
+        self.assertEqual(archive_messages(older_than_hours=24), 0)
+        self._age(hours=25)
+        self.assertEqual(archive_messages(older_than_hours=24), 2)
+
+    def test_archive_batch_walks_acknowledged_index(self):
+        """Teste: o lote do arquivamento usa o índice parcial de acked_at, sem varrer a tabela"""
+        from .archive import _eligible_sql
+
+        hot = connection.ops.quote_name(PixMessage._meta.db_table)
+        cutoff = connection.ops.adapt_datetimefield_value(timezone.now())
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                # Tabela de teste pequena: sem isso o planner prefere o seq scan
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {_eligible_sql(hot)}", [cutoff, 10])
+            else:
+                cursor.execute(f"EXPLAIN QUERY PLAN {_eligible_sql(hot)}", [cutoff, 10])
+            plan = " ".join(str(column) for row in cursor.fetchall() for column in row)
+
+        self.assertIn("pixmsg_acked_archive_idx", plan)
+        self.assertNotIn("Sort", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_archive_command_prunes_closed_sessions(self):
+        """Teste: o comando arquiva e remove sessões encerradas sem mensagens quentes"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        self._create_pix_messages(count=2)
+        start = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        self.client.delete(start["Pull-Next"])
+        open_session = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        self._age(hours=48)
+        StreamSession.objects.update(
+            created_at=timezone.now() - timedelta(hours=48), last_pull_at=timezone.now() - timedelta(hours=48)
+        )
+
+        out = StringIO()
+        call_command("archive_messages", "--older-than-hours", "24", "--prune-sessions", stdout=out)
+
+        result = json.loads(out.getvalue())
+        self.assertEqual(result["archived"], 2)
+        self.assertEqual(result["pruned_sessions"], 1)
+        self.assertEqual(StreamSession.objects.get().interaction_id, open_session["Pull-Next"].split("/")[-1])
+
+
+@override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixIngestionTests(APITestCase):
+    """Testes da ingestão em massa de mensagens"""
+
+    ispb = "12345678"
+    url = "/api/pix/messages"
+
+    def _wire_messages(self, count, seed=1):
+
+        return [
+            message_to_dict(message_from_instance(instance))
+            for instance in PixMessageFactory(seed=seed).build(self.ispb, count)
+        ]
+
+    def _post(self, body, content_type="application/json"):
+        response = self.client.generic("POST", self.url, body, content_type=content_type)
+        return response, json.loads(response.content) if response.content else None
+
+    def test_json_array_round_trips_through_stream(self):
+        """Teste: mensagens ingeridas saem no stream com os mesmos dados"""
+        messages = self._wire_messages(3)
+
+        response, summary = self._post(json.dumps(messages))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((summary["received"], summary["created"], summary["duplicates"], summary["invalid"]), (3, 3, 0, 0))
+        self.assertEqual([result["endToEndId"] for result in summary["results"]], [m["endToEndId"] for m in messages])
+
+        pulled = self.client.get(f"/api/pix/{self.ispb}/stream/start?batch=10", HTTP_ACCEPT="multipart/json")
+        self.assertEqual(json.loads(pulled.content), messages)
+
+    def test_duplicates_hot_archived_and_repeated(self):
+        """Teste: duplicatas na tabela quente, no arquivo e no próprio lote"""
+        messages = self._wire_messages(4)
+        self._post(json.dumps(messages[:1]))
+        PixMessageArchive.objects.create(
+            id=10_000, end_to_end_id=messages[1]["endToEndId"], valor="1.00",
+            pagador_nome="", pagador_cpf_cnpj="", pagador_ispb="", pagador_agencia="", pagador_conta="",
+            pagador_tipo_conta="", recebedor_nome="", recebedor_cpf_cnpj="", recebedor_ispb=self.ispb,
+            recebedor_agencia="", recebedor_conta="", recebedor_tipo_conta="", tx_id="",
+            data_pagamento=timezone.now(), created_at=timezone.now(), archived_at=timezone.now(),
+        )
+
+        _, summary = self._post(json.dumps(messages + [messages[2]]))
+
+        self.assertEqual(
+            [result["status"] for result in summary["results"]],
+            ["duplicate", "duplicate", "created", "created", "duplicate"],
+        )
+        self.assertEqual(PixMessage.objects.count(), 3)
+
+    def test_invalid_items_are_reported_per_field(self):
+        """Teste: itens inválidos não impedem os válidos e trazem os erros por campo"""
+        valid, invalid = self._wire_messages(2)
+        invalid["valor"] = "12.345"
+        invalid["dataHoraPagamento"] = "ontem"
+        del invalid["recebedor"]["ispb"]
+
+        _, summary = self._post(json.dumps([valid, invalid, "texto"]))
+
+        self.assertEqual([result["status"] for result in summary["results"]], ["created", "invalid", "invalid"])
+        self.assertEqual(
+            set(summary["results"][1]["errors"]),
+            {"valor", "dataHoraPagamento", "recebedor.ispb"},
+        )
+        self.assertEqual(summary["results"][1]["endToEndId"], invalid["endToEndId"])
+        self.assertEqual(PixMessage.objects.get().end_to_end_id, valid["endToEndId"])
+
+    def test_ndjson_with_malformed_line(self):
+        """Teste: NDJSON é processado linha a linha; linha malformada vira item inválido"""
+        messages = self._wire_messages(2)
+        body = "\n".join([json.dumps(messages[0]), "{nao e json", "", json.dumps(messages[1])]) + "\n"
+
+        response, summary = self._post(body, content_type="application/x-ndjson")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in summary["results"]], ["created", "invalid", "created"])
+        self.assertEqual(summary["results"][1]["errors"], {"non_field_errors": "JSON inválido."})
+
+    def test_ingestion_wakes_long_polling_collector(self):
+        """Teste: a ingestão avisa os coletores do ISPB recebedor"""
+        with patch("streaming.notify.LocalNotifier.notify") as notify:
+            with self.settings(PIX_STREAM_NOTIFIER="streaming.notify.LocalNotifier"):
+                self._post(json.dumps(self._wire_messages(2)))
+        notify.assert_called_once_with(self.ispb)
+
+    def test_rejected_bodies(self):
+        """Teste: tipo de conteúdo, corpo que não é array e corpo grande demais"""
+        self.assertEqual(self._post("[]", content_type="text/plain")[0].status_code, 415)
+        self.assertEqual(self._post(json.dumps({"endToEndId": "E1"}))[0].status_code, 400)
+        self.assertEqual(self._post("[")[0].status_code, 400)
+        with self.settings(PIX_INGEST_MAX_BYTES=10):
+            self.assertEqual(self._post(json.dumps(self._wire_messages(1)))[0].status_code, 413)
+
+    def _post_without_content_length(self, body, content_type):
+        """POST com o corpo em partes e sem Content-Length, como um upload chunked sob ASGI"""
+        from io import BytesIO
+        from django.core.handlers.asgi import ASGIRequest
+        from .views import PixMessageIngestView
+
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": self.url,
+            "query_string": b"",
+            "headers": [(b"content-type", content_type.encode())],
+        }
+        request = ASGIRequest(scope, BytesIO(body))
+        self.assertNotIn("CONTENT_LENGTH", request.META)
+        return PixMessageIngestView.as_view()(request)
+
+    def test_body_limit_without_content_length(self):
+        """Teste: sem Content-Length os bytes são contados na leitura, com 413 e nada inserido"""
+        messages = self._wire_messages(20)
+        ndjson = b"".join(json.dumps(message).encode() + b"\n" for message in messages)
+
+        response = self._post_without_content_length(ndjson, "application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["created"], 20)
+
+        PixMessage.objects.all().delete()
+        with self.settings(PIX_INGEST_MAX_BYTES=len(ndjson) // 2):
+            response = self._post_without_content_length(ndjson, "application/x-ndjson")
+            self.assertEqual(response.status_code, 413)
+            self.assertEqual(PixMessage.objects.count(), 0)
+
+            response = self._post_without_content_length(json.dumps(messages).encode(), "application/json")
+            self.assertEqual(response.status_code, 413)
+
+    @override_settings(PIX_INGEST_CHUNK_SIZE=7)
+    def test_many_chunks(self):
+        """Teste: lotes maiores que um comando INSERT"""
+        messages = self._wire_messages(30)
+
+        _, summary = self._post(json.dumps(messages + messages[:5]))
+
+        self.assertEqual((summary["created"], summary["duplicates"]), (30, 5))
+        self.assertEqual(PixMessage.objects.count(), 30)
+
+
+@override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixMetricsTests(PixMessagesMixin, APITestCase):
+    """Testes das métricas do Prometheus"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def _samples(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return samples
+
+    def _delta(self, before, after, name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    def test_pull_and_admission_metrics(self):
+        """Teste: pulls, long polling, claims e admissões são contados"""
+        self._create_pix_messages(count=3)
+        before = self._samples()
+
+        start = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
+        self.client.get(start["Pull-Next"], HTTP_ACCEPT="multipart/json")
+        self.client.get(start["Pull-Next"].rsplit("/", 1)[0] + "/x", HTTP_ACCEPT="application/json")  # 404
+        with self.settings(PIX_STREAM_MAX_SESSIONS=1):
+            self.assertEqual(self.client.get(self.start_url).status_code, 429)
+        empty = self.client.get(self.start_url.replace(self.ispb, "87654321"), HTTP_ACCEPT="multipart/json")
+        self.assertEqual(empty.status_code, 204)
+
+        after = self._samples()
+        self.assertEqual(self._delta(before, after, 'pix_stream_admissions_total{result="admitted"}'), 2)
+        self.assertEqual(self._delta(before, after, 'pix_stream_admissions_total{result="rejected"}'), 1)
+        self.assertEqual(self._delta(before, after, 'pix_stream_long_polls_total{result="immediate"}'), 2)
+        self.assertEqual(self._delta(before, after, 'pix_stream_long_polls_total{result="timeout"}'), 1)
+        self.assertEqual(self._delta(before, after, "pix_stream_claimed_messages_total"), 3)
+        self.assertEqual(self._delta(before, after, 'pix_stream_pull_seconds_count{format="json"}'), 1)
+        self.assertEqual(self._delta(before, after, 'pix_stream_pull_seconds_count{format="multipart"}'), 2)
+        self.assertEqual(self._delta(before, after, 'pix_stream_encode_seconds_count{format="multipart"}'), 1)
+        self.assertEqual(
+            after['pix_stream_pull_seconds_bucket{format="json",le="+Inf"}'],
+            after['pix_stream_pull_seconds_count{format="json"}'],
+        )
+
+    def test_database_gauges(self):
+        """Teste: profundidade da fila, mensagens em voo e sessões ativas por ISPB"""
+        self._create_pix_messages(count=4)
+        self._create_pix_messages(count=2, ispb="87654321")
+        self.client.get(f"{self.start_url}?batch=3", HTTP_ACCEPT="multipart/json")
+
+        samples = self._samples()
+
+        self.assertEqual(samples['pix_queue_depth{ispb="12345678"}'], 1)
+        self.assertEqual(samples['pix_queue_depth{ispb="87654321"}'], 2)
+        self.assertEqual(samples["pix_messages_in_flight"], 3)
+        self.assertEqual(samples['pix_stream_active_sessions{ispb="12345678"}'], 1)
+
+    def test_generation_and_ingestion_metrics(self):
+        """Teste: mensagens geradas e ingeridas são contadas"""
+        before = self._samples()
+        self.client.post(f"/api/util/msgs/{self.ispb}/5")
+        self.client.generic("POST", "/api/pix/messages", "[1]", content_type="application/json")
+
+        after = self._samples()
+        self.assertEqual(self._delta(before, after, "pix_generate_messages_total"), 5)
+        self.assertEqual(self._delta(before, after, "pix_generate_seconds_count"), 1)
+        self.assertEqual(self._delta(before, after, 'pix_ingest_messages_total{status="invalid"}'), 1)
+
+    def test_thread_cells_survive_finished_threads(self):
+        """Teste: contagens de threads encerradas são preservadas na compactação"""
+        histogram = metrics.Histogram("pix_test_seconds", "teste", buckets=(0.1, 1))
+        metrics.REGISTRY.remove(histogram)
+        series = histogram.labels()
+
+        def observe():
+            for value in (0.05, 0.5, 5):
+                series.observe(value)
+
+        threads = [threading.Thread(target=observe) for _ in range(74)]  # Mais threads que o limite da compactação
+        for thread in threads:
+            thread.start()
+            thread.join()
+        observe()
+
+        lines = histogram.expose()
+        self.assertIn('pix_test_seconds_bucket{le="0.1"} 75', lines)
+        self.assertIn('pix_test_seconds_bucket{le="1.0"} 150', lines)
+        self.assertIn('pix_test_seconds_bucket{le="+Inf"} 225', lines)
+        self.assertIn("pix_test_seconds_count 225", lines)
+
+
+@override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixSchedulerTests(PixMessagesMixin, APITestCase):
+    """Testes do escalonador: prioridade, divisão justa e limite por ISPB"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def setUp(self):
+        # Escalonador novo a cada teste: a mudança da setting descarta o do processo
+        self.enterContext(override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=0.05))
+
+    def _delivered(self, response):
+        return [message["endToEndId"] for message in json.loads(response.content)]
+
+    def test_message_priority_rules(self):
+        """Teste: o valor define a prioridade gravada; a idade, o corte do claim"""
+        reference = timezone.now()
+        with override_settings(PIX_STREAM_PRIORITY_MIN_VALOR="1000", PIX_STREAM_PRIORITY_MIN_AGE=3600):
+            self.assertEqual(message_priority(Decimal("999.99")), 0)
+            self.assertEqual(message_priority(Decimal("1000.00")), 1)
+            self.assertEqual(aged_before(reference), reference - timedelta(hours=1))
+        self.assertEqual(message_priority(Decimal("5000.00")), 0)  # Desligado por padrão
+        self.assertIsNone(aged_before(reference))
+
+    @override_settings(PIX_STREAM_PRIORITY_MIN_VALOR="1000")
+    def test_high_value_messages_delivered_first(self):
+        """Teste: mensagens de valor alto saem antes das mais antigas, as demais em FIFO"""
+        regular = self._create_pix_messages(count=3)
+        high = self._create_pix_messages(count=1)[0]
+        PixMessage.objects.filter(pk=high.pk).update(valor=5000, priority=1)
+
+        first = self.client.get(f"{self.start_url}?batch=2", HTTP_ACCEPT="multipart/json")
+        second = self.client.get(f"{first['Pull-Next']}?batch=2", HTTP_ACCEPT="multipart/json")
+
+        self.assertEqual(set(self._delivered(first)), {regular[0].end_to_end_id, high.end_to_end_id})
+        self.assertEqual(self._delivered(second), [m.end_to_end_id for m in regular[1:]])
+
+    @override_settings(PIX_STREAM_PRIORITY_MIN_AGE=3600)
+    def test_ingested_old_payments_are_prioritized(self):
+        """Teste: o claim tira primeiro os pagamentos antigos, sem gravar prioridade na ingestão"""
+        instances = PixMessageFactory(seed=3).build(self.ispb, 3)
+        instances[2].data_pagamento = timezone.now() - timedelta(days=1)
+        wire = [message_to_dict(message_from_instance(instance)) for instance in instances]
+        response = self.client.generic("POST", "/api/pix/messages", json.dumps(wire), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(
+            list(PixMessage.objects.order_by("id").values_list("priority", flat=True)), [0, 0, 0]
+        )
+        pulled = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
+        self.assertEqual(json.loads(pulled.content)["endToEndId"], instances[2].end_to_end_id)
+
+    @override_settings(PIX_STREAM_PRIORITY_MIN_VALOR="1000", PIX_STREAM_PRIORITY_MIN_AGE=3600)
+    def test_waiting_messages_become_prioritized(self):
+        """Teste: uma mensagem recente passa à frente quando envelhece na fila"""
+        messages = self._create_pix_messages(count=3)
+        high = self._create_pix_messages(count=1)[0]
+        PixMessage.objects.filter(pk=high.pk).update(valor=5000, priority=1)
+        waited = timezone.now() - timedelta(minutes=30)
+        PixMessage.objects.filter(pk=messages[2].pk).update(data_pagamento=waited)
+        PixMessage.objects.filter(pk=high.pk).update(data_pagamento=waited - timedelta(minutes=1))
+
+        # Meia hora de pagamento: ainda não é antiga, só a de valor alto passa à frente
+        first = self.client.get(f"{self.start_url}?batch=2", HTTP_ACCEPT="multipart/json")
+        self.assertEqual(set(self._delivered(first)), {high.end_to_end_id, messages[0].end_to_end_id})
+
+        # Uma hora depois o pagamento que esperou passa à frente da fila comum
+        later = timezone.now() + timedelta(hours=1)
+        with patch("streaming.scheduler.timezone.now", return_value=later):
+            second = self.client.get(f"{first['Pull-Next']}?batch=1", HTTP_ACCEPT="multipart/json")
+        self.assertEqual(self._delivered(second), [messages[2].end_to_end_id])
+
+    @override_settings(PIX_STREAM_PRIORITY_MIN_VALOR="1000", PIX_STREAM_PRIORITY_MIN_AGE=3600)
+    def test_aged_high_value_messages_first(self):
+        """Teste: valor alto e pagamento antigo saem antes de só valor alto, que sai antes de só antigo"""
+        old, high, both = self._create_pix_messages(count=3)
+        day_ago = timezone.now() - timedelta(days=1)
+        PixMessage.objects.filter(pk=old.pk).update(data_pagamento=day_ago)
+        PixMessage.objects.filter(pk=high.pk).update(valor=5000, priority=1)
+        PixMessage.objects.filter(pk=both.pk).update(valor=5000, priority=1, data_pagamento=day_ago)
+
+        delivered = []
+        response = self.client.get(f"{self.start_url}?batch=1", HTTP_ACCEPT="multipart/json")
+        for _ in range(3):
+            delivered += self._delivered(response)
+            response = self.client.get(f"{response['Pull-Next']}?batch=1", HTTP_ACCEPT="multipart/json")
+
+        self.assertEqual(delivered, [both.end_to_end_id, high.end_to_end_id, old.end_to_end_id])
+
+    @override_settings(PIX_STREAM_FAIR_SHARE=True)
+    def test_fair_share_splits_batch_by_weight(self):
+        """Teste: sem limite por ISPB, a fatia de cada coletor vale sobre a soma dos lotes pedidos"""
+        scheduler = get_scheduler()
+        light = StreamSession.objects.create(ispb=self.ispb, weight=1)
+        heavy = StreamSession.objects.create(ispb=self.ispb, weight=3)
+
+        self.assertEqual(scheduler.grant(self.ispb, light, 10), 10)  # Único coletor recente
+        self.assertEqual(scheduler.grant(self.ispb, heavy, 10), 10)  # 3/4 de 20, até o pedido
+        self.assertEqual(scheduler.grant(self.ispb, light, 10), 5)  # 1/4 de 20
+        self.assertEqual(scheduler.grant(self.ispb, light, 2), 2)
+        self.assertEqual(scheduler.grant("87654321", light, 10), 10)  # Outro ISPB, outra divisão
+
+    @override_settings(PIX_STREAM_FAIR_SHARE=True)
+    def test_fair_share_without_rate_limit_in_pulls(self):
+        """Teste: com o lote padrão e sem limite, o coletor de peso menor recebe a sua fatia"""
+        self._create_pix_messages(count=40)
+
+        light = self.client.get(self.start_url, HTTP_ACCEPT="multipart/json")
+        heavy = self.client.get(f"{self.start_url}?weight=3", HTTP_ACCEPT="multipart/json")
+        light = self.client.get(light["Pull-Next"], HTTP_ACCEPT="multipart/json")
+        heavy = self.client.get(heavy["Pull-Next"], HTTP_ACCEPT="multipart/json")
+
+        self.assertEqual(len(self._delivered(light)), 5)
+        self.assertEqual(len(self._delivered(heavy)), 10)
+
+    @override_settings(PIX_STREAM_FAIR_SHARE=True, PIX_STREAM_ISPB_RATE=1000, PIX_STREAM_ISPB_BURST=12)
+    def test_fair_share_with_rate_limit_uses_burst(self):
+        """Teste: com limite por ISPB, a fatia de cada coletor vale sobre a rajada"""
+        scheduler = get_scheduler()
+        light = StreamSession.objects.create(ispb=self.ispb, weight=1)
+        heavy = StreamSession.objects.create(ispb=self.ispb, weight=2)
+
+        self.assertEqual(scheduler.grant(self.ispb, light, 12), 12)
+        scheduler.settle(self.ispb, 12, 0)
+        self.assertEqual(scheduler.grant(self.ispb, heavy, 12), 8)
+        scheduler.settle(self.ispb, 8, 0)
+        self.assertEqual(scheduler.grant(self.ispb, light, 12), 4)
+
+    @override_settings(PIX_STREAM_FAIR_SHARE=True, PIX_STREAM_MAX_BATCH_SIZE=12)
+    def test_start_weight_parameter(self):
+        """Teste: ?weight= define o peso da sessão; valores fora da faixa são recusados"""
+        self._create_pix_messages(count=1)
+
+        response = self.client.get(f"{self.start_url}?weight=3", HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(StreamSession.objects.get().weight, 3)
+
+        for weight in ("0", "11", "x"):
+            response = self.client.get(f"{self.start_url}?weight={weight}", HTTP_ACCEPT="application/json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PIX_STREAM_ISPB_RATE=5, PIX_STREAM_ISPB_BURST=5)
+    def test_rate_limit_token_bucket(self):
+        """Teste: sem fichas o pull é adiado; fichas não usadas voltam para o balde"""
+        scheduler = get_scheduler()
+        session = StreamSession.objects.create(ispb=self.ispb)
+
+        self.assertEqual(scheduler.grant(self.ispb, session, 10), 5)
+        with self.assertRaises(Throttled) as throttled:
+            scheduler.grant(self.ispb, session, 1)
+        self.assertGreater(throttled.exception.retry_after, 0)
+        self.assertLessEqual(throttled.exception.retry_after, 0.2)
+
+        scheduler.settle(self.ispb, 5, 2)
+        self.assertEqual(scheduler.grant(self.ispb, session, 10), 3)
+
+    @override_settings(PIX_STREAM_ISPB_RATE=0.01, PIX_STREAM_ISPB_BURST=1)
+    def test_throttled_pull_waits_without_claiming(self):
+        """Teste: com o limite esgotado o long polling termina em 204 e a mensagem fica na fila"""
+        self._create_pix_messages(count=2)
+
+        first = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(first["Pull-Next"], HTTP_ACCEPT="application/json")
+        self.assertEqual(second.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(any("SET claimed_by_stream_id" in query["sql"] for query in queries.captured_queries))
+        self.assertEqual(PixMessage.objects.filter(claimed_by_stream__isnull=True).count(), 1)
+
+
+@override_settings(PIX_DB_DEBUG_HEADERS=True, PIX_DB_QUERY_BUDGET_ENFORCE=True, PIX_STREAM_LONG_POLL_TIMEOUT=0.05)
+class PixQueryBudgetTests(PixMessagesMixin, APITestCase):
+    """Testes da contagem de comandos SQL por requisição e do orçamento por endpoint"""
+
+    ispb = "12345678"
+    start_url = f"/api/pix/{ispb}/stream/start"
+
+    def setUp(self):
+        # O contador de admissão é criado uma vez, na primeira sessão do ISPB, fora do orçamento
+        IspbStreamCounter.objects.create(ispb=self.ispb)
+
+    def _cycle(self, accept, batch=5):
+        start = self.client.get(f"{self.start_url}?batch={batch}", HTTP_ACCEPT=accept)
+        pull = self.client.get(f"{start['Pull-Next']}?batch={batch}", HTTP_ACCEPT=accept)
+        delete = self.client.delete(pull["Pull-Next"])
+        return start, pull, delete
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        """Teste: lotes maiores não executam mais comandos SQL (guarda contra N+1)"""
+        self._create_pix_messages(count=2)
+        small = self._cycle("multipart/json", batch=1)
+        self._create_pix_messages(count=20)
+        large = self._cycle("multipart/json", batch=10)
+
+        self.assertEqual([len(json.loads(large[0].content)), len(json.loads(large[1].content))], [10, 10])
+        for before, after in zip(small, large):
+            self.assertEqual(after["X-DB-Queries"], before["X-DB-Queries"])
+            self.assertGreaterEqual(float(after["X-DB-Time-Ms"]), 0)
+
+    def test_flows_within_budget(self):
+        """Teste: pulls com e sem mensagens (long polling) ficam dentro do orçamento"""
+        self._create_pix_messages(count=3)
+        for accept in ("application/json", "multipart/json"):
+            self._cycle(accept)
+
+        empty = self.client.get(self.start_url, HTTP_ACCEPT="application/json")
+        self.assertEqual(empty.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(empty["Pull-Next"]).status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_budget_exceeded_raises(self):
+        """Teste: acima do orçamento a requisição falha (aviso no log sem ENFORCE)"""
+        from .middleware import QueryBudgetExceeded
+
+        self._create_pix_messages(count=1)
+        with override_settings(PIX_DB_QUERY_BUDGETS={"pix_stream_start:GET": 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(self.start_url)
+            with override_settings(PIX_DB_QUERY_BUDGET_ENFORCE=False), self.assertLogs("streaming.middleware", "WARNING"):
+                response = self.client.get(self.start_url)
+        self.assertIn(response.status_code, (status.HTTP_200_OK, status.HTTP_204_NO_CONTENT))
+
+    def test_queries_exported_per_endpoint(self):
+        """Teste: os comandos por endpoint aparecem nas métricas"""
+        self.client.get(self.start_url)
+
+        metrics = self.client.get("/metrics").content.decode()
+        self.assertIn('pix_db_queries_count{endpoint="pix_stream_start"}', metrics)
+        self.assertIn('pix_db_seconds_count{endpoint="pix_stream_start"}', metrics)
+
+    @override_settings(PIX_DB_DEBUG_HEADERS=False)
+    def test_headers_disabled(self):
+        """Teste: sem PIX_DB_DEBUG_HEADERS a resposta não expõe a contagem"""
+        response = self.client.get(self.start_url)
+        self.assertNotIn("X-DB-Queries", response)
+
+
+class PixLeanProfileTests(PixMessagesMixin, TransactionTestCase):
+    """Testes do perfil enxuto das rotas /api/pix/ e da negociação memorizada"""
+
+    def _wsgi(self, method, path, accept="application/json"):
+        from django.core.handlers.wsgi import WSGIHandler
+        from .handlers import wsgi_application
+        from .management.commands._bench import wsgi_environ
+
+        started = []
+        result = wsgi_application(WSGIHandler())(
+            wsgi_environ(method, path, accept), lambda status, headers, exc_info=None: started.append((status, headers))
+        )
+        body = b"".join(result)
+        result.close()
+        status_line, headers = started[0]
+        return int(status_line.split()[0]), dict(headers), body
+
+    @override_settings(ALLOWED_HOSTS=["localhost"], PIX_DB_DEBUG_HEADERS=True)
+    def test_api_routes_skip_full_middleware_stack(self):
+        """Teste: /api/pix/ passa só por PIX_API_MIDDLEWARE; as demais rotas pela pilha completa"""
+        self._create_pix_messages(count=2, ispb="12345678")
+
+        code, headers, body = self._wsgi("GET", "/api/pix/12345678/stream/start", "multipart/json")
+        self.assertEqual(code, 200)
+        self.assertEqual(len(json.loads(body)), 2)
+        self.assertIn("X-DB-Queries", headers)
+        self.assertNotIn("X-Frame-Options", headers)
+
+        code, _, _ = self._wsgi("DELETE", headers["Pull-Next"])
+        self.assertEqual(code, 200)
+        self.assertFalse(StreamSession.objects.filter(active=True).exists())
+
+        code, headers, _ = self._wsgi("GET", "/health/live")
+        self.assertEqual(code, 200)
+        self.assertEqual(headers["X-Frame-Options"], "DENY")
+
+    @override_settings(
+        ALLOWED_HOSTS=["localhost"], PIX_API_MIDDLEWARE=["django.middleware.clickjacking.XFrameOptionsMiddleware"]
+    )
+    def test_lean_chain_built_from_api_middleware(self):
+        """Teste: o handler enxuto monta a cadeia do Django com PIX_API_MIDDLEWARE, sem alterar MIDDLEWARE"""
+        from django.conf import settings
+
+        middleware = list(settings.MIDDLEWARE)
+        code, headers, _ = self._wsgi("GET", "/api/pix/12345678/stream/start?batch=abc", "multipart/json")
+
+        self.assertEqual(code, 400)
+        self.assertEqual(headers["X-Frame-Options"], "DENY")
+        self.assertNotIn("X-DB-Queries", headers)
+        self.assertEqual(settings.MIDDLEWARE, middleware)
+
+    def test_api_urlconf_only_has_api_routes(self):
+        """Teste: a URLconf do perfil enxuto não resolve rotas fora de /api/pix/"""
+        code, _, _ = self._wsgi("GET", "/api/pix/12345678/stream/start?batch=abc", "multipart/json")
+        self.assertEqual(code, 400)
+
+        from django.urls import Resolver404, resolve
+
+        self.assertEqual(resolve("/api/pix/messages", urlconf="streaming.api_urls").url_name, "pix_message_ingest")
+        with self.assertRaises(Resolver404):
+            resolve("/metrics", urlconf="streaming.api_urls")
+
+    def test_cached_negotiation_matches_drf(self):
+        """Teste: a escolha memorizada é a mesma do DRF, inclusive para 406"""
+        from rest_framework.exceptions import NotAcceptable
+        from rest_framework.negotiation import DefaultContentNegotiation
+        from rest_framework.request import Request
+        from rest_framework.test import APIRequestFactory
+        from . import negotiation
+        from .views import PixStreamBaseView
+
+        factory = APIRequestFactory()
+        accepts = [
+            "application/json", "multipart/json", "multipart/json; batch=50", "*/*", "application/x-ndjson",
+            "multipart/mixed", "text/html, application/json;q=0.5",
+        ]
+        for accept in accepts:
+            for path in ("/", "/?format=json"):
+                request = factory.get(path, HTTP_ACCEPT=accept)
+                try:
+                    expected = DefaultContentNegotiation().select_renderer(
+                        Request(request), PixStreamBaseView().get_renderers()
+                    )
+                except NotAcceptable:
+                    continue
+                for _ in range(2):
+                    renderers = PixStreamBaseView().get_renderers()
+                    renderer, media_type = negotiation.CachedContentNegotiation().select_renderer(request, renderers)
+                    self.assertIs(type(renderer), type(expected[0]))
+                    self.assertEqual(media_type, expected[1])
+                    self.assertIn(renderer, renderers)
+
+        request = factory.get("/", HTTP_ACCEPT="text/html")
+        for _ in range(2):
+            with self.assertRaises(NotAcceptable):
+                negotiation.CachedContentNegotiation().select_renderer(request, PixStreamBaseView().get_renderers())
+        self.assertNotIn(("text/html", None), {key[:2] for key in negotiation._choices})
+
+    def test_lean_asgi_handler(self):
+        """Teste: o despachante ASGI também serve /api/pix/ pelo perfil enxuto"""
+        from asgiref.sync import async_to_sync
+        from asgiref.testing import ApplicationCommunicator
+        from django.core.handlers.asgi import ASGIHandler
+        from .handlers import asgi_application
+
+        async def request():
+            scope = {
+                "type": "http", "method": "GET", "path": "/api/pix/12345678/stream/start", "query_string": b"batch=abc",
+                "headers": [(b"host", b"localhost"), (b"accept", b"multipart/json")],
+            }
+            communicator = ApplicationCommunicator(asgi_application(ASGIHandler()), scope)
+            await communicator.send_input({"type": "http.request", "body": b""})
+            start = await communicator.receive_output(5)
+            await communicator.receive_output(5)
+            return start
+
+        start = async_to_sync(request)()
+        self.assertEqual(start["status"], 400)
+        self.assertNotIn(b"x-frame-options", dict(start["headers"]))
+
+
+class PixDeploymentTests(APITestCase):
+    """Testes dos health checks e das settings de produção"""
+
+    def test_health_checks(self):
+        """Teste: liveness e readiness respondem 200 com o banco disponível"""
+        self.assertEqual(self.client.get("/health/live").status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get("/health/ready").status_code, status.HTTP_200_OK)
+
+    def test_readiness_fails_without_database(self):
+        """Teste: readiness responde 503 quando o banco não responde"""
+        from django.db import OperationalError
+
+        with patch("streaming.views.connection.cursor", side_effect=OperationalError("down")), \
+                self.assertLogs("streaming.views", "ERROR"):
+            response = self.client.get("/health/ready")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_production_settings(self):
+        """Teste: produção exige a chave secreta, desliga o DEBUG e persiste conexões"""
+        import importlib
+        import os
+        import sys
+        from django.core.exceptions import ImproperlyConfigured
+
+        sys.modules.pop("pixstream.settings_production", None)
+        with patch.dict(os.environ, {"DJANGO_SECRET_KEY": ""}):
+            with self.assertRaises(ImproperlyConfigured):
+                importlib.import_module("pixstream.settings_production")
+
+        sys.modules.pop("pixstream.settings_production", None)
+        with patch.dict(os.environ, {"DJANGO_SECRET_KEY": "segredo", "DJANGO_ALLOWED_HOSTS": "pix.example.com"}):
+            production = importlib.import_module("pixstream.settings_production")
+        sys.modules.pop("pixstream.settings_production", None)
+        self.assertFalse(production.DEBUG)
+        self.assertFalse(production.PIX_DB_DEBUG_HEADERS)
+        self.assertEqual(production.ALLOWED_HOSTS, ["pix.example.com"])
+        self.assertEqual(production.DATABASES["default"]["CONN_MAX_AGE"], 600)
+
+
+@override_settings(ALLOWED_HOSTS=["localhost"])
+class PixLoadHarnessTests(TransactionTestCase):
+    """Testes do benchmark de carga (bench_streams e loadclient)"""
+
+    def test_bench_streams_reports_both_accept_types(self):
+        """Teste: os coletores entregam todas as mensagens uma vez e o relatório sai em JSON"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        require_concurrent_writes(self)
+
+        out = StringIO()
+        call_command(
+            "bench_streams", "--messages", "60", "--ispbs", "2", "--collectors", "3",
+            "--long-poll-timeout", "0.05", stdout=out,
+        )
+
+        result = json.loads(out.getvalue())
+        self.assertEqual([run["accept"] for run in result["runs"]], ["application/json", "multipart/json"])
+        for run in result["runs"]:
+            self.assertEqual(run["errors"], [])
+            self.assertEqual((run["messages_delivered"], run["duplicates"], run["messages_missing"]), (60, 0, 0))
+            self.assertGreater(run["queries_per_pull"], 0)
+            self.assertLessEqual(run["pull_latency_ms"]["p50"], run["pull_latency_ms"]["p99"])
+        self.assertFalse(PixMessage.objects.exists())
+
+    def test_compare_flags_regressions(self):
+        """Teste: comparação com a linha de base aponta queda de vazão, p99 e duplicatas"""
+        from .management.commands.bench_streams import compare
+
+        def result(rate, p99, duplicates=0):
+            run = {"accept": "multipart/json", "messages_per_second": rate,
+                   "pull_latency_ms": {"p50": 1, "p99": p99}, "duplicates": duplicates}
+            return {"runs": [run]}
+
+        self.assertEqual(compare(result(1000, 10), result(900, 11), tolerance=0.2), [])
+        self.assertEqual(len(compare(result(1000, 10), result(700, 20, duplicates=1), tolerance=0.2)), 3)
+
+
+@override_settings(PIX_STREAM_NOTIFIER="streaming.notify.LocalNotifier", PIX_STREAM_LONG_POLL_TIMEOUT=5)
+class PixLongPollTests(TransactionTestCase):
+    """Testes do long polling orientado a eventos"""
+
+    def test_waiting_poller_wakes_on_insert(self):
+        """Teste: um poller parado acorda assim que chegam mensagens para o seu ISPB"""
+        from rest_framework.test import APIClient
+
+        require_concurrent_writes(self)
+
+        ispb = "12345678"
+        result = {}
+
+        def poller():
+            try:
+                started = time.monotonic()
+                response = APIClient().get(f"/api/pix/{ispb}/stream/start", HTTP_ACCEPT="application/json")
+                result["status"] = response.status_code
+                result["elapsed"] = time.monotonic() - started
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=poller)
+        thread.start()
+        time.sleep(0.3)
+        self.client.post(f"/api/util/msgs/{ispb}/1")
+        thread.join()
+
+        self.assertEqual(result["status"], status.HTTP_200_OK)
+        self.assertLess(result["elapsed"], 2)  # Muito antes do timeout de 5 s
+
+    def test_local_notifier_only_wakes_matching_ispb(self):
+        """Teste: o aviso de um ISPB não acorda pollers de outro"""
+        from .notify import LocalNotifier
+
+        notifier = LocalNotifier()
+        with notifier.subscribe("11111111") as waiting, notifier.subscribe("22222222") as other:
+            notifier.notify("11111111")
+            self.assertTrue(waiting.wait(1))
+            self.assertFalse(other.wait(0.01))
+
+
+@override_settings(
+    ROOT_URLCONF="streaming.async_urls",
+    PIX_STREAM_NOTIFIER="streaming.notify.LocalNotifier",
+    PIX_STREAM_LONG_POLL_TIMEOUT=0.05,
+)
+class PixStreamAsyncAPITests(PixMessagesMixin, TransactionTestCase):
+    """Testes de integração para os endpoints assíncronos (ASGI)"""
+
+    ispb = "12345678"
+
+    async def test_start_continue_delete_flow(self):
+        """Teste: fluxo start → continue → delete nas views assíncronas"""
+        from asgiref.sync import sync_to_async
+
+        created = await sync_to_async(self._create_pix_messages)(count=3)
+
+        start = await self.async_client.get(f"/api/pix/{self.ispb}/stream/start", headers={"Accept": "application/json"})
+        self.assertEqual(start.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(start.content)["endToEndId"], created[0].end_to_end_id)
+
+        pull_next = start.headers["Pull-Next"]
+        batch = await self.async_client.get(pull_next, headers={"Accept": "multipart/json"})
+        self.assertEqual(batch.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [msg["endToEndId"] for msg in json.loads(batch.content)],
+            [msg.end_to_end_id for msg in created[1:]],
+        )
+
+        delete = await self.async_client.delete(batch.headers["Pull-Next"])
+        self.assertEqual(delete.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(delete.content), {})
+        self.assertFalse(await StreamSession.objects.filter(active=True).aexists())
+
+    @override_settings(PIX_DB_DEBUG_HEADERS=True, PIX_DB_QUERY_BUDGET_ENFORCE=True)
+    async def test_queries_counted_in_db_threads(self):
+        """Teste: comandos SQL executados no pool de threads contam para a requisição"""
+        from asgiref.sync import sync_to_async
+
+        await sync_to_async(self._create_pix_messages)(count=1)
+        await IspbStreamCounter.objects.acreate(ispb=self.ispb)  # Fora do orçamento: só na primeira sessão do ISPB
+
+        start = await self.async_client.get(f"/api/pix/{self.ispb}/stream/start", headers={"Accept": "application/json"})
+        self.assertEqual(start.status_code, status.HTTP_200_OK)
+        self.assertGreater(int(start.headers["X-DB-Queries"]), 0)
+
+    async def test_negotiated_batch_size(self):
+        """Teste: as views assíncronas respeitam ?batch= e o parâmetro do Accept"""
+        from asgiref.sync import sync_to_async
+
+        await sync_to_async(self._create_pix_messages)(count=12)
+
+        start = await self.async_client.get(
+            f"/api/pix/{self.ispb}/stream/start", headers={"Accept": "multipart/json; batch=4"}
+        )
+        follow = await self.async_client.get(
+            f"{start.headers['Pull-Next']}?batch=8", headers={"Accept": "multipart/json"}
+        )
+        invalid = await self.async_client.get(
+            f"/api/pix/{self.ispb}/stream/start?batch=zero", headers={"Accept": "multipart/json"}
+        )
+
+        self.assertEqual(len(json.loads(start.content)), 4)
+        self.assertEqual(len(json.loads(follow.content)), 8)
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PIX_STREAM_WINDOW=0.2)
+    async def test_ndjson_window(self):
+        """Teste: a view assíncrona entrega a janela NDJSON por um gerador assíncrono"""
+        from asgiref.sync import sync_to_async
+
+        created = await sync_to_async(self._create_pix_messages)(count=15)
+
+        response = await self.async_client.get(
+            f"/api/pix/{self.ispb}/stream/start", headers={"Accept": "application/x-ndjson"}
+        )
+        body = b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(
+            [json.loads(line)["endToEndId"] for line in body.splitlines()],
+            [msg.end_to_end_id for msg in created],
+        )
+
+    async def test_start_without_messages_returns_204(self):
+        """Teste: start assíncrono sem mensagens responde 204 com Pull-Next válido"""
+        response = await self.async_client.get(f"/api/pix/{self.ispb}/stream/start", headers={"Accept": "application/json"})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        follow = await self.async_client.get(response.headers["Pull-Next"], headers={"Accept": "application/json"})
+        self.assertEqual(follow.status_code, status.HTTP_204_NO_CONTENT)
+
+    async def test_session_limit_and_unknown_cursor(self):
+        """Teste: limite de 6 sessões (429) e interactionId desconhecido (404)"""
+        for _ in range(6):
+            await StreamSession.objects.acreate(ispb=self.ispb, active=True)
+
+        limited = await self.async_client.get(f"/api/pix/{self.ispb}/stream/start", headers={"Accept": "application/json"})
+        unknown = await self.async_client.get(f"/api/pix/{self.ispb}/stream/naoexiste123", headers={"Accept": "application/json"})
+
+        self.assertEqual(limited.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(unknown.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(PIX_STREAM_LONG_POLL_TIMEOUT=5)
+    async def test_parked_poll_wakes_on_insert(self):
+        """Teste: um long polling assíncrono acorda assim que chega mensagem para o ISPB"""
+        import asyncio
+        from asgiref.sync import sync_to_async
+
+        def insert_and_notify():
+            from .notify import get_notifier
+            self._create_pix_messages(count=1)
+            get_notifier().notify(self.ispb)
+
+        async def insert_later():
+            await asyncio.sleep(0.2)
+            await sync_to_async(insert_and_notify)()
+
+        started = time.monotonic()
+        response, _ = await asyncio.gather(
+            self.async_client.get(f"/api/pix/{self.ispb}/stream/start", headers={"Accept": "application/json"}),
+            insert_later(),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(time.monotonic() - started, 2)
+
+
+@override_settings(PIX_GENERATE_SYNC_LIMIT=10, PIX_GENERATE_CHUNK_SIZE=7)
+class GenerationJobTests(TransactionTestCase):
+    """Testes da geração de mensagens em background"""
+
+    def test_large_generation_runs_as_background_job(self):
+        """Teste: quantidades acima do limite viram job com progresso consultável"""
+        response = self.client.post("/api/util/msgs/12345678/25?seed=9")
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_url = response.headers["Location"]
+        self.assertEqual(job_url, response.json()["status"])
+
+        deadline = time.monotonic() + 10
+        while True:
+            job = self.client.get(job_url).json()
+            if job["status"] in ("done", "failed") or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["created"], 25)
+        self.assertEqual(job["seed"], 9)
+        self.assertEqual(PixMessage.objects.filter(recebedor_ispb="12345678").count(), 25)
+
+    def test_unknown_job_returns_404(self):
+        """Teste: job inexistente deve retornar 404"""
+        response = self.client.get("/api/util/jobs/00000000-0000-0000-0000-000000000000")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StreamEncoderTests(APITestCase):
+    """Testes de compatibilidade do codificador rápido com o PixMessageSerializer"""
+
+    def _create_varied_messages(self):
+        from datetime import datetime, timezone as dt_timezone
+
+        rows = [
+            ("José Ação Ünicode", Decimal("90.20"), datetime(2022, 7, 23, 19, 47, 18, 108000, tzinfo=dt_timezone.utc), ""),
+            ("Plain", Decimal("1"), datetime(2024, 1, 1, 0, 0, 0, tzinfo=dt_timezone.utc), "livre \u2028 \u2029 \"aspas\""),
+            ("Emoji 🚀", Decimal("99999999.99"), datetime(2023, 12, 31, 23, 59, 59, 999999, tzinfo=dt_timezone.utc), "tab\tnl\n"),
+        ]
+        for i, (nome, valor, data, campo_livre) in enumerate(rows):
+            PixMessage.objects.create(
+                end_to_end_id=f"E1234567820240000000{i}",
+                valor=valor,
+                pagador_nome=nome,
+                pagador_cpf_cnpj="11122233344",
+                pagador_ispb="00000000",
+                pagador_agencia="0001",
+                pagador_conta="1234567",
+                pagador_tipo_conta="CACC",
+                recebedor_nome=f"Recebedor {nome}",
+                recebedor_cpf_cnpj="55566677788",
+                recebedor_ispb="12345678",
+                recebedor_agencia="0002",
+                recebedor_conta="7654321",
+                recebedor_tipo_conta="SVGS",
+                campo_livre=campo_livre,
+                tx_id=f"TX{i}",
+                data_pagamento=data,
+            )
+
+    def test_encoder_matches_serializer_bytes(self):
+        """Teste: o codificador gera os mesmos bytes do serializer nos dois formatos"""
+        from rest_framework.renderers import JSONRenderer
+        from .claims import claim_messages
+        from .encoders import encode_batch, encode_single
+        from .serializers import PixMessageSerializer
+
+        self._create_varied_messages()
+        instances = list(PixMessage.objects.order_by("id"))
+        expected = PixMessageSerializer(instances, many=True).data
+
+        session = StreamSession.objects.create(ispb="12345678")
+        claimed = claim_messages("12345678", session, 10)
+
+        self.assertEqual(encode_batch(claimed), json.dumps(expected).encode("utf-8"))
+        for message, data in zip(claimed, expected):
+            self.assertEqual(encode_single(message), JSONRenderer().render(data))
+
+    @override_settings(PIX_STREAM_COMPACT_BATCH_JSON=True)
+    def test_compact_batch_joins_stored_payloads(self):
+        """Teste: com PIX_STREAM_COMPACT_BATCH_JSON o lote junta os payloads gravados (mesmo JSON)"""
+        from .claims import claim_messages
+        from .encoders import encode_batch, encode_single
+        from .serializers import PixMessageSerializer
+
+        self._create_varied_messages()
+        expected = PixMessageSerializer(list(PixMessage.objects.order_by("id")), many=True).data
+
+        session = StreamSession.objects.create(ispb="12345678")
+        claimed = claim_messages("12345678", session, 10)
+
+        singles = [encode_single(message) for message in claimed]
+        self.assertEqual(encode_batch(claimed), b"[" + b",".join(singles) + b"]")
+        self.assertEqual(json.loads(encode_batch(claimed)), json.loads(json.dumps(expected)))
+
+    def test_legacy_rows_without_payload(self):
+        """Teste: linhas sem payload são codificadas no claim e preenchidas pelo backfill"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .claims import claim_messages
+        from .encoders import encode_single
+
+        self._create_varied_messages()
+        stored = dict(PixMessage.objects.values_list("id", "payload"))
+        PixMessage.objects.filter(pk=min(stored)).update(payload=None)
+
+        session = StreamSession.objects.create(ispb="12345678")
+        claimed = claim_messages("12345678", session, 10)
+        self.assertEqual({message.id: encode_single(message) for message in claimed}, {
+            pk: bytes(payload) for pk, payload in stored.items()
+        })
+
+        PixMessage.objects.update(payload=None)
+        out = StringIO()
+        call_command("backfill_payloads", "--batch-size", "2", stdout=out)
+        self.assertEqual(json.loads(out.getvalue())["written"], 3)
+        self.assertEqual(
+            {pk: bytes(payload) for pk, payload in PixMessage.objects.values_list("id", "payload")},
+            {pk: bytes(payload) for pk, payload in stored.items()},
+        )
+
+    def test_insert_paths_store_payload(self):
+        """Teste: gerador e ingestão gravam o mesmo payload que o ORM geraria"""
+        from .encoders import instance_payload
+
+        generate_messages("12345678", 2, seed=4)
+        wire = [message_to_dict(message_from_instance(m)) for m in PixMessageFactory(seed=8).build("12345678", 2)]
+        self.client.generic("POST", "/api/pix/messages", json.dumps(wire), content_type="application/json")
+
+        messages = list(PixMessage.objects.order_by("id"))
+        self.assertEqual(len(messages), 4)
+        for message in messages:
+            self.assertEqual(bytes(message.payload), instance_payload(message))
+
+    def test_encoder_without_orjson_matches_serializer(self):
+        """Teste: o caminho sem orjson (stdlib json) gera os mesmos bytes"""
+        from rest_framework.renderers import JSONRenderer
+        from . import encoders
+        from .serializers import PixMessageSerializer
+
+        self._create_varied_messages()
+        for instance in PixMessage.objects.order_by("id"):
+            with patch.object(encoders, "orjson", None):
+                encoded = encoders.render_payload(encoders.message_from_instance(instance))
+            self.assertEqual(encoded, JSONRenderer().render(PixMessageSerializer(instance).data))
@@ -1,9 +1,18 @@
+from django.conf import settings
 from django.urls import path
-from .views import GeneratePixMessagesView, PixStreamStartView, PixStreamContinueDeleteView
-from django.urls import path
+from .views import GeneratePixMessagesView, GenerationJobView, PixMessageIngestView, health_live, health_ready, metrics_view, PixStreamStartView, PixStreamContinueDeleteView
 
 urlpatterns = [
     path('api/util/msgs/<str:ispb>/<str:number>', GeneratePixMessagesView.as_view(), name='generate_pix_messages'),
+    path('api/util/jobs/<uuid:job_id>', GenerationJobView.as_view(), name='generation_job'),
+    path('metrics', metrics_view, name='metrics'),
+    path('health/live', health_live, name='health_live'),
+    path('health/ready', health_ready, name='health_ready'),
+    path('api/pix/messages', PixMessageIngestView.as_view(), name='pix_message_ingest'),
     path('api/pix/<str:ispb>/stream/start', PixStreamStartView.as_view(), name='pix_stream_start'),
     path('api/pix/<str:ispb>/stream/<str:interaction_id>', PixStreamContinueDeleteView.as_view(), name='pix_stream_continue_delete'),
 ]
+
+# Sob ASGI os endpoints de stream são servidos pelas views assíncronas
+if settings.PIX_STREAM_ASYNC_VIEWS:
+    from .async_urls import urlpatterns
@@ -12,15 +12,26 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.utils.crypto import get_random_string
 from django.utils.timezone import now
-from .models import PixMessage, StreamSession
-from .serializers import PixMessageSerializer
-from django.db import transaction
+from .models import GenerationJob, PixMessage, StreamSession
+from .generators import generate_messages, start_generation_job
+from django.db import DatabaseError, connection, transaction
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse
+from django.views.decorators.http import require_GET
 import json
 import time
-from rest_framework.renderers import JSONRenderer
-from .renderers import MultipartJsonRenderer
+from .renderers import STREAM_RENDERER_CLASSES, BinaryRenderer, StreamingRenderer
+from django.conf import settings
+from .notify import get_notifier
+from .compression import compress_response
+from .batching import InvalidBatchSize
+from .negotiation import CachedContentNegotiation
+from .cursors import StaleCursor, close_cursor, open_cursor, resolve_cursor, rotate_cursor
+from .reaper import ensure_reaper_started
+from .scheduler import InvalidWeight, parse_weight
+from .pulls import LongPoll, negotiated_batch, stream_response
+from .streams import iter_stream
+from . import ingestion, metrics, pulls
 
 def random_string(length=10):
     return "".join(random.choices(string.ascii_letters + string.digits, k=length))
@@ -39,112 +50,196 @@ class GeneratePixMessagesView(APIView):
         except ValueError:
             return Response({"error": "Invalid number parameter"}, status=status.HTTP_400_BAD_REQUEST)
 
-        for _ in range(number):
-            PixMessage.objects.create(
-                end_to_end_id=random_string(24),
-                valor=round(random.uniform(1, 1000), 2),
-                pagador_nome="Pagador " + random_string(5),
-                pagador_cpf_cnpj=random_cpf_cnpj(),
-                pagador_ispb=random_string(8),
-                pagador_agencia=str(random.randint(1, 9999)).zfill(4),
-                pagador_conta=random_string(7),
-                pagador_tipo_conta=random.choice(["CACC", "SVGS"]),
-                recebedor_nome="Recebedor " + random_string(5),
-                recebedor_cpf_cnpj=random_cpf_cnpj(),
-                recebedor_ispb=ispb,
-                recebedor_agencia=str(random.randint(1, 9999)).zfill(4),
-                recebedor_conta=random_string(7),
-                recebedor_tipo_conta=random.choice(["CACC", "SVGS"]),
-                campo_livre="",
-                tx_id=random_string(16),
-                data_pagamento=timezone.now()
+        seed = request.query_params.get("seed")
+        if seed is not None:
+            try:
+                seed = int(seed)
+            except ValueError:
+                return Response({"error": "Invalid seed parameter"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Quantidades grandes viram um job em background com progresso consultável
+        if number > settings.PIX_GENERATE_SYNC_LIMIT:
+            job = start_generation_job(ispb, number, seed=seed)
+            job_url = f"/api/util/jobs/{job.id}"
+            return Response(
+                {"jobId": str(job.id), "status": job_url},
+                status=status.HTTP_202_ACCEPTED,
+                headers={"Location": job_url},
             )
 
+        generate_messages(ispb, number, seed=seed)
+
         return Response({"message": f"{number} Pix messages created for ISPB {ispb}"}, status=status.HTTP_201_CREATED)
 
 
-class PixStreamBaseView(APIView):
-    renderer_classes = [MultipartJsonRenderer, JSONRenderer]
+class GenerationJobView(APIView):
+    """Progresso de uma geração de mensagens em background"""
+
+    def get(self, request, job_id):
+        job = get_object_or_404(GenerationJob, pk=job_id)
+        return Response({
+            "jobId": str(job.id),
+            "ispb": job.ispb,
+            "status": job.status,
+            "requested": job.requested,
+            "created": job.created,
+            "seed": job.seed,
+            "error": job.error,
+            "createdAt": job.created_at,
+            "finishedAt": job.finished_at,
+        })
+
+
+@require_GET
+def metrics_view(request):
+    """Métricas no formato de texto do Prometheus"""
+    return HttpResponse(metrics.render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@require_GET
+def health_live(request):
+    """Liveness: o processo responde (não consulta o banco)"""
+    return HttpResponse("ok", content_type="text/plain")
+
+
+@require_GET
+def health_ready(request):
+    """Readiness: o banco responde a um SELECT 1 (503 se não)"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except DatabaseError:
+        logger.exception("Health check: banco indisponível")
+        return HttpResponse("database unavailable", content_type="text/plain", status=503)
+    return HttpResponse("ok", content_type="text/plain")
+
+
+class PixApiView(APIView):
+    """
+    Base das views de /api/pix/ (API de máquina por ISPB)
+
+    Sem autenticação, permissões e throttling do DRF, que essas rotas não
+    usam, e com a escolha do renderer memorizada por Accept.
+    """
+    authentication_classes = ()
+    permission_classes = ()
+    throttle_classes = ()
+    content_negotiation_class = CachedContentNegotiation
+
+
+class PixMessageIngestView(PixApiView):
+    """Ingestão em massa de mensagens Pix (array JSON ou NDJSON)"""
+
+    def post(self, request):
+        media_type = request.content_type.split(";")[0].strip().lower()
+        if media_type not in ingestion.MEDIA_TYPES:
+            return Response({"detail": "Use application/json ou application/x-ndjson."}, status=415)
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > settings.PIX_INGEST_MAX_BYTES:
+            return Response({"detail": "Corpo da requisição muito grande."}, status=413)
+
+        # O corpo é lido direto da requisição do Django (sem request.data): o
+        # NDJSON é processado linha a linha. O request.stream do DRF é None
+        # sem Content-Length (corpo chunked sob ASGI), então o limite é
+        # conferido também durante a leitura; a transação da ingestão é
+        # desfeita se ele for ultrapassado
+        try:
+            items = ingestion.decode_items(request._request, media_type, settings.PIX_INGEST_MAX_BYTES)
+            summary = ingestion.ingest_messages(items)
+        except ingestion.InvalidPayload:
+            return Response({"detail": "Esperado um array JSON de mensagens."}, status=400)
+        except ingestion.PayloadTooLarge:
+            return Response({"detail": "Corpo da requisição muito grande."}, status=413)
+        return HttpResponse(ingestion.dumps(summary), content_type="application/json", status=200)
+
+
+class PixStreamBaseView(PixApiView):
+    renderer_classes = STREAM_RENDERER_CLASSES
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Erros em modo contínuo ou binário são documentos JSON comuns
+        if isinstance(response, Response) and isinstance(
+            response.accepted_renderer, (StreamingRenderer, BinaryRenderer)
+        ):
+            response.content_type = "application/json"
+        return response
+
+    def _requested_batch(self, request):
+        """Lote negociado para os formatos multipart e modos contínuos (levanta InvalidBatchSize)"""
+        return negotiated_batch(request.accepted_renderer, request.query_params, request.accepted_media_type)
 
-    def _get_messages_and_respond(self, request, ispb, interaction_id, check_session_limit=True):
+    def _invalid_batch_response(self):
+        return Response({"detail": pulls.INVALID_BATCH}, status=400)
+
+    def _get_messages_and_respond(self, request, ispb, session, batch=None, acknowledge=False):
         """
         Lógica comum para buscar mensagens e responder
         
         Args:
             request: Requisição HTTP
             ispb: ISPB da instituição
-            interaction_id: ID de interação para o Pull-Next
-            check_session_limit: Se deve verificar limite de sessões (True para start, False para continue)
+            session: StreamSession dona do cursor do Pull-Next
+            batch: Lote negociado (inteiro, ADAPTIVE ou None para o padrão)
+            acknowledge: Confirmar o lote entregue com o interactionId seguido
         """
-        is_multipart_requested = isinstance(request.accepted_renderer, MultipartJsonRenderer)
-        message_limit = 10 if is_multipart_requested else 1
+        if isinstance(request.accepted_renderer, StreamingRenderer):
+            return self._stream_and_respond(request, ispb, session, batch, acknowledge)
 
-        # Verificar limite de sessões apenas para stream/start
-        if check_session_limit:
-            if StreamSession.objects.filter(ispb=ispb, active=True).count() >= 6:
-                return Response({"detail": "Limite de streams ativos atingido."}, status=429)
+        # Long polling orientado a eventos: o interesse no ISPB é registrado
+        # antes do claim, então um insert entre o claim vazio e a espera
+        # acorda o poller imediatamente
+        poll = LongPoll(request.accepted_renderer, ispb, session, batch, acknowledge)
+        try:
+            with get_notifier().subscribe(ispb) as subscription:
+                timeout = poll.pull()
+                while timeout is not None:
+                    if not subscription.wait(timeout) and poll.expired():
+                        break
+                    timeout = poll.pull()
+            poll.finish()
+        except StaleCursor:
+            return Response({"detail": pulls.STALE_CURSOR}, status=409)
 
-            # Criar uma nova sessão apenas para stream/start
-            session = StreamSession.objects.create(ispb=ispb)
-        else:
-            session = None
-
-        # Buscar mensagens disponíveis para esse ISPB
-        messages = PixMessage.objects.filter(
-            recebedor_ispb=ispb,
-            claimed_by_stream__isnull=True
-        )[:message_limit]
-
-        if not messages:
-            # Long polling: aguardar por novos dados
-            # Se a sessão foi criada nesta requisição e não há mensagens, removê-la
-            if session:
-                session.delete()
-            
-            time.sleep(8)
-            response = HttpResponse(status=204)
-            response["Pull-Next"] = f"/api/pix/{ispb}/stream/{interaction_id}"
-            response["Content-Length"] = "0"
-            return response
-
-        # Se há mensagens e temos uma sessão, associar as mensagens à sessão
-        if session:
-            with transaction.atomic():
-                for msg in messages:
-                    msg.claimed_by_stream = session
-                    msg.save()
-
-        # Serializando mensagens
-        serialized = PixMessageSerializer(messages, many=True)
-
-        # Gerar novo interaction_id para o próximo Pull-Next
-        new_interaction_id = get_random_string(12)
-        response_headers = {
-            "Pull-Next": f"/api/pix/{ispb}/stream/{new_interaction_id}"
-        }
-
-        # Se multipart/json foi solicitado, retorna o array diretamente
-        if is_multipart_requested:
-            response_content = json.dumps(serialized.data)
-            response = HttpResponse(response_content, content_type="application/json", status=200)
-            for header, value in response_headers.items():
-                response[header] = value
-            return response
-        else:
-            # Para application/json ou default, usa Response do DRF
-            return Response(
-                data=serialized.data[0] if serialized.data else {},
-                status=200,
-                headers=response_headers
-            )
+        # Pull-Next aponta para o cursor atual (rotacionado se houve entrega)
+        return poll.response()
+
+    def _stream_and_respond(self, request, ispb, session, batch, acknowledge=False):
+        """Resposta contínua (NDJSON/multipart) com os lotes enviados conforme são reivindicados"""
+        renderer = request.accepted_renderer
+        # O Pull-Next sai nos cabeçalhos: rotacionar o cursor antes do corpo
+        try:
+            rotate_cursor(session, acknowledge)
+        except StaleCursor:
+            return Response({"detail": pulls.STALE_CURSOR}, status=409)
+
+        return stream_response(renderer, ispb, session, iter_stream(renderer, ispb, session, batch))
 
 
 class PixStreamStartView(PixStreamBaseView):
     """Endpoint para iniciar um stream de mensagens Pix"""
 
     def get(self, request, ispb):
-        interaction_id = get_random_string(12)
-        return self._get_messages_and_respond(request, ispb, interaction_id, check_session_limit=True)
+        try:
+            batch = self._requested_batch(request)
+        except InvalidBatchSize:
+            return self._invalid_batch_response()
+        try:
+            weight = parse_weight(request.query_params.get("weight"))
+        except InvalidWeight:
+            return Response({"detail": pulls.INVALID_WEIGHT}, status=400)
+
+        ensure_reaper_started()
+
+        # A vaga no limite de sessões do ISPB é reservada atomicamente
+        session = open_cursor(ispb, weight)
+        if session is None:
+            return Response({"detail": pulls.TOO_MANY_STREAMS}, status=429)
+
+        return compress_response(request, self._get_messages_and_respond(request, ispb, session, batch))
 
 
 class PixStreamContinueDeleteView(PixStreamBaseView):
@@ -152,25 +247,30 @@ class PixStreamContinueDeleteView(PixStreamBaseView):
 
     def get(self, request, ispb, interaction_id):
         """Continuar um stream de mensagens Pix existente"""
-        # Para continuação, não verificamos limite de sessões nem criamos nova sessão
-        return self._get_messages_and_respond(request, ispb, interaction_id, check_session_limit=False)
+        try:
+            batch = self._requested_batch(request)
+        except InvalidBatchSize:
+            return self._invalid_batch_response()
+
+        # Para continuação, não verificamos limite de sessões: o interactionId
+        # identifica a sessão e o cursor já estabelecidos
+        session = resolve_cursor(ispb, interaction_id)
+        if session is None:
+            return Response({"detail": pulls.STREAM_NOT_FOUND}, status=404)
+
+        # Seguir o Pull-Next confirma o lote entregue com este interactionId
+        return compress_response(
+            request, self._get_messages_and_respond(request, ispb, session, batch, acknowledge=True)
+        )
 
     def delete(self, request, ispb, interaction_id):
         """Finalizar um stream de mensagens Pix"""
-        # Buscar sessões ativas para este ISPB
-        active_sessions = StreamSession.objects.filter(ispb=ispb, active=True)
-        
-        if active_sessions.exists():
-            # Marcar a primeira sessão ativa como inativa
-            session_to_deactivate = active_sessions.first()
-            session_to_deactivate.active = False
-            session_to_deactivate.save()
-            
+        # Encerrar exatamente a sessão dona deste interactionId
+        if close_cursor(ispb, interaction_id):
             logger.info(f"Stream finalizado para ISPB {ispb}, interaction_id {interaction_id}")
         else:
-            # Mesmo se não houver sessões ativas, retornamos 200 (idempotência)
+            # Mesmo se a sessão não existir, retornamos 200 (idempotência)
             logger.info(f"Tentativa de finalizar stream inexistente para ISPB {ispb}, interaction_id {interaction_id}")
 
         # Retornar 200 OK com corpo vazio conforme especificação
         return Response({}, status=200)
-    